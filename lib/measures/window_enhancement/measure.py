@@ -5,19 +5,27 @@
 
 import openstudio
 import typing
-import numpy as np
-import pprint as pp
-from resources.EC3_lookup import fetch_epd_data
-from resources.EC3_lookup import parse_product_epd
-from resources.EC3_lookup import parse_industrial_epd
-from resources.EC3_lookup import generate_url
-from resources.EC3_lookup import calculate_geometry
+import hashlib
+import itertools
+import json
+import os
+import time
+# numpy, requests and the EC3 modules are imported where run() needs them,
+# listing the arguments stays fast and works without any of them or a config file
+from resources.diagnostics import Diagnostics, VERBOSITY_LEVELS
+from resources.window_records import WindowRecord
+from resources.profiling import Profiler, PROFILING_MODES
 
 # Start the measure
 class WindowEnhancement(openstudio.measure.ModelMeasure):
 
     """A ModelMeasure for window enhancement, calculating embodied carbon."""
 
+    # GWP summaries of the queries resolved in this process, see lookup_gwp_values(), created on first use
+    gwp_summaries = None
+    # queries whose summaries are held at once, the least recently used are dropped
+    GWP_SUMMARY_ENTRIES = 256
+
     def name(self):
         """Measure name."""
         return "Window Enhancement"
@@ -117,7 +125,7 @@ class WindowEnhancement(openstudio.measure.ModelMeasure):
         # make an argument for total embodied carbon (TEC) of whole construction/building
         total_embodied_carbon = openstudio.measure.OSArgument.makeDoubleArgument("total_embodied_carbon", True)
         total_embodied_carbon.setDisplayName("Total Embodied Carbon of Building/Building Assembly")
-        total_embodied_carbon.setDescription("Total GWP or embodied carbon intensity of the building (assembly) in kg CO2 eq.")
+        total_embodied_carbon.setDescription("Total GWP or embodied carbon intensity of the building (assembly) in kg CO2 eq, used to report the share of the windows. Leave at 0 to skip.")
         total_embodied_carbon.setDefaultValue(0.0)
         args.append(total_embodied_carbon)
 
@@ -128,12 +136,470 @@ class WindowEnhancement(openstudio.measure.ModelMeasure):
         api_key.setDefaultValue("Obtain the key from EC3 website")
         args.append(api_key)
 
+        # make an argument for the number of EC3 queries sent at the same time
+        max_concurrent_requests = openstudio.measure.OSArgument.makeIntegerArgument("max_concurrent_requests", True)
+        max_concurrent_requests.setDisplayName("Maximum Concurrent EC3 Requests")
+        max_concurrent_requests.setDescription("Number of EC3 queries sent in parallel, use 1 to send them one after another")
+        max_concurrent_requests.setDefaultValue(4)
+        args.append(max_concurrent_requests)
+
+        # make an argument for answering EC3 lookups from an offline snapshot
+        snapshot_path = openstudio.measure.OSArgument.makeStringArgument("snapshot_path", False)
+        snapshot_path.setDisplayName("EPD Snapshot Path")
+        snapshot_path.setDescription("Optional snapshot file written by resources/EC3_snapshot.py, when set every EPD lookup is answered from it without network access or API token")
+        snapshot_path.setDefaultValue("")
+        args.append(snapshot_path)
+
+        # make an argument for the amount of logging
+        verbosity_chs = openstudio.StringVector()
+        for level in VERBOSITY_LEVELS:
+            verbosity_chs.append(level)
+        verbosity = openstudio.measure.OSArgument.makeChoiceArgument("verbosity", verbosity_chs, True)
+        verbosity.setDisplayName("Verbosity")
+        verbosity.setDescription("quiet: warnings and errors only, summary: aggregated results per construction, debug: also writes per-window details to window_enhancement_diagnostics.jsonl in the run folder")
+        verbosity.setDefaultValue("summary")
+        args.append(verbosity)
+
+        # make an argument for propagating the EPD spread to the embodied carbon
+        uncertainty_samples = openstudio.measure.OSArgument.makeIntegerArgument("uncertainty_samples", True)
+        uncertainty_samples.setDisplayName("Uncertainty Samples")
+        uncertainty_samples.setDescription("Number of Monte Carlo samples drawn from the fetched GWP per m3 values to report P10/P50/P90 window embodied carbon, 0 to skip")
+        uncertainty_samples.setDefaultValue(0)
+        args.append(uncertainty_samples)
+
+        # make an argument for applying the thermal performance of the IGU option to the window constructions
+        upgrade_constructions = openstudio.measure.OSArgument.makeBoolArgument("upgrade_constructions", True)
+        upgrade_constructions.setDisplayName("Upgrade Window Constructions")
+        upgrade_constructions.setDescription("Assign the windows an upgraded copy of their construction with the thermal performance of the IGU option (low_emissivity, electrochromic), one copy per source construction shared by all its windows")
+        upgrade_constructions.setDefaultValue(False)
+        args.append(upgrade_constructions)
+
+        # make an argument for capturing a profile of the run on top of the phase timings
+        profiling_chs = openstudio.StringVector()
+        for mode in PROFILING_MODES:
+            profiling_chs.append(mode)
+        profiling = openstudio.measure.OSArgument.makeChoiceArgument("profiling", profiling_chs, True)
+        profiling.setDisplayName("Profiling")
+        profiling.setDescription("Phase timings and request counters are always written to window_enhancement_profile.json in the run folder, cprofile also records function calls (window_enhancement_profile.prof), tracemalloc the peak Python memory")
+        profiling.setDefaultValue("off")
+        args.append(profiling)
+
         return args
 
+    @staticmethod
+    def epd_endpoints():
+        return {"Product": "materials", "Industry": "industry_epds"}
+
+    def fetch_epds(self, messages, client, material_name, option, num_panes, epd_type):
+        """
+        Fetch the EPDs of one query, the other EPD type is only requested when the selected type comes back empty.
+        Info messages are appended to messages since queries run in worker threads.
+        return: (EPD type actually used, iterator over the EPD dictionaries of every result page)
+        """
+        from resources.EC3_lookup import generate_url
+
+        fallback_type = "Industry" if epd_type == "Product" else "Product"
+        for current_type in [epd_type, fallback_type]:
+            url = generate_url(material_name = material_name, option = option, glass_panes = num_panes,
+                               epd_type = current_type, endpoint = self.epd_endpoints()[current_type])
+            epd_data = client.iter_epd_data(url)
+            # only the first page is requested to know if this EPD type has results, the rest is streamed
+            first_epd = next(epd_data, None)
+            if first_epd is not None:
+                return current_type, itertools.chain([first_epd], epd_data)
+            messages.append(f"{current_type} EPDs are not avialable for {material_name}, trying {fallback_type} EPDs instead")
+        return epd_type, iter([])
+
+    @classmethod
+    def summary_memo(cls):
+        """
+        Bounded in-process cache of the GWP summaries of every query, shared by the runs of this process.
+        """
+        if cls.gwp_summaries is None:
+            from resources.EC3_cache import MemoryCache
+            cls.gwp_summaries = MemoryCache(cls.GWP_SUMMARY_ENTRIES)
+        return cls.gwp_summaries
+
+    @classmethod
+    def clear_gwp_summaries(cls):
+        if cls.gwp_summaries is not None:
+            cls.gwp_summaries.clear()
+
+    def lookup_gwp_summaries(self, client, material_name, option, num_panes, epd_type):
+        """
+        Fetch the EPDs of one query and reduce them in a single streaming pass to the statistics of every functional unit.
+        Safe to call from worker threads, nothing is registered with the runner.
+        return: (dictionary of GWPStatistics keyed by functional unit, list of info messages, earliest EPD validity end timestamp or None)
+        """
+        from resources.EC3_cache import earliest_validity_end
+        from resources.EC3_lookup import IncompleteQueryError, summarize_epds
+
+        messages = []
+        try:
+            fetched_type, epd_data = self.fetch_epds(messages, client, material_name, option, num_panes, epd_type)
+        except IncompleteQueryError as error:
+            # a summary of part of the EPDs would skew the statistic, the query is counted as having no EPDs
+            messages.append(f"EPD lookup of {material_name} failed: {error}")
+            return summarize_epds([], epd_type), messages, None
+        validity_ends = []
+
+        def track_validity(epds):
+            for epd in epds:
+                validity_end = earliest_validity_end([epd])
+                if validity_end is not None:
+                    validity_ends.append(validity_end)
+                yield epd
+
+        # pages after the first are fetched while parsing, their HTTP time is counted in its own phase
+        with client.profiler.phase("parse"):
+            try:
+                statistics_by_unit = summarize_epds(track_validity(epd_data), fetched_type)
+            except IncompleteQueryError as error:
+                messages.append(f"EPD lookup of {material_name} failed: {error}")
+                return summarize_epds([], fetched_type), messages, None
+        return statistics_by_unit, messages, min(validity_ends, default=None)
+
+    def lookup_gwp_values(self, client, material_name, option, num_panes, epd_type, gwp_statistic, source=None, max_age=None):
+        """
+        GWP values of one query for the selected statistic.
+        Summaries are kept per (source, query) in summary_memo(), so runs choosing another gwp_statistic reuse them
+        without fetching or parsing the EPDs again. With max_age (s) they expire like the cached responses they come from,
+        after max_age or once the first of their EPDs reaches its validity end. No caching when source is None.
+        return: (dictionary of GWP value (or None) keyed by functional unit, list of info messages, array of every gwp_per_m3 value)
+        """
+        memo = self.summary_memo()
+        key = (source, epd_type, material_name, option, num_panes)
+        summaries = memo.get(key) if source is not None else None
+        if summaries is None:
+            statistics_by_unit, messages, validity_end = self.lookup_gwp_summaries(client, material_name, option, num_panes, epd_type)
+            summaries = (statistics_by_unit, messages)
+            # an empty result may come from a failed request, it is looked up again next time
+            if source is not None and any(statistics.count for statistics in statistics_by_unit.values()):
+                expires_at = None
+                if max_age is not None:
+                    expires_at = time.time() + max_age
+                    if validity_end is not None:
+                        expires_at = min(expires_at, validity_end)
+                memo.set(key, summaries, expires_at)
+        else:
+            client.profiler.count("summary_reuses")
+        with client.profiler.phase("statistics"):
+            return self.select_gwp_statistic(material_name, summaries, gwp_statistic)
+
+    @staticmethod
+    def select_gwp_statistic(material_name, summaries, gwp_statistic):
+        """
+        Pick the selected statistic out of (statistics, messages) of lookup_gwp_summaries().
+        """
+        statistics_by_unit, messages = summaries
+        messages = list(messages)
+        gwp_by_unit = {functional_unit: statistics.summary()[gwp_statistic] for functional_unit, statistics in statistics_by_unit.items()}
+        for functional_unit, gwp in gwp_by_unit.items():
+            if gwp is None:
+                messages.append(f"No GWP values returned from {functional_unit} for {material_name}")
+        return gwp_by_unit, messages, statistics_by_unit["gwp_per_m3"].values
+
+    def lookup_epd_queries(self, epd_queries, epd_type, gwp_statistic, snapshot_path="", api_key="", max_concurrent_requests=4, profiler=None):
+        """
+        Resolve the GWP values of every (material, EC3 material name, option, number of panes) query.
+        Answered from the snapshot file when given, from the EC3 API (through the local cache) otherwise.
+        Requests, cache hits and the time of every lookup phase are recorded in profiler.
+        return: list of (dictionary of GWP value (or None) keyed by functional unit, list of info messages, array of gwp_per_m3 values), in query order
+        """
+        if snapshot_path:
+            from resources.EC3_snapshot import EPDSnapshot
+            client = EPDSnapshot(snapshot_path, profiler=profiler)
+            # a rewritten snapshot is a new source, a snapshot never expires
+            source = (snapshot_path, os.path.getmtime(snapshot_path))
+            max_age = None
+        else:
+            from resources.EC3_lookup import EC3Client, api_url
+            from resources.EC3_cache import EPDCache
+            from resources.EC3_planner import QueryPlanner, merging_enabled
+            cache = EPDCache()
+            client = EC3Client(api_key, cache=cache, max_workers=max_concurrent_requests, profiler=profiler)
+            # with EC3_MERGE_QUERIES set, the pane variants of the glazing are fetched with one request and split locally,
+            # fallback EPD types are planned as well and only fetched when needed
+            if merging_enabled():
+                client = QueryPlanner(client, [(query[1], query[2], query[3], current_type) for query in epd_queries for current_type in self.epd_types()])
+            source = api_url()
+            max_age = cache.ttl_seconds
+        # created before the worker threads use it
+        self.summary_memo()
+        with client:
+            return client.map_concurrent(lambda query: self.lookup_gwp_values(client, query[1], query[2], query[3], epd_type, gwp_statistic,
+                                                                              source, max_age), epd_queries)
+
+    def analyze_construction(self, diagnostics, layered_construction):
+        """
+        Number of panes and total glazing thickness of a layered window construction.
+        return: dictionary with "Number of panes" (None when not supported) and "Total thickness (m)"
+        """
+        construction_name = layered_construction.nameString()
+        # determine number of panes of window
+        # EC3 handle num_panes use ">=" operator instead of "="
+        # If use unprocessed single pane EPD, underestimate emission associated with product manufacturing
+        # if use multiple pane EPD, thickness of each pane in EPD might be different from the model (adopt this option, smaller error than single pane option)
+        num_panes = {1: 1, 3: 2, 5: 3}.get(layered_construction.numLayers())
+        if num_panes is None:
+            diagnostics.info(f"{construction_name} has {layered_construction.numLayers()} layers, currently unable to handle more complex scenarios.")
+
+        # get thickness from each window construction layer
+        total_glazing_thickness = 0.0
+        for i in range(layered_construction.numLayers()):
+            material = layered_construction.getLayer(i)
+            if material.thickness(): # count air layer thickness (delete: and "Air" not in material.nameString():)
+                glazing_thickness = material.thickness()
+                diagnostics.debug("layer", construction=construction_name, layer=i+1, material=material.nameString(), thickness_m=glazing_thickness)
+            else: # handle the case when no thickness is prodvied by the model 
+                glazing_thickness = 0.003
+                diagnostics.debug("layer", construction=construction_name, layer=i+1, material=material.nameString(), thickness_m=glazing_thickness,
+                                  note="no thickness attribute, default thickness of 3 mm assigned")
+            total_glazing_thickness += glazing_thickness
+
+        return {"Number of panes": num_panes, "Total thickness (m)": total_glazing_thickness}
+
+    def analyze_frame(self, diagnostics, frame, total_glazing_thickness):
+        """
+        Frame and divider cross sections of a WindowPropertyFrameAndDivider holding a glazing of the given thickness.
+        reference: https://bigladdersoftware.com/epx/docs/9-3/input-output-reference/group-thermal-zone-description-geometry.html#windowpropertyframeanddivider
+        return: dictionary of cross sectional areas and number of dividers
+        """
+        frame_name = frame.nameString()
+        frame_width = frame.frameWidth()
+        frame_op = frame.frameOutsideProjection()
+        frame_ip = frame.frameInsideProjection()
+        frame_cross_section_area = frame_width * (frame_op + frame_ip + total_glazing_thickness)
+
+        num_hori_divider = frame.numberOfHorizontalDividers() # integer
+        num_verti_divider = frame.numberOfVerticalDividers() # integer
+        if num_hori_divider != 0 or num_verti_divider != 0:
+            divider_width = frame.dividerWidth()
+            divider_op = frame.dividerOutsideProjection()
+            divider_ip = frame.dividerInsideProjection()
+            divider_cross_section_area = divider_width * (divider_op + divider_ip + total_glazing_thickness)
+        else:
+            divider_width = 0.0
+            divider_cross_section_area = 0.0
+
+        diagnostics.debug("frame", frame=frame_name, frame_width_m=frame_width, frame_cross_section_area_m2=frame_cross_section_area,
+                          divider_width_m=divider_width, divider_cross_section_area_m2=divider_cross_section_area,
+                          horizontal_dividers=num_hori_divider, vertical_dividers=num_verti_divider)
+
+        return {"Frame cross sectional area (m2)": frame_cross_section_area,
+                "Divider cross sectional area (m2)": divider_cross_section_area,
+                "Number of horizontal dividers": num_hori_divider,
+                "Number of vertical dividers": num_verti_divider}
+
+    # bump when the embodied carbon calculation changes, so results stored by an older version are recomputed
+    FINGERPRINT_VERSION = "1"
+    # windows whose model objects are held at once while their data is extracted
+    WINDOW_CHUNK_SIZE = 4096
+
+    @classmethod
+    def sub_surface_chunks(cls, model):
+        """
+        Subsurfaces of the model in lists of at most WINDOW_CHUNK_SIZE.
+        The model is walked space by space and surface by surface, so only the proxies of one chunk,
+        not of every subsurface of the model, are alive at a time.
+        """
+        chunk = []
+        num_found = 0
+        for space in model.getSpaces():
+            for surface in space.surfaces():
+                for subsurface in surface.subSurfaces():
+                    chunk.append(subsurface)
+                    num_found += 1
+                    if len(chunk) == cls.WINDOW_CHUNK_SIZE:
+                        yield chunk
+                        chunk = []
+        # subsurfaces of surfaces outside any space, only searched for when there are some
+        if num_found < model.numObjectsOfType(openstudio.IddObjectType("OS:SubSurface")):
+            for subsurface in model.getSubSurfaces():
+                if subsurface.surface().is_initialized() and subsurface.surface().get().space().is_initialized():
+                    continue
+                chunk.append(subsurface)
+                if len(chunk) == cls.WINDOW_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def fingerprint(values):
+        return hashlib.sha256(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+    def window_fingerprint(self, subsurface, argument_values, construction_fingerprints, frame_fingerprints):
+        """
+        Hash of everything the embodied carbon of a window depends on apart from the EPDs: vertices, construction layers,
+        frame and divider properties, space and argument values. Constructions and frames are hashed once per run.
+        return: hex digest, None when the window has no layered construction
+        """
+        if not subsurface.construction().is_initialized() or not subsurface.construction().get().to_LayeredConstruction().is_initialized():
+            return None
+        layered_construction = subsurface.construction().get().to_LayeredConstruction().get()
+        construction_handle = str(layered_construction.handle())
+        if construction_handle not in construction_fingerprints:
+            layers = [layered_construction.getLayer(i) for i in range(layered_construction.numLayers())]
+            construction_fingerprints[construction_handle] = [construction_handle] + [[str(layer.handle()), layer.thickness()] for layer in layers]
+
+        frame_fingerprint = None
+        if subsurface.windowPropertyFrameAndDivider().is_initialized():
+            frame = subsurface.windowPropertyFrameAndDivider().get()
+            frame_handle = str(frame.handle())
+            if frame_handle not in frame_fingerprints:
+                frame_fingerprints[frame_handle] = [frame_handle, frame.frameWidth(), frame.frameOutsideProjection(), frame.frameInsideProjection(),
+                                                    frame.numberOfHorizontalDividers(), frame.numberOfVerticalDividers(), frame.dividerWidth(),
+                                                    frame.dividerOutsideProjection(), frame.dividerInsideProjection()]
+            frame_fingerprint = frame_fingerprints[frame_handle]
+
+        space_handle = None
+        if subsurface.surface().is_initialized() and subsurface.surface().get().space().is_initialized():
+            space_handle = str(subsurface.surface().get().space().get().handle())
+        vertices = [[vertex.x(), vertex.y(), vertex.z()] for vertex in subsurface.vertices()]
+        return self.fingerprint([self.FINGERPRINT_VERSION, vertices, construction_fingerprints[construction_handle],
+                                 frame_fingerprint, space_handle, argument_values])
+
+    @staticmethod
+    def stored_results(subsurface, fingerprint):
+        """
+        Results written by a previous run of the measure on this window, when its fingerprint still matches.
+        return: WindowRecord of the stored results or None when the window has to be analyzed again
+        """
+        from resources.carbon_report import facade_orientation
+
+        additional_properties = subsurface.additionalProperties()
+        stored_fingerprint = additional_properties.getFeatureAsString("Embodied carbon fingerprint")
+        if fingerprint is None or not stored_fingerprint.is_initialized() or stored_fingerprint.get() != fingerprint:
+            return None
+        stored = {"EPD key": additional_properties.getFeatureAsString("Embodied carbon EPD key"),
+                  "Number of panes": additional_properties.getFeatureAsInteger("Number of panes")}
+        for name in ["Glazing area", "Glazing volume", "Frame volume", "Glazing embodied carbon", "Frame embodied carbon"]:
+            stored[name] = additional_properties.getFeatureAsDouble(name)
+        if not all(value.is_initialized() for value in stored.values()):
+            return None
+        stored = {name: value.get() for name, value in stored.items()}
+        return WindowRecord(subsurface.nameString(), str(subsurface.handle()), subsurface.construction().get().nameString(),
+                            WindowEnhancement.space_name(subsurface),
+                            facade_orientation(openstudio.radToDeg(subsurface.azimuth()), openstudio.radToDeg(subsurface.tilt())),
+                            stored["Number of panes"], stored["Glazing area"], stored["Glazing volume"], stored["Frame volume"],
+                            fingerprint=fingerprint, glazing_embodied_carbon=stored["Glazing embodied carbon"],
+                            frame_embodied_carbon=stored["Frame embodied carbon"], epd_key=stored["EPD key"], reused=True)
+
+    @staticmethod
+    def store_results(subsurface, record):
+        """
+        Attach the results of a window to its subsurface, a reused window only gets its embodied carbon updated.
+        """
+        # attach additional properties to openstudio material
+        additional_properties = subsurface.additionalProperties()
+        additional_properties.setFeature("Embodied carbon", record.embodied_carbon)
+        additional_properties.setFeature("Embodied carbon EPD key", record.epd_key)
+        additional_properties.setFeature("Glazing embodied carbon", record.glazing_embodied_carbon)
+        additional_properties.setFeature("Frame embodied carbon", record.frame_embodied_carbon)
+        if record.reused:
+            return
+        additional_properties.setFeature("Subsurface name", record.name)
+        # inputs and results a later run needs to reuse this window without analyzing it again
+        additional_properties.setFeature("Embodied carbon fingerprint", record.fingerprint)
+        additional_properties.setFeature("Number of panes", record.number_of_panes)
+        additional_properties.setFeature("Glazing area", record.glazing_area)
+        additional_properties.setFeature("Glazing volume", record.glazing_volume)
+        additional_properties.setFeature("Frame volume", record.frame_volume)
+
+    def analyze_window(self, diagnostics, subsurface, dimension, fingerprint, frame_cross_section_area_arg, construction_cache, frame_cache):
+        """
+        Glazing and frame quantities of a window, constructions and frames are analyzed once per handle through the caches.
+        return: WindowRecord, None when the window construction is not supported
+        """
+        from resources.carbon_report import facade_orientation
+
+        subsurface_name = subsurface.nameString()
+        # collect glazing materials from the layered window construction
+        layered_construction = None
+        if subsurface.construction().is_initialized():
+            subsurface_const = subsurface.construction().get()
+            if subsurface_const.to_LayeredConstruction().is_initialized():
+                layered_construction = subsurface_const.to_LayeredConstruction().get()
+        if layered_construction is None:
+            diagnostics.warning(f"{subsurface_name} has no layered construction and is skipped.")
+            return None
+
+        construction_handle = str(layered_construction.handle())
+        if construction_handle not in construction_cache:
+            glazing = self.analyze_construction(diagnostics, layered_construction)
+            # the name is shared by every record of the construction
+            glazing["Name"] = layered_construction.nameString()
+            construction_cache[construction_handle] = glazing
+        glazing = construction_cache[construction_handle]
+        if glazing["Number of panes"] is None:
+            diagnostics.warning(f"{subsurface_name} is skipped, currently unable to handle more complex scenarios.")
+            return None
+
+        # get frame and divider dimensions:
+        frame_properties = {"Frame cross sectional area (m2)": frame_cross_section_area_arg,
+                            "Divider cross sectional area (m2)": 0.0,
+                            "Number of horizontal dividers": 0,
+                            "Number of vertical dividers": 0}
+        if subsurface.windowPropertyFrameAndDivider().is_initialized(): # check if frame_and_divider exist in selected subsurface
+            frame = subsurface.windowPropertyFrameAndDivider().get()
+            # frame cross section includes the glazing thickness, so it depends on the construction too
+            frame_key = (str(frame.handle()), construction_handle)
+            if frame_key not in frame_cache:
+                frame_cache[frame_key] = self.analyze_frame(diagnostics, frame, glazing["Total thickness (m)"])
+            frame_properties = frame_cache[frame_key]
+        else:
+            # fall back to the user supplied frame cross section area
+            diagnostics.debug("no_frame", subsurface=subsurface_name, frame_cross_section_area_m2=frame_cross_section_area_arg)
+
+        total_divider_length = (frame_properties["Number of horizontal dividers"] * dimension["width"] +
+                                frame_properties["Number of vertical dividers"] * dimension["length"])
+        frame_cross_section_area = frame_properties["Frame cross sectional area (m2)"]
+        divider_cross_section_area = frame_properties["Divider cross sectional area (m2)"]
+
+        glazing_area = dimension["area"]
+        return WindowRecord(subsurface_name, str(subsurface.handle()), glazing["Name"], self.space_name(subsurface),
+                            facade_orientation(openstudio.radToDeg(subsurface.azimuth()), openstudio.radToDeg(subsurface.tilt())),
+                            glazing["Number of panes"], glazing_area, glazing["Total thickness (m)"] * glazing_area,
+                            frame_cross_section_area * dimension["perimeter"] + divider_cross_section_area * total_divider_length,
+                            glazing_thickness=glazing["Total thickness (m)"], frame_cross_section_area=frame_cross_section_area,
+                            divider_cross_section_area=divider_cross_section_area, fingerprint=fingerprint)
+
+    @staticmethod
+    def output_directory(runner):
+        """
+        Folder receiving the result files: the run folder of the workflow when it comes from an OSW file,
+        the working directory for workflows built in memory (tests, portfolio runs).
+        """
+        workflow = runner.workflow()
+        if workflow.oswPath().is_initialized():
+            run_dir = str(workflow.absoluteRunDir())
+            os.makedirs(run_dir, exist_ok=True)
+            return run_dir
+        return os.getcwd()
+
+    @staticmethod
+    def space_name(subsurface):
+        if subsurface.surface().is_initialized() and subsurface.surface().get().space().is_initialized():
+            return subsurface.surface().get().space().get().nameString()
+        return "Unassigned"
+
+    @staticmethod
+    def material_embodied_carbon(gwp_per_m3, volume, lifetime, analysis_period):
+        """
+        Embodied carbon of a window material over the analysis period, replaced every lifetime years.
+        """
+        import numpy as np
+
+        if gwp_per_m3 is None:
+            return 0.0
+        if analysis_period <= lifetime:
+            return float(gwp_per_m3 * volume)
+        multiplier = np.ceil(analysis_period/lifetime)
+        return float(gwp_per_m3 * volume * multiplier)
+
     def run(self, model: openstudio.model.Model, runner: openstudio.measure.OSRunner, user_arguments: openstudio.measure.OSArgumentMap):
         """Define what happens when the measure is run. Execute the measure."""
-        runner.registerInfo("Starting WindowEnhancement measure execution.")
-
         # Check if model exists
         if not model:
             runner.registerError("Model is None. Exiting measure.")
@@ -143,7 +609,7 @@ class WindowEnhancement(openstudio.measure.ModelMeasure):
             return False
 
         # Retrieve user inputs
-        frame_cross_section_area = runner.getDoubleArgumentValue("frame_cross_section_area", user_arguments)
+        frame_cross_section_area_arg = runner.getDoubleArgumentValue("frame_cross_section_area", user_arguments)
         gwp_statistic = runner.getStringArgumentValue("gwp_statistic", user_arguments)
         igu_option = runner.getStringArgumentValue("igu_option", user_arguments)
         wf_option = runner.getStringArgumentValue("wf_option", user_arguments)
@@ -153,232 +619,227 @@ class WindowEnhancement(openstudio.measure.ModelMeasure):
         total_embodied_carbon = runner.getDoubleArgumentValue("total_embodied_carbon",user_arguments)
         api_key = runner.getStringArgumentValue("api_key", user_arguments)
         epd_type = runner.getStringArgumentValue("epd_type", user_arguments)
-
-        # Debug: Print all user arguments received
-        runner.registerInfo(f"User Arguments: {user_arguments}")
+        max_concurrent_requests = runner.getIntegerArgumentValue("max_concurrent_requests", user_arguments)
+        snapshot_path = runner.getStringArgumentValue("snapshot_path", user_arguments).strip()
+        verbosity = runner.getStringArgumentValue("verbosity", user_arguments)
+        uncertainty_samples = runner.getIntegerArgumentValue("uncertainty_samples", user_arguments)
+        upgrade_constructions = runner.getBoolArgumentValue("upgrade_constructions", user_arguments)
+        profiling = runner.getStringArgumentValue("profiling", user_arguments)
+
+        # messages are routed by verbosity, per-window details are buffered and written once at the end
+        diagnostics = Diagnostics(runner, verbosity)
+        diagnostics.info("Starting WindowEnhancement measure execution.")
+        # time spent in every phase of the run, registered as runner values at the end
+        profiler = Profiler(profiling).start()
+
+        # Debug: record all user arguments received, falling back to their default value, the API token is never written
         for arg_name, arg_value in user_arguments.items():
-            try:
-                # Ensure that arg_value is valid and that the valueAsString() method can be called
-                value_str = arg_value.valueAsString() if arg_value is not None else "None"
-                runner.registerInfo(f"user_argument: {arg_name} = {value_str}")
-            except Exception as e:
-                runner.registerInfo(f"Error processing argument: {arg_name} - {str(e)}")
+            value_str = arg_value.printValue(True) if arg_value is not None else "None"
+            diagnostics.debug("argument", name=arg_name, value="***" if arg_name == "api_key" else value_str)
         
         # Check if numeric values are reasonable
+        errors = []
         if analysis_period <= 0:
-            runner.registerError("Choose an integer larger than 0 for analysis period of embodeid carbon calcualtion.")
+            errors.append("Choose an integer larger than 0 for analysis period of embodeid carbon calcualtion.")
         if igu_lifetime <= 0:
-            runner.registerError("Choose an integer larger than 0 for product lifetime of insulating glazing unit.")
+            errors.append("Choose an integer larger than 0 for product lifetime of insulating glazing unit.")
         if wf_lifetime <= 0:
-            runner.registerError("Choose an integer larger than 0 for product lifetime of window frame.")
-
-        # Print the number of sub-surfaces before processing
-        sub_surfaces = model.getSubSurfaces()
-        runner.registerInfo(f"Total sub-surfaces found: {len(sub_surfaces)}")
-        # List storing subsurface object subject to change, here we want to catch "Name: Sub Surface 2, Surface Type: FixedWindow, Space Name: Space 2"
-        sub_surfaces_to_change = []
-        # loop through sub surfaces
-        for subsurface in sub_surfaces:
-
-            if subsurface.subSurfaceType() in ["FixedWindow","OperableWindow","Skylight"]:
-                # append the subsurface objects carrying windows into list
-                sub_surfaces_to_change.append(subsurface) 
-                runner.registerInfo(f"Processing window construction in {subsurface.nameString()}")           
-            else:# if sub_surface.subSurfaceType() not in ["FixedWindow", "OperableWindow"]:
-                runner.registerInfo(f"Skipping non-window surface: {subsurface.nameString()}")
-                continue
-
-        # dictionary storing properties of subsurfaces containing window construcitons 
-        subsurface_dict = {}
-        # loop through layered window construciton to collect glazing materials
-        for subsurface in sub_surfaces_to_change:
-            subsurface_name = subsurface.nameString()
-            subsurface_dict[subsurface_name] = {}
-            if subsurface.construction().is_initialized():
-                subsurface_const = subsurface.construction().get()
-            if subsurface_const.to_LayeredConstruction().is_initialized():
-                layered_construction = subsurface_const.to_LayeredConstruction().get()
+            errors.append("Choose an integer larger than 0 for product lifetime of window frame.")
+        if max_concurrent_requests <= 0:
+            errors.append("Choose an integer larger than 0 for maximum concurrent EC3 requests.")
+        if uncertainty_samples < 0:
+            errors.append("Choose an integer of 0 or more for the number of uncertainty samples.")
+        if frame_cross_section_area_arg < 0:
+            errors.append("Choose a frame cross section area of 0 or more.")
+        # checked before any construction is upgraded, a failed run leaves the model as it was
+        if snapshot_path and not os.path.exists(snapshot_path):
+            errors.append(f"EPD snapshot not found: {snapshot_path}")
+        for error in errors:
+            runner.registerError(error)
+        if errors:
+            return False
 
-            subsurface_dict[subsurface_name]["Glazing"] = {}
-            subsurface_dict[subsurface_name]["Frame"] = {}
-            subsurface_dict[subsurface_name]["Subsurface object"] = subsurface
-            subsurface_dict[subsurface_name]["Glazing"]["Object"] = layered_construction
-            subsurface_dict[subsurface_name]["Glazing"]["Lifetime"] = igu_lifetime
-            subsurface_dict[subsurface_name]["Frame"]["Lifetime"] = wf_lifetime
-            subsurface_dict[subsurface_name]["window_embodied_carbon"] = 0.0
-            subsurface_dict[subsurface_name]["Dimension"] = calculate_geometry(self, subsurface)
-
-            # determine number of panes of window
-            # EC3 handle num_panes use ">=" operator instead of "="
-            # If use unprocessed single pane EPD, underestimate emission associated with product manufacturing
-            # if use multiple pane EPD, thickness of each pane in EPD might be different from the model (adopt this option, smaller error than single pane option)
-            print(layered_construction.numLayers())
-            if layered_construction.numLayers() == 1:
-                num_panes = 1 
-            elif layered_construction.numLayers() == 3:
-                num_panes = 2
-            elif layered_construction.numLayers() == 5:
-                num_panes = 3 
-            else:
-                runner.registerInfo("currently unable to handle more complex scenarios.")
-            subsurface_dict[subsurface_name]["Number of panes"] = num_panes
-
-            # get thickness from each window construction layer
-            total_glazing_thickness = 0.0
-            for i in range(layered_construction.numLayers()):
-                material = layered_construction.getLayer(i)
-                runner.registerInfo(f"Layer {i+1}: {material.nameString()}") 
-                if material.thickness(): # count air layer thickness (delete: and "Air" not in material.nameString():)
-                    glazing_thickness = material.thickness()
-                    runner.registerInfo(f"In {subsurface_name}: Material: {material.nameString()}, Thickness: {glazing_thickness} m")
-                    total_glazing_thickness += glazing_thickness
-                else: # handle the case when no thickness is prodvied by the model 
-                    glazing_thickness = 0.003
-                    total_glazing_thickness += glazing_thickness
-                    runner.registerInfo(f"In {subsurface_name}: Material: {material.nameString()} doesn't have thickness attribute and a default thickness of 3 mm assigned.")
-            
-            glazing_area = subsurface_dict[subsurface_name]["Dimension"]["area"]
-            subsurface_dict[subsurface_name]["Glazing"]["Total thickness (m)"] = total_glazing_thickness
-            subsurface_dict[subsurface_name]["Glazing"]["Area (m2)"]  = glazing_area
-            subsurface_dict[subsurface_name]["Glazing"]["Volume (m3)"] = total_glazing_thickness * glazing_area
-
-            # get frame and divider dimensions:
-            # reference: https://bigladdersoftware.com/epx/docs/9-3/input-output-reference/group-thermal-zone-description-geometry.html#windowpropertyframeanddivider
-            if subsurface.windowPropertyFrameAndDivider().is_initialized(): # check if frame_and_divider exist in selected subsurface
-                frame = subsurface.windowPropertyFrameAndDivider().get()
-                frame_name = frame.nameString()
-                frame_width = frame.frameWidth()
-                frame_op = frame.frameOutsideProjection()
-                frame_ip = frame.frameInsideProjection()
-                frame_cross_section_area = frame_width * (frame_op + frame_ip + subsurface_dict[subsurface_name]["Glazing"]["Total thickness (m)"])
-                frame_perimeter = subsurface_dict[subsurface_name]["Dimension"]["perimeter"]
-
-                if frame.numberOfHorizontalDividers() != 0 or frame.numberOfVerticalDividers() != 0:
-                    divider_width = frame.dividerWidth()
-                    divider_op = frame.dividerOutsideProjection()
-                    divider_ip = frame.dividerInsideProjection()
-                    divider_cross_section_area = divider_width * (divider_op + divider_ip + subsurface_dict[subsurface_name]["Glazing"]["Total thickness (m)"])
-                    num_hori_divider = frame.numberOfHorizontalDividers() # integer
-                    num_verti_divider = frame.numberOfVerticalDividers() # integer
-                    total_divider_length = (num_hori_divider * subsurface_dict[subsurface_name]["Dimension"]["width"] +
-                                             num_verti_divider * subsurface_dict[subsurface_name]["Dimension"]["length"])
-                else:
-                    divider_width = 0.0
-                    divider_cross_section_area = 0.0
-                    runner.registerInfo(f"In {subsurface.nameString()}'s Frame {frame_name}: no divider")
-
-                runner.registerInfo(f"In {subsurface.nameString()}'s Frame and divider: {frame_name},"
-                                    f"Frame Width: {frame_width} m, cross sectional area: {frame_cross_section_area} m2, perimeter: {frame_perimeter}"
-                                    f"Divider width: {divider_width}m, cross sectional area: {divider_cross_section_area} m2, total length: {total_divider_length} m")
-            else:
-                runner.registerInfo(f"In {subsurface.nameString()}: no frame and divider")
-
-            subsurface_dict[subsurface_name]["Frame"]["Object"] = frame
-            subsurface_dict[subsurface_name]["Frame"]["Frame cross sectional area (m2)"] = frame_cross_section_area
-            subsurface_dict[subsurface_name]["Frame"]["Divider cross sectional area (m2)"] = divider_cross_section_area
-            subsurface_dict[subsurface_name]["Frame"]["Volume (m3)"] = frame_cross_section_area * frame_perimeter + divider_cross_section_area * total_divider_length
-
-            epd_datalist = {}
-
-            glazing_product_url = generate_url(material_name = "InsulatingGlazingUnits", option = igu_option, glass_panes = num_panes, epd_type= "Product", endpoint = "materials")
-            frame_product_url = generate_url(material_name = "AluminiumExtrusions", epd_type= "Product", endpoint = "materials") # EC3 only has aluminum option, revisit later
-            glazing_industry_url = generate_url(material_name = "InsulatingGlazingUnits", option = igu_option, glass_panes = num_panes, epd_type= "Industry", endpoint = "industry_epds")
-            frame_industry_url = generate_url(material_name = "AluminiumExtrusions", epd_type= "Industry", endpoint = "industry_epds")
-            glazing_product_epd = fetch_epd_data(url = glazing_product_url, api_token = api_key)
-            frame_product_epd = fetch_epd_data(url = frame_product_url, api_token = api_key)
-            glazing_industry_epd = fetch_epd_data(url = glazing_industry_url, api_token = api_key)
-            frame_industry_epd = fetch_epd_data(url = frame_industry_url, api_token = api_key)
-
-            if epd_type == "Product":
-                if not glazing_product_epd:
-                    glazing_epd = glazing_industry_epd
-                    runner.registerInfo("Product EPDs are not avialable, industry EPDs are accessed instead")
-                else:
-                    glazing_epd = glazing_product_epd
-                epd_datalist["Glazing"] = glazing_epd
-                if not frame_product_epd:
-                    frame_epd = frame_industry_epd
-                    runner.registerInfo("Product EPDs are not avialable, industry EPDs are accessed instead")
-                else:
-                    frame_epd = frame_product_epd
-                epd_datalist["Frame"] = frame_epd
-
-            elif epd_type == "Industry":
-                if not glazing_industry_epd:
-                    glazing_epd = glazing_product_epd
-                    runner.registerInfo("Product EPDs are not avialable, industry EPDs are accessed instead")
-                else:
-                    glazing_epd = glazing_industry_epd
-                epd_datalist["Glazing"] = glazing_epd
-                if not frame_industry_epd:
-                    frame_epd = frame_product_epd
-                    runner.registerInfo("Product EPDs are not avialable, industry EPDs are accessed instead")
-                else:
-                    frame_epd = frame_industry_epd
-                epd_datalist["Frame"] = frame_epd
-
-            for material_name, epd_data in epd_datalist.items():
-                # collect  GWP values per functional unit
-                gwp_values = {}
-                gwp_values["gwp_per_m2"] = []
-                gwp_values["gwp_per_kg"] = []
-                gwp_values["gwp_per_m3"] = []
-
-                for idx, epd in enumerate(epd_data,start = 1):
-                    # parse json repsonse based on epd_eype
-                    if epd_type == "Industry":
-                        parsed_data = parse_industrial_epd(epd)
-                    elif epd_type == "Product":
-                        parsed_data = parse_product_epd(epd)
-
-                    gwp_per_m2 = parsed_data["gwp_per_m2 (kg CO2 eq/m2)"]
-                    if gwp_per_m2 != None:
-                        gwp_values["gwp_per_m2"].append(float(gwp_per_m2))
-
-                    gwp_per_kg = parsed_data["gwp_per_kg (kg CO2 eq/kg)"]
-                    if gwp_per_kg != None:
-                        gwp_values["gwp_per_kg"].append(float(gwp_per_kg))
-
-                    gwp_per_m3 = parsed_data["gwp_per_m3 (kg CO2 eq/m3)"]
-                    if gwp_per_m3 != None:
-                        gwp_values["gwp_per_m3"].append(float(gwp_per_m3))
-                
-                # extract gwp statistics by 
-                for functional_unit, list in gwp_values.items():
-                    if len(list) == 0:
-                        gwp = None
-                        runner.registerInfo(f"No GWP values returned from {functional_unit}")
-                    elif len(list) == 1:
-                        gwp = list[0]
-                    elif gwp_statistic == "minimum":
-                        gwp = float(np.min(list))
-                    elif gwp_statistic == "maximum":
-                        gwp = float(np.max(list))
-                    elif gwp_statistic == "mean":
-                        gwp = float(np.mean(list))
-                    elif gwp_statistic == "median":
-                        gwp = float(np.median(list))
-                    # store gwp value
-                    subsurface_dict[subsurface_name][material_name][functional_unit] = gwp
-
-                if analysis_period <= subsurface_dict[subsurface_name][material_name]["Lifetime"]:
-                    embodied_carbon = float(subsurface_dict[subsurface_name][material_name]["gwp_per_m3"] * subsurface_dict[subsurface_name][material_name]["Volume (m3)"])
-                    subsurface_dict[subsurface_name][material_name]["embodied_carbon"] = embodied_carbon
-                else:
-                    multiplier = np.ceil(analysis_period/subsurface_dict[subsurface_name][material_name]["Lifetime"])
-                    embodied_carbon = float(subsurface_dict[subsurface_name][material_name]["gwp_per_m3"] * subsurface_dict[subsurface_name][material_name]["Volume (m3)"] * multiplier)
-                    subsurface_dict[subsurface_name][material_name]["embodied_carbon"] = embodied_carbon
-
-                subsurface_dict[subsurface_name]["window_embodied_carbon"] +=  subsurface_dict[subsurface_name][material_name]["embodied_carbon"]
-
-            runner.registerInfo(f"window's embodied carbon in this subsurface: {subsurface_dict[subsurface_name]['window_embodied_carbon']}")
-
-            # attach additional properties to openstudio material
-            additional_properties = subsurface_dict[subsurface_name]["Subsurface object"].additionalProperties()
-            additional_properties.setFeature("Subsurface name", subsurface_name)
-            additional_properties.setFeature("Embodied carbon", subsurface_dict[subsurface_name]["window_embodied_carbon"])
-   
-        pp.pprint(subsurface_dict)
+        # windows are taken from the model in chunks, their proxies are dropped once their data is extracted
+        # into compact records so no model object stays alive for the rest of the run
+        diagnostics.info(f"Total sub-surfaces found: {model.numObjectsOfType(openstudio.IddObjectType('OS:SubSurface'))}")
+        import numpy as np
+        from resources.calculate_perimeter import calculate_geometry_batch
+        from resources.carbon_report import CarbonReport
+
+        # windows whose geometry, construction, frame, space and arguments did not change since the last run
+        # keep their stored volumes and are not analyzed again, iterative runs scale with the size of the change
+        argument_values = [analysis_period, igu_option, igu_lifetime, wf_lifetime, wf_option, frame_cross_section_area_arg, epd_type, gwp_statistic]
+        construction_fingerprints = {}
+        frame_fingerprints = {}
+        # most models reuse a handful of constructions and frames across many windows,
+        # analyze each distinct object once per run keyed by its handle
+        construction_cache = {}
+        frame_cache = {}
+        # windows are upgraded before they are fingerprinted, a later run then finds them unchanged
+        upgrader = None
+        num_upgraded = 0
+        if upgrade_constructions:
+            from resources.thermal_upgrade import ConstructionUpgrader
+            upgrader = ConstructionUpgrader(model, igu_option)
+        records = []
+        num_reused = 0
+        num_analyzed = 0
+        with profiler.phase("model_traversal"):
+            for chunk in self.sub_surface_chunks(model):
+                # subsurfaces carrying windows, here we want to catch "Name: Sub Surface 2, Surface Type: FixedWindow, Space Name: Space 2"
+                windows_to_analyze = []
+                fingerprints = []
+                for subsurface in chunk:
+                    if subsurface.subSurfaceType() not in ["FixedWindow","OperableWindow","Skylight"]:
+                        diagnostics.debug("skipped", subsurface=subsurface.nameString(), reason="not a window")
+                        continue
+                    diagnostics.debug("window", subsurface=subsurface.nameString())
+                    if upgrader is not None and upgrader.upgrade(subsurface):
+                        num_upgraded += 1
+                    fingerprint = self.window_fingerprint(subsurface, argument_values, construction_fingerprints, frame_fingerprints)
+                    record = self.stored_results(subsurface, fingerprint)
+                    if record is None:
+                        windows_to_analyze.append(subsurface)
+                        fingerprints.append(fingerprint)
+                    else:
+                        records.append(record)
+                        num_reused += 1
+                num_analyzed += len(windows_to_analyze)
+
+                # window dimensions of the whole chunk in one vectorized pass
+                with profiler.phase("geometry"):
+                    dimensions = calculate_geometry_batch(windows_to_analyze)
+                for index, subsurface in enumerate(windows_to_analyze):
+                    record = self.analyze_window(diagnostics, subsurface, {name: float(values[index]) for name, values in dimensions.items()},
+                                                 fingerprints[index], frame_cross_section_area_arg, construction_cache, frame_cache)
+                    if record is not None:
+                        records.append(record)
+                del chunk, windows_to_analyze
+
+        if upgrader is not None:
+            diagnostics.info(f"Assigned upgraded constructions for {igu_option} to {num_upgraded} windows, {upgrader.created} constructions were created")
+            if upgrader.unsupported:
+                diagnostics.warning(f"Constructions without a standard glazing layer keep their thermal performance for {igu_option}: {', '.join(upgrader.unsupported)}")
+        if num_reused:
+            diagnostics.info(f"{num_reused} windows unchanged since the last run reuse their stored results, {num_analyzed} windows are analyzed")
+        diagnostics.info(f"Analyzed {len(construction_cache)} distinct constructions and {len(frame_cache)} distinct frames for {len(records) - num_reused} windows")
+
+        # work out the distinct EC3 queries needed by all windows before making any request,
+        # glazing EPDs depend on the number of panes while frame EPDs are shared by every window
+        # EC3 only has aluminum option for frames, revisit later
+        epd_queries = {("Frame", "AluminiumExtrusions", None, None)}
+        for record in records:
+            epd_queries.add(("Glazing", "InsulatingGlazingUnits", igu_option, record.number_of_panes))
+
+        # fetch and reduce each distinct query once, results are shared by every subsurface needing them
+        # one pooled client serves every request of the run and sends the distinct queries concurrently,
+        # responses are kept in the local EC3 cache so repeated runs do not hit the API again
+        # an offline snapshot answers the same lookups without network access
+        epd_queries = sorted(epd_queries, key=str)
+        if snapshot_path:
+            diagnostics.info(f"Answering EPD lookups from snapshot {snapshot_path}")
+        with profiler.phase("epd_lookup"):
+            lookups = self.lookup_epd_queries(epd_queries, epd_type, gwp_statistic, snapshot_path, api_key, max_concurrent_requests, profiler)
+        gwp_by_query = {}
+        gwp_values_by_query = {}
+        for query, (gwp_by_unit, messages, gwp_per_m3_values) in zip(epd_queries, lookups):
+            for message in messages:
+                diagnostics.info(message)
+            if gwp_by_unit["gwp_per_m3"] is None:
+                diagnostics.warning(f"No GWP per m3 available for {query[0]} ({query[1]}, {query[3] or 'any'} panes), its embodied carbon is not counted.")
+            gwp_by_query[query] = gwp_by_unit
+            gwp_values_by_query[query] = gwp_per_m3_values
+
+        # building, facade, construction and space totals are accumulated in the same pass
+        report = CarbonReport(total_embodied_carbon)
+        # query and volume times replacement multiplier of every window material, for the uncertainty mode
+        query_positions = {query: position for position, query in enumerate(epd_queries)}
+        sampled_query_index = []
+        sampled_volume_multiplier = []
+
+        def sample(query, volume, lifetime):
+            if uncertainty_samples > 0:
+                sampled_query_index.append(query_positions[query])
+                sampled_volume_multiplier.append(volume * (1 if analysis_period <= lifetime else np.ceil(analysis_period/lifetime)))
+
+        # EPD values a window result was computed with, stored to tell whether it is still current
+        epd_keys = {}
+
+        def window_epd_key(num_panes):
+            if num_panes not in epd_keys:
+                epd_keys[num_panes] = self.fingerprint([gwp_by_query[("Glazing", "InsulatingGlazingUnits", igu_option, num_panes)],
+                                                        gwp_by_query[("Frame", "AluminiumExtrusions", None, None)]])
+            return epd_keys[num_panes]
+
+        with profiler.phase("embodied_carbon"):
+            frame_query = ("Frame", "AluminiumExtrusions", None, None)
+            for record in records:
+                glazing_query = ("Glazing", "InsulatingGlazingUnits", igu_option, record.number_of_panes)
+                sample(glazing_query, record.glazing_volume, igu_lifetime)
+                sample(frame_query, record.frame_volume, wf_lifetime)
+                epd_key = window_epd_key(record.number_of_panes)
+                # a reused window whose EPDs did not move keeps its stored results, nothing is written
+                if not record.reused or record.epd_key != epd_key:
+                    record.glazing_embodied_carbon = self.material_embodied_carbon(gwp_by_query[glazing_query]["gwp_per_m3"], record.glazing_volume,
+                                                                                   igu_lifetime, analysis_period)
+                    record.frame_embodied_carbon = self.material_embodied_carbon(gwp_by_query[frame_query]["gwp_per_m3"], record.frame_volume,
+                                                                                 wf_lifetime, analysis_period)
+                    record.epd_key = epd_key
+                    diagnostics.debug("embodied_carbon", subsurface=record.name, construction=record.construction_name,
+                                      glazing_volume_m3=record.glazing_volume, frame_volume_m3=record.frame_volume,
+                                      glazing_kg_co2e=record.glazing_embodied_carbon, frame_kg_co2e=record.frame_embodied_carbon,
+                                      window_kg_co2e=record.embodied_carbon)
+                    self.store_results(model.getSubSurface(openstudio.toUUID(record.handle)).get(), record)
+
+                report.add(record.orientation, record.construction_name, record.space, record.glazing_area,
+                           record.glazing_embodied_carbon, record.frame_embodied_carbon)
+
+        # one aggregated line per construction instead of one per window
+        for construction_name, summary in sorted(report.totals["construction"].items()):
+            diagnostics.info(f"{construction_name}: {int(summary['windows'])} windows, {summary['area_m2']:.2f} m2 of glazing, "
+                             f"{summary['embodied_carbon_kg_co2e']:.2f} kg CO2 eq embodied carbon")
+
+        # building level results for downstream aggregation, no need to reload the model
+        building = report.building
+        runner.registerValue("window_embodied_carbon", "Window Embodied Carbon", building["embodied_carbon_kg_co2e"], "kg CO2 eq")
+        runner.registerValue("window_glazing_embodied_carbon", "Window Glazing Embodied Carbon", building["glazing_kg_co2e"], "kg CO2 eq")
+        runner.registerValue("window_frame_embodied_carbon", "Window Frame Embodied Carbon", building["frame_kg_co2e"], "kg CO2 eq")
+        runner.registerValue("window_area", "Window Area", building["area_m2"], "m^2")
+        for orientation, summary in sorted(report.totals["orientation"].items()):
+            runner.registerValue(f"window_embodied_carbon_{orientation.lower()}", f"{orientation} Window Embodied Carbon",
+                                 summary["embodied_carbon_kg_co2e"], "kg CO2 eq")
+        if uncertainty_samples > 0:
+            # propagate the spread of the fetched EPDs instead of the single selected statistic
+            from resources.uncertainty import sample_embodied_carbon, summarize_samples
+            with profiler.phase("uncertainty"):
+                totals = sample_embodied_carbon([gwp_values_by_query[query] for query in epd_queries], np.array(sampled_query_index, dtype=int),
+                                                np.array(sampled_volume_multiplier, dtype=float), uncertainty_samples)
+            report.uncertainty = summarize_samples(totals)
+            # registered as window_embodied_carbon_p_10, the runner would rewrite "p10" to "p_10" anyway
+            for percentile in ["p10", "p50", "p90"]:
+                runner.registerValue(f"window_embodied_carbon_p_{percentile[1:]}", f"Window Embodied Carbon {percentile.upper()}",
+                                     report.uncertainty[percentile], "kg CO2 eq")
+            diagnostics.info(f"Window embodied carbon over {uncertainty_samples} EPD samples: P10 {report.uncertainty['p10']:.2f}, "
+                             f"P50 {report.uncertainty['p50']:.2f}, P90 {report.uncertainty['p90']:.2f} kg CO2 eq")
+        window_share = report.window_share()
+        if window_share is not None:
+            runner.registerValue("window_embodied_carbon_share", "Window Share of Building Embodied Carbon", window_share, "%")
+            diagnostics.info(f"Windows account for {window_share:.2f}% of the {total_embodied_carbon:.2f} kg CO2 eq building embodied carbon")
+        runner.registerFinalCondition(f"Windows embody {building['embodied_carbon_kg_co2e']:.2f} kg CO2 eq over {int(building['windows'])} windows")
+        output_dir = self.output_directory(runner)
+        with profiler.phase("write_results"):
+            results_path = report.write_json(os.path.join(output_dir, "window_enhancement_results.json"))
+            report.write_csv(os.path.join(output_dir, "window_enhancement_results.csv"))
+        diagnostics.info(f"Embodied carbon results written to {results_path}")
+
+        diagnostics_path = diagnostics.write(os.path.join(output_dir, "window_enhancement_diagnostics.jsonl"))
+        if diagnostics_path:
+            diagnostics.info(f"Diagnostics written to {diagnostics_path}")
+
+        profiler.stop()
+        profiler.register(runner)
+        profile_path = profiler.write(os.path.join(output_dir, "window_enhancement_profile.json"))
+        diagnostics.info(f"Run took {profiler.summary()['wall_seconds']:.2f} s, timings written to {profile_path}")
 
         return True
 
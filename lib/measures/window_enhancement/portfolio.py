@@ -0,0 +1,209 @@
+# *******************************************************************************
+# OpenStudio(R), Copyright (c) Alliance for Sustainable Energy, LLC.
+# See also https://openstudio.net/license
+# *******************************************************************************
+
+# Apply the WindowEnhancement measure to many models at once, e.g.
+# python portfolio.py models/ --output portfolio_results -a igu_option=low_emissivity -a snapshot_path=ec3_snapshot.sqlite
+# EPDs are fetched and reduced once in the parent process, every model then runs in a process pool
+# against that shared GWP table instead of querying EC3 again.
+# Runs are report-only unless --save-models is given: the measured models, with their upgraded constructions
+# and stored window results, are then saved next to their results and a portfolio over the saved models
+# only analyzes the windows changed since.
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import openstudio
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+from measure import WindowEnhancement
+
+# glazing queries depend on the number of panes, analyze_construction() knows 1 to 3 panes
+PANE_COUNTS = [1, 2, 3]
+
+PORTFOLIO_FIELDS = ["model", "status", "windows", "area_m2", "glazing_kg_co2e", "frame_kg_co2e", "embodied_carbon_kg_co2e"]
+
+
+class SharedGWPWindowEnhancement(WindowEnhancement):
+    """
+    WindowEnhancement answering its EPD queries from GWP values resolved beforehand,
+    no EC3 client, snapshot or EPD parsing is needed in the worker processes.
+    """
+
+    def __init__(self, gwp_by_query: Dict[tuple, tuple]):
+        super().__init__()
+        self.gwp_by_query = gwp_by_query
+
+    def lookup_epd_queries(self, epd_queries, epd_type, gwp_statistic, snapshot_path="", api_key="", max_concurrent_requests=4, profiler=None):
+        missing = {"gwp_per_kg": None, "gwp_per_m2": None, "gwp_per_m3": None}
+        return [self.gwp_by_query.get(query, (missing, [f"No shared GWP values for {query}"], [])) for query in epd_queries]
+
+
+def model_paths(source: str) -> List[str]:
+    """
+    OSM files to process: every *.osm of a directory, or a manifest listing one path per line,
+    relative paths in a manifest are relative to the manifest.
+    """
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.osm")))
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as manifest:
+        lines = [line.strip() for line in manifest]
+    return [os.path.normpath(os.path.join(base_dir, line)) for line in lines if line and not line.startswith("#")]
+
+
+def measure_argument_map(measure: WindowEnhancement, model, argument_values: Dict[str, str]):
+    """
+    Argument map of the measure with the given values, arguments left out keep their default.
+    """
+    arguments = measure.arguments(model)
+    argument_map = openstudio.measure.convertOSArgumentVectorToMap(arguments)
+    for argument in arguments:
+        if argument.name() in argument_values:
+            value = argument.clone()
+            if not value.setValue(argument_values[argument.name()]):
+                raise ValueError(f"Invalid value for {argument.name()}: {argument_values[argument.name()]}")
+            argument_map[argument.name()] = value
+    return argument_map
+
+
+def resolve_argument_values(argument_values: Dict[str, str]) -> Dict[str, str]:
+    """
+    Fill in the defaults of the measure arguments, as strings.
+    Raises ValueError when a required argument without default is not given.
+    """
+    values = {}
+    missing = []
+    for argument in WindowEnhancement().arguments(openstudio.model.Model()):
+        if argument.hasDefaultValue():
+            values[argument.name()] = argument.defaultValueAsString()
+        elif argument.required() and argument.name() not in argument_values:
+            missing.append(argument.name())
+    if missing:
+        raise ValueError(f"Missing required measure arguments: {', '.join(missing)}")
+    values.update(argument_values)
+    return values
+
+
+def resolve_gwp_table(argument_values: Dict[str, str]) -> Dict[tuple, tuple]:
+    """
+    Resolve once every EPD query the models of a portfolio can issue with these arguments.
+    return: (gwp_by_unit, messages, gwp_per_m3 values) keyed by query, as WindowEnhancement.lookup_epd_queries() returns them
+    """
+    values = resolve_argument_values(argument_values)
+    epd_queries = [("Frame", "AluminiumExtrusions", None, None)]
+    epd_queries += [("Glazing", "InsulatingGlazingUnits", values["igu_option"], num_panes) for num_panes in PANE_COUNTS]
+    lookups = WindowEnhancement().lookup_epd_queries(epd_queries, values["epd_type"], values["gwp_statistic"],
+                                                     values.get("snapshot_path", "").strip(), values.get("api_key", ""),
+                                                     int(values.get("max_concurrent_requests", 4)))
+    return dict(zip(epd_queries, lookups))
+
+
+# GWP table shared by the queries of every model handled by a worker process, set once by the pool initializer
+_shared_gwp_table: Dict[tuple, tuple] = {}
+
+
+def _init_worker(gwp_table: Dict[tuple, tuple]) -> None:
+    global _shared_gwp_table
+    _shared_gwp_table = gwp_table
+
+
+def run_model(model_path: str, argument_values: Dict[str, str], output_dir: str, save_model: bool = False) -> Dict:
+    """
+    Run the measure on one model in its own output folder, the measure writes its result files to the working directory.
+    The changed model is thrown away unless save_model is set, it is then saved as <output_dir>/<model name>/<model name>.osm.
+    return: building totals and status of the model
+    """
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    result = {"model": model_path, "status": "Fail", "errors": []}
+    model_dir = os.path.join(output_dir, name)
+    os.makedirs(model_dir, exist_ok=True)
+    try:
+        model = openstudio.osversion.VersionTranslator().loadModel(openstudio.toPath(model_path))
+        if not model.is_initialized():
+            result["errors"].append(f"Could not load {model_path}")
+            return result
+        model = model.get()
+        measure = SharedGWPWindowEnhancement(_shared_gwp_table)
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        argument_map = measure_argument_map(measure, model, argument_values)
+        # processes run one model at a time, changing directory keeps the outputs of each model apart
+        working_dir = os.getcwd()
+        os.chdir(model_dir)
+        try:
+            measure.run(model, runner, argument_map)
+        finally:
+            os.chdir(working_dir)
+        run_result = runner.result()
+        result["status"] = run_result.value().valueName()
+        result["errors"] = [message.logMessage() for message in run_result.errors()]
+        if save_model and result["status"] == "Success":
+            saved_path = os.path.join(model_dir, name + ".osm")
+            model.save(openstudio.toPath(saved_path), True)
+            result["saved_model"] = saved_path
+        results_path = os.path.join(model_dir, "window_enhancement_results.json")
+        if os.path.exists(results_path):
+            with open(results_path, "r", encoding="utf-8") as file:
+                result.update(json.load(file))
+    except Exception:
+        result["errors"].append(traceback.format_exc())
+    return result
+
+
+def run_portfolio(paths: List[str], argument_values: Dict[str, str], output_dir: str,
+                  processes: Optional[int] = None, save_models: bool = False) -> Tuple[str, str]:
+    """
+    Run the measure on every model and write portfolio_results.json and portfolio_results.csv to output_dir.
+    Source models are never changed, save_models keeps a copy of every measured model, see run_model().
+    return: (json path, csv path)
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    gwp_table = resolve_gwp_table(argument_values)
+    # workers get the resolved values and never need the token or snapshot
+    worker_arguments = dict(argument_values, snapshot_path="", api_key="")
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(gwp_table,)) as pool:
+        results = list(pool.map(run_model, paths, [worker_arguments] * len(paths), [output_dir] * len(paths), [save_models] * len(paths)))
+
+    json_path = os.path.join(output_dir, "portfolio_results.json")
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump({"arguments": worker_arguments, "models": results}, file, indent=1)
+
+    csv_path = os.path.join(output_dir, "portfolio_results.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(PORTFOLIO_FIELDS)
+        for result in results:
+            building = result.get("building", {}).get("Building", {})
+            writer.writerow([result["model"], result["status"]] + [round(building.get(field, 0.0), 6) for field in PORTFOLIO_FIELDS[2:]])
+    return json_path, csv_path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Apply the WindowEnhancement measure to a directory or manifest of OSM files.")
+    parser.add_argument("models", help="directory of .osm files or manifest file listing one .osm path per line")
+    parser.add_argument("--output", default="portfolio_results", help="folder receiving the per-model and consolidated results")
+    parser.add_argument("-a", "--argument", action="append", default=[], metavar="NAME=VALUE", help="measure argument value, repeatable")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes, all cores by default")
+    parser.add_argument("--save-models", action="store_true", help="save every measured model to its output folder, runs are report-only otherwise")
+    args = parser.parse_args(argv)
+
+    argument_values = dict(argument.split("=", 1) for argument in args.argument)
+    paths = model_paths(args.models)
+    json_path, csv_path = run_portfolio(paths, argument_values, args.output, args.processes, args.save_models)
+    print(f"Processed {len(paths)} models, results written to {json_path} and {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
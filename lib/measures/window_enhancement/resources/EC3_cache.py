@@ -0,0 +1,456 @@
+# Local on-disk cache of EC3 API responses
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# keep cached responses for a week and at most 200 MB on disk by default
+DEFAULT_TTL_DAYS = 7.0
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+# writes between two scans of the cache folder, entries written by other processes are only counted at a scan
+EVICT_INTERVAL = 100
+# lock files left behind by a process that died while holding them are removed after an hour
+STALE_LOCK_SECONDS = 3600.0
+
+# date filter emitted by generate_url(), e.g. epd__date_validity_ends%3A%20%3E%20%222025-04-18%22
+_VALIDITY_DATE_PATTERN = re.compile(r"(epd__date_validity_ends(?:%3A|:)(?:%20| )*(?:%3E|>)(?:%20| )*(?:%22|\"))(\d{4}-\d{2}-\d{2})")
+# paging parameters of generate_url(), e.g. page_number=2
+_PAGE_PATTERN = re.compile(r"\b(page_number|page_size)=\d+")
+
+
+def default_cache_dir() -> str:
+    """
+    Cache folder, the EC3_CACHE_DIR environment variable overrides the per-user default.
+    """
+    return os.environ.get("EC3_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "openstudio-ee", "ec3"))
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize an EC3 query url so that equivalent queries share one cache entry.
+    The epd__date_validity_ends date changes every day, it is replaced by a placeholder
+    and handled through the entry expiry instead.
+    :param url: url generated by generate_url()
+    :return: normalized url
+    """
+    url = _VALIDITY_DATE_PATTERN.sub(r"\1{date}", url.strip())
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def query_url(url: str) -> str:
+    """
+    Url standing for every result page of a query, whatever page and page size url points to.
+    The pages of one query are cached together under it, so they share one expiry and come from one walk.
+    """
+    return _PAGE_PATTERN.sub(r"\1=all", url)
+
+
+def cache_key(url: str) -> str:
+    """
+    Content address of a query: sha256 of its normalized url.
+    """
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def try_lock_file(file) -> bool:
+    """
+    Take an exclusive lock on an open file without blocking.
+    :return: True when the lock was taken, False when another holder has it
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_file(file) -> None:
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def earliest_validity_end(epd_data: List[Any]) -> Optional[float]:
+    """
+    Earliest EPD validity end date found in a response, as a timestamp.
+    Once this date has passed the live query would no longer return that EPD.
+    """
+    earliest = None
+    for epd in epd_data:
+        if not isinstance(epd, dict):
+            continue
+        value = epd.get("date_validity_ends")
+        if value is None and isinstance(epd.get("epd"), dict):
+            value = epd["epd"].get("date_validity_ends")
+        if not value:
+            continue
+        try:
+            timestamp = datetime.strptime(str(value)[:10], "%Y-%m-%d").timestamp()
+        except ValueError:
+            continue
+        if earliest is None or timestamp < earliest:
+            earliest = timestamp
+    return earliest
+
+
+class EPDCache:
+    """
+    Content-addressed cache of EC3 responses stored as one JSON file per query.
+    Queries walked page by page are stored as one entry under their query_url(), holding every page.
+
+    Entries are written to a temporary file and atomically renamed into place so
+    concurrent readers never see a partial entry and concurrent writers of the same
+    query simply replace each other. File modification times record the last access
+    and the least recently used entries are evicted once the cache exceeds max_bytes.
+    The size of the cache is tracked across writes, the folder is only scanned every EVICT_INTERVAL writes
+    or when the tracked size goes over max_bytes.
+    query_lock() lets concurrent runs on one machine coalesce identical queries into one request.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl_days: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        if ttl_days is None:
+            ttl_days = float(os.environ.get("EC3_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("EC3_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.ttl_seconds = ttl_days * 24 * 3600
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # threads of this process wait on an in-memory lock per query before taking its lock file,
+        # [lock, number of threads using it], dropped when the last thread is done with the query
+        self._query_locks = {}
+        self._query_locks_guard = threading.Lock()
+        # bytes on disk at the last scan plus the bytes written since, None until the first scan
+        self._tracked_bytes = None
+        self._writes_since_scan = 0
+        self._size_lock = threading.Lock()
+
+    def path(self, url: str) -> str:
+        """
+        File holding the entry of a query, sharded by the first two hex digits of its key.
+        """
+        key = cache_key(url)
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, url: str, allow_stale: bool = False) -> Optional[List[Any]]:
+        """
+        Cached response of a query.
+        :param url: url generated by generate_url()
+        :param allow_stale: also return expired entries, used when the API can not be reached
+        :return: list of EPD dictionaries or None on a miss
+        """
+        path = self.path(url)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if not allow_stale and entry.get("expires_at", 0) <= time.time():
+            self.misses += 1
+            return None
+
+        # record the access for LRU eviction, another process may have evicted the entry meanwhile
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry.get("data")
+
+    def set(self, url: str, epd_data: List[Any]) -> None:
+        """
+        Store the response of a query.
+        The entry expires after the TTL or when its first EPD reaches its validity end date, whichever comes first.
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        validity_end = earliest_validity_end(epd_data)
+        if validity_end is not None:
+            expires_at = min(expires_at, validity_end)
+        entry = {"url": normalize_url(url), "created_at": now, "expires_at": expires_at, "data": epd_data}
+
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                json.dump(entry, file)
+                written_bytes = file.tell()
+            self.replace(temp_path, path, written_bytes)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def writer(self, url: str) -> "EntryWriter":
+        """
+        Writer storing the response of a query page by page, see EntryWriter.
+        """
+        return EntryWriter(self, url)
+
+    def replace(self, temp_path: str, path: str, written_bytes: int) -> None:
+        """
+        Move a written entry into place and account for its size, scanning the folder when it is due.
+        """
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except OSError:
+            replaced_bytes = 0
+        os.replace(temp_path, path)
+
+        with self._size_lock:
+            self._writes_since_scan += 1
+            if self._tracked_bytes is not None:
+                self._tracked_bytes += written_bytes - replaced_bytes
+            scan = (self._tracked_bytes is None or self._tracked_bytes > self.max_bytes
+                    or self._writes_since_scan >= EVICT_INTERVAL)
+        if scan:
+            self.evict()
+
+    @contextlib.contextmanager
+    def query_lock(self, url: str, timeout: Optional[float] = None, poll_interval: float = 0.05):
+        """
+        Hold the lock of a query across threads and processes sharing this cache folder,
+        so identical concurrent queries wait for a single upstream request and then read its cached response.
+        The lock is a file next to the entry, released by the operating system if its holder dies.
+        The holder removes the file before releasing it, a waiter that locked a removed file tries again.
+        :param timeout: seconds to wait for the lock, forever when None
+        :return: context manager yielding True when the lock is held, False when the wait timed out
+        """
+        key = cache_key(url)
+        with self._query_locks_guard:
+            thread_lock = self._query_locks.setdefault(key, [threading.Lock(), 0])
+            thread_lock[1] += 1
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            if not thread_lock[0].acquire(timeout=-1 if timeout is None else timeout):
+                yield False
+                return
+            try:
+                with self.lock_file(key, deadline, poll_interval) as acquired:
+                    yield acquired
+            finally:
+                thread_lock[0].release()
+        finally:
+            with self._query_locks_guard:
+                thread_lock[1] -= 1
+                if thread_lock[1] == 0:
+                    del self._query_locks[key]
+
+    @contextlib.contextmanager
+    def lock_file(self, key: str, deadline: Optional[float], poll_interval: float):
+        """
+        Exclusive lock on the lock file of a query, polled until deadline.
+        :return: context manager yielding True when the lock is held
+        """
+        lock_path = os.path.join(self.cache_dir, key[:2], key + ".lock")
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        while True:
+            with open(lock_path, "a+") as lock_file:
+                acquired = try_lock_file(lock_file)
+                while not acquired and (deadline is None or time.monotonic() < deadline):
+                    time.sleep(poll_interval)
+                    acquired = try_lock_file(lock_file)
+                if not acquired:
+                    yield False
+                    return
+                # the previous holder removed the file while this one waited on it
+                try:
+                    current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+                except OSError:
+                    current = False
+                if current:
+                    try:
+                        yield True
+                    finally:
+                        try:
+                            os.remove(lock_path)
+                        except OSError:  # Windows does not remove open files, evict() does later
+                            pass
+                        unlock_file(lock_file)
+                    return
+                unlock_file(lock_file)
+
+    def entries(self, suffix: str = ".json") -> List[os.DirEntry]:
+        """
+        All entry files currently in the cache, or its lock files with suffix ".lock".
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            entries.extend(entry for entry in os.scandir(shard.path) if entry.name.endswith(suffix))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove lock files left behind by dead processes and least recently used entries until the cache fits in max_bytes.
+        :return: number of removed entries
+        """
+        now = time.time()
+        total_bytes = 0
+        for lock in self.entries(".lock"):
+            try:
+                stat = lock.stat()
+                if stat.st_mtime < now - STALE_LOCK_SECONDS:
+                    os.remove(lock.path)
+                else:
+                    total_bytes += stat.st_size
+            except OSError:
+                continue
+
+        sized_entries = []
+        for entry in self.entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            sized_entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(sized_entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+        with self._size_lock:
+            self._tracked_bytes = total_bytes
+            self._writes_since_scan = 0
+        return removed
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        for entry in self.entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        with self._size_lock:
+            self._tracked_bytes = None
+
+
+class EntryWriter:
+    """
+    Entry of a query written page by page as the pages are fetched, without holding them all in memory.
+    Nothing is visible to readers until commit(), then every page is stored at once with one expiry:
+    the TTL or the first validity end date among all pages, whichever comes first.
+    An entry that is not committed, e.g. because a page failed, is discarded.
+    """
+
+    def __init__(self, cache: EPDCache, url: str):
+        self.cache = cache
+        self.path = cache.path(url)
+        self.created_at = time.time()
+        self.expires_at = self.created_at + cache.ttl_seconds
+        self.count = 0
+        self.committed = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file_descriptor, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        self.file = os.fdopen(file_descriptor, "w", encoding="utf-8")
+        # the expiry is only known once every page is written, it ends the JSON object
+        self.file.write(f'{{"url": {json.dumps(normalize_url(url))}, "created_at": {json.dumps(self.created_at)}, "data": [')
+
+    def add(self, epd_data: List[Any]) -> None:
+        validity_end = earliest_validity_end(epd_data)
+        if validity_end is not None:
+            self.expires_at = min(self.expires_at, validity_end)
+        for epd in epd_data:
+            if self.count:
+                self.file.write(", ")
+            json.dump(epd, self.file)
+            self.count += 1
+
+    def commit(self) -> None:
+        self.file.write(f'], "expires_at": {json.dumps(self.expires_at)}}}')
+        written_bytes = self.file.tell()
+        self.file.close()
+        self.cache.replace(self.temp_path, self.path, written_bytes)
+        self.committed = True
+
+    def discard(self) -> None:
+        """
+        Drop the entry unless it was committed.
+        """
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class MemoryCache:
+    """
+    Bounded in-process cache of values derived from EC3 responses, safe to use from worker threads.
+    Each entry expires at its own time, like the on-disk entry it was derived from,
+    and the least recently used entries are dropped once more than max_entries are held.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key) -> Any:
+        """
+        :return: value stored under key, None when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at: Optional[float] = None) -> None:
+        """
+        Store value under key until the expires_at timestamp, for the life of the process when None.
+        """
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
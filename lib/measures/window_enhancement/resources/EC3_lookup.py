@@ -1,46 +1,81 @@
 # EC3 API Lookup Script
+import functools
 import json
+import logging
 import re
-from typing import Dict, Any, List
-from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
 import configparser
 from datetime import datetime
-import numpy as np
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
+if __package__ in (None, ""):
+    # allow running this file directly, sibling modules are imported through the resources package
+    sys.path.insert(0, os.path.dirname(script_dir))
+from resources.EC3_cache import EPDCache, query_url
+from resources.gwp_statistics import GWPStatistics
+from resources.profiling import Profiler
 repo_root = os.path.abspath(os.path.join(script_dir, "../../../.."))
 config_path = os.path.join(repo_root, "config.ini")
 
-# this measure doesn't function without EC3 token and required Python libraries installed
-if not os.path.exists(config_path):
-    raise FileNotFoundError(f"Config file not found: {config_path}. Please setup your EC3 token before attempting to run this measure.")
-
-# load custom libraries after confirming if config.ini 
-import requests
-
-config = configparser.ConfigParser()
-config.read(config_path)
-API_TOKEN= config["EC3_API_TOKEN"]["API_TOKEN"]
-
-# #find material_name by category
-# material_category = {"concrete":{"ReadyMix","PrecastConcrete","CementGrout","FlowableFill"},
-#                      "masonry":{"Brick", "CMU"},
-#                      "steel":{"RebarSteel","WireMeshSteel","ColdFormedSteel","StructuralSteel"},
-#                      "aluminum":{"AluminiumExtrusions"},
-#                      "wood":{"PrefabricatedWood","DimensionLumbe","SheathingPanels","CompositeLumber","MassTimber","NonStructuralWood"},
-#                      "sheathing":{"GypsumSheathingBoard","CementitiousSheathingBoard"},
-#                      "thermal_moisture_protection":{"Insulation","MembraneRoofing"},
-#                      "cladding":{"RoofPanels","InsulatedRoofPanels","WallPanels","InsulatedWallPanels"},
-#                      "openings":{"glazing":["InsulatingGlazingUnits","FlatGlassPanes","ProcessedNonInsulatingGlassPanes"],
-#                                  "extrusions":["AluminiumExtrusions"]},
-#                      "finishes":{"CementBoard","Gypsum","Tiling","CeilingPanel","Flooring","PaintingAndCoating"}
-#                      }
+# base of every EC3 API url, the EC3_API_URL environment variable points the measure to another server,
+# e.g. the local stand-in of resources/EC3_mock_server.py
+EC3_API_URL = "https://api.buildingtransparency.org/api"
+
+logger = logging.getLogger(__name__)
+
+def load_api_token(path=config_path):
+    """
+    Read the EC3 token from config.ini, only needed when the EC3 API is called.
+    Runs answered from an offline snapshot do not need it.
+    """
+    # live lookups don't function without EC3 token and required Python libraries installed
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Config file not found: {path}. Please setup your EC3 token before attempting to run this measure.")
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config["EC3_API_TOKEN"]["API_TOKEN"]
+
+# find material_name by category, every category is crawled by the prefetch command line of main()
+EC3_CATEGORIES = {"concrete": ["ReadyMix", "PrecastConcrete", "CementGrout", "FlowableFill"],
+                  "masonry": ["Brick", "CMU"],
+                  "steel": ["RebarSteel", "WireMeshSteel", "ColdFormedSteel", "StructuralSteel"],
+                  "aluminum": ["AluminiumExtrusions"],
+                  "wood": ["PrefabricatedWood", "DimensionLumber", "SheathingPanels", "CompositeLumber", "MassTimber", "NonStructuralWood"],
+                  "sheathing": ["GypsumSheathingBoard", "CementitiousSheathingBoard"],
+                  "thermal_moisture_protection": ["Insulation", "MembraneRoofing"],
+                  "cladding": ["RoofPanels", "InsulatedRoofPanels", "WallPanels", "InsulatedWallPanels"],
+                  "openings": {"glazing": ["InsulatingGlazingUnits", "FlatGlassPanes", "ProcessedNonInsulatingGlassPanes"],
+                               "extrusions": ["AluminiumExtrusions"]},
+                  "finishes": ["CementBoard", "Gypsum", "Tiling", "CeilingPanel", "Flooring", "PaintingAndCoating"]
+                  }
 # for testing use, do not delete
 material_category = {
                      "test":["InsulatingGlazingUnits"]
                      }
 
+def category_material_names(categories=EC3_CATEGORIES):
+    """
+    EC3 material names of every category, subcategories flattened and each name listed once.
+    return: list of material names keyed by category
+    """
+    names = {}
+    for category, members in categories.items():
+        if isinstance(members, dict):
+            members = [name for subcategory in members.values() for name in subcategory]
+        names[category] = list(dict.fromkeys(members))
+    return names
+
+def api_url():
+    """
+    Base url of the EC3 API, EC3_API_URL unless overridden by the environment.
+    """
+    return os.environ.get("EC3_API_URL", EC3_API_URL).rstrip("/")
+
 def generate_url(material_name, endpoint ="materials", page_number=1, page_size=250, jurisdiction="021", date=None, option=None, boolean="yes",
                   glass_panes=None, epd_type="Product"):
     '''
@@ -49,7 +84,7 @@ def generate_url(material_name, endpoint ="materials", page_number=1, page_size=
     if date is None:
         date = datetime.today().strftime("%Y-%m-%d")  # use today's date as default
     url = (
-        f"https://api.buildingtransparency.org/api/{endpoint}"
+        f"{api_url()}/{endpoint}"
         f"?page_number={page_number}&page_size={page_size}"
         f"&mf=!EC3%20search(%22{material_name}%22)%20WHERE%20"
         f"%0A%20%20jurisdiction%3A%20IN(%22{jurisdiction}%22)%20AND%0A%20%20"
@@ -70,173 +105,500 @@ def generate_url(material_name, endpoint ="materials", page_number=1, page_size=
     
     return url
 
-def fetch_epd_data(url,api_token):
+class IncompleteQueryError(Exception):
     """
-    input url address generted by generate_url()
-    Fetch EPD data from the EC3 API.
-    return: Parsed JSON response or empty list on failure.
+    A result page after the first could not be fetched, the EPDs already yielded are only part of the query.
     """
-    try: 
-        print(f"Fetching data from URL: {url}")  # Log the URL being fetched
-        # API configuration
-        HEADERS = {"Accept": "application/json", "Authorization": "Bearer " + api_token}
-        response = requests.get(url, headers=HEADERS, verify=False)
-        response.raise_for_status() # HTTPError if failure 
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from {url}: {e}")
-        if 'response' in locals():  # Check if response was defined
-            print(f"Response content: {response.text}")
-        else:
-            print("No response content available.")
-        return []
 
-def parse_product_epd(epd: Dict[str, Any]) -> Dict[str, Any]:
+class EC3Client:
     """
-    Parse GWP data for a given EPD.
-    :param epd: EPD dictionary
-    :return: Parsed GWP data
+    Reusable EC3 API client.
+    Holds one pooled HTTP session with the authorization header set once, so consecutive requests
+    reuse TCP/TLS connections. Requests time out instead of hanging and 429/5xx responses are retried
+    with exponential backoff, honouring the Retry-After header sent by the API.
+    Independent queries can be sent concurrently by up to max_workers threads, requests_per_second
+    spaces out request starts across all threads to stay under the EC3 rate limit.
+    With a cache, identical queries in flight in other threads or processes are awaited instead of repeated.
+    Request counts, cache hits, bytes downloaded and the time spent in HTTP and JSON decoding are recorded in profiler.
     """
-    # initialize parameters and dictionary
-    parsed_data = {}
-    gwp_per_m3 = 0.0
-    gwp_per_m2 = 0.0
-    gwp_per_kg = 0.0
-
-    # extract information from EPD's json repsonse
-    declared_unit = epd.get("declared_unit")
-    thickness = epd.get("thickness")
-    gwp_per_declared_unit = epd.get("gwp")
-    mass_per_declared_unit = epd.get("mass_per_declared_unit")
-    density = epd.get("density")
-    gwp_per_kg = epd.get("gwp_per_kg")
-    epd_name = epd.get('name')
-    description = epd.get('description')
-    original_ec3_link = epd['manufacturer']['original_ec3_link']
-
-    # Per mass
-    if gwp_per_kg != None:
-        gwp_per_kg = extract_numeric_value(gwp_per_kg)
-
-    elif gwp_per_kg == None and "t" in declared_unit:
-        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_kg = gwp_per_kg/1000 # convert from t to kg
-
-    elif gwp_per_kg == None and "kg" in declared_unit:
-        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit)
 
-    elif mass_per_declared_unit != None and gwp_per_kg == None and not any(unit in declared_unit for unit in ["kg", "t"]):
-        gwp_per_kg = divide(gwp_per_declared_unit, mass_per_declared_unit)
-
-    # Per volume
-    if "m3" in declared_unit:
-        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit)
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_token, cache=None, connect_timeout=5.0, read_timeout=60.0, max_retries=3, backoff_factor=0.5,
+                 pool_size=10, verify=True, session=None, max_workers=4, requests_per_second=None, coalesce_timeout=None, profiler=None):
+        self.api_token = api_token
+        self.cache = cache
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.timeout = (connect_timeout, read_timeout)
+        # longest wait for an identical request in flight elsewhere, by default as long as that request may retry
+        if coalesce_timeout is None:
+            coalesce_timeout = (connect_timeout + read_timeout) * (max_retries + 1)
+        self.coalesce_timeout = coalesce_timeout
+        self.verify = verify
+        self.max_workers = max(1, max_workers)
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._throttle_lock = threading.Lock()
+        self._next_request_time = 0.0
+        # every worker thread needs its own pooled connection
+        pool_size = max(pool_size, self.max_workers)
+        self.session = session if session is not None else self.create_session(max_retries, backoff_factor, pool_size)
+        self.session.headers.update({"Accept": "application/json", "Authorization": "Bearer " + api_token})
+
+    def create_session(self, max_retries, backoff_factor, pool_size):
+        """
+        requests session with a connection pool and retry policy mounted for https.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=self.RETRY_STATUS_CODES,
+                      allowed_methods=["GET"], respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def throttle(self):
+        """
+        Wait until the next request is allowed to start under requests_per_second.
+        """
+        if not self.min_interval:
+            return
+        with self._throttle_lock:
+            wait = self._next_request_time - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_request_time = time.monotonic() + self.min_interval
+
+    def fetch_epd_data(self, url, cache=None):
+        """
+        input url address generted by generate_url()
+        Fetch EPD data from the EC3 API.
+        cache: EPDCache overriding the client cache, repeated queries are answered from disk and stale entries are used when the API can not be reached
+        return: Parsed JSON response or empty list on failure.
+        """
+        cache = self.cache if cache is None else cache
+        if cache is None:
+            return self.request_epd_data(url)
+        with self.profiler.phase("cache_read"):
+            cached_data = cache.get(url)
+        if cached_data is not None:
+            self.profiler.count("cache_hits")
+            return cached_data
+        # identical queries sent at the same time by other threads or measure runs sharing the cache
+        # wait for the first one and read its cached response instead of hitting the rate limit together
+        with cache.query_lock(url, self.coalesce_timeout) as acquired:
+            if not acquired:
+                logger.warning("Timed out waiting for a concurrent request of %s, fetching it again.", url)
+            with self.profiler.phase("cache_read"):
+                cached_data = cache.get(url)
+            if cached_data is not None:
+                self.profiler.count("coalesced_requests")
+                return cached_data
+            return self.request_epd_data(url, cache)
+
+    def request_page(self, url):
+        """
+        Send one query to the EC3 API.
+        return: Parsed JSON response, None on failure.
+        """
+        # requests is only imported once a live lookup is needed, snapshot and cached runs never load it
+        import requests
+
+        try:
+            logger.debug("Fetching data from URL: %s", url)  # Log the URL being fetched
+            self.throttle()
+            self.profiler.count("requests")
+            with self.profiler.phase("http"):
+                response = self.session.get(url, timeout=self.timeout, verify=self.verify)
+                response.raise_for_status() # HTTPError if failure
+                self.profiler.count("bytes_downloaded", len(response.content))
+            with self.profiler.phase("json_decode"):
+                return response.json()
+        except requests.exceptions.RequestException as e:
+            self.profiler.count("request_failures")
+            logger.warning("Error fetching data from %s: %s", url, e)
+            if 'response' in locals():  # Check if response was defined
+                logger.debug("Response content: %s", response.text)
+            else:
+                logger.debug("No response content available.")
+            return None
+
+    def request_epd_data(self, url, cache=None):
+        """
+        Send one query to the EC3 API and store its response in cache, an empty result too,
+        so queries without EPDs are not requested again before they expire.
+        return: Parsed JSON response, stale cached response or empty list on failure.
+        """
+        epd_data = self.request_page(url)
+        if epd_data is None:
+            if cache is not None:
+                stale_data = cache.get(url, allow_stale=True)
+                if stale_data is not None:
+                    logger.warning("Using expired cached response instead.")
+                    return stale_data
+            return []
+        if cache is not None:
+            with self.profiler.phase("cache_write"):
+                cache.set(url, epd_data)
+        return epd_data
+
+    def iter_epd_data(self, url, cache=None, page_size=250):
+        """
+        input url address generted by generate_url()
+        Walk every result page of an EC3 query and yield EPDs one at a time,
+        only one page is held in memory so categories of any size can be streamed into the parsers.
+        With a cache, every page of the query is stored in one entry under query_url() once the walk completes,
+        so a later walk is answered entirely by one earlier walk, never by pages of different walks.
+        return: generator of EPD dictionaries, the stale cached response or nothing when the first page fails
+        raise: IncompleteQueryError when a later page fails, the query is never silently cut short
+        """
+        cache = self.cache if cache is None else cache
+        if cache is None:
+            yield from self.walk_pages(url, page_size)
+            return
+        whole_url = query_url(url)
+        with self.profiler.phase("cache_read"):
+            cached_data = cache.get(whole_url)
+        if cached_data is not None:
+            self.profiler.count("cache_hits")
+            yield from cached_data
+            return
+        # identical walks started at the same time by other threads or measure runs sharing the cache
+        # wait for the first one and read its cached response instead of hitting the rate limit together
+        with cache.query_lock(whole_url, self.coalesce_timeout) as acquired:
+            if not acquired:
+                logger.warning("Timed out waiting for a concurrent request of %s, fetching it again.", url)
+            with self.profiler.phase("cache_read"):
+                cached_data = cache.get(whole_url)
+            if cached_data is not None:
+                self.profiler.count("coalesced_requests")
+                yield from cached_data
+                return
+            writer = cache.writer(whole_url)
+            try:
+                yield from self.walk_pages(url, page_size, writer)
+            finally:
+                writer.discard()
+            if writer.committed or writer.count:
+                return
+            # the first page failed
+            stale_data = cache.get(whole_url, allow_stale=True)
+            if stale_data is not None:
+                logger.warning("Using expired cached response instead.")
+                yield from stale_data
+
+    def walk_pages(self, url, page_size=250, writer=None):
+        """
+        Request every result page of a query and yield its EPDs, a short page is the last one.
+        Pages are added to writer, committed once the last page is in.
+        Nothing is yielded when the first page fails, IncompleteQueryError is raised when a later one does.
+        """
+        page_number = 1
+        while True:
+            page = self.request_page(set_page(url, page_number, page_size))
+            if not isinstance(page, list):
+                if page_number > 1:
+                    raise IncompleteQueryError(f"Page {page_number} of {url} could not be fetched")
+                return
+            if writer is not None:
+                with self.profiler.phase("cache_write"):
+                    writer.add(page)
+            yield from page
+            # a short page is the last one
+            if len(page) < page_size:
+                if writer is not None:
+                    with self.profiler.phase("cache_write"):
+                        writer.commit()
+                return
+            page_number += 1
+
+    def map_concurrent(self, function, items):
+        """
+        Apply function to every item using up to max_workers threads.
+        return: list of results in the order of items
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(function, items))
+
+    def fetch_many(self, urls, cache=None):
+        """
+        Fetch every page of several queries concurrently.
+        return: dictionary of EPD list keyed by url
+        """
+        urls = list(dict.fromkeys(urls))
+        results = self.map_concurrent(lambda url: list(self.iter_epd_data(url, cache)), urls)
+        return dict(zip(urls, results))
+
+# clients shared by the module level helpers, one per API token
+_clients = {}
+
+def get_client(api_token):
+    """
+    Shared EC3Client of an API token, created on first use.
+    """
+    if api_token not in _clients:
+        _clients[api_token] = EC3Client(api_token)
+    return _clients[api_token]
 
-    elif "cf" in declared_unit:
-        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_m3 = gwp_per_m3 * 35.3147 # convert from cubic feet to m3
+def fetch_epd_data(url,api_token,cache=None):
+    """
+    input url address generted by generate_url()
+    Fetch EPD data from the EC3 API through the shared client of api_token.
+    return: Parsed JSON response or empty list on failure.
+    """
+    return get_client(api_token).fetch_epd_data(url, cache)
 
-    elif "m2" in declared_unit and thickness and "mm" in thickness:
-        gwp_per_m2 = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_m3 = gwp_per_m2/(extract_numeric_value(thickness)/1000)
+def set_page(url, page_number, page_size=None):
+    """
+    Point a url generated by generate_url() to another result page.
+    """
+    url = re.sub(r"page_number=\d+", f"page_number={page_number}", url, count=1)
+    if page_size is not None:
+        url = re.sub(r"page_size=\d+", f"page_size={page_size}", url, count=1)
+    return url
 
-    elif density and "kg / m3" in density and gwp_per_kg:
-        gwp_per_m3 = multiply(gwp_per_kg, density)
+def iter_epd_data(url, api_token, cache=None, page_size=250):
+    """
+    input url address generted by generate_url()
+    Walk every result page of an EC3 query through the shared client of api_token.
+    return: generator of EPD dictionaries, empty on failure.
+    """
+    return get_client(api_token).iter_epd_data(url, cache, page_size)
 
-    # Per area
-    if "m2" in declared_unit:
-        gwp_per_m2 = divide(gwp_per_declared_unit, declared_unit)
+def product_gwp_values(epd: Dict[str, Any]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """
+    Derive the GWP per functional unit of a product EPD.
+    :param epd: EPD dictionary
+    :return: (gwp_per_kg, gwp_per_m2, gwp_per_m3), None when a value can not be derived
+    """
+    gwp_per_kg = None
+    gwp_per_m2 = None
+    gwp_per_m3 = None
 
-    elif "sf" in declared_unit:
-        gwp_per_m2 = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_m2 = gwp_per_m2 * 10.7639 # convert from square feet to m2
+    # extract information from EPD's json repsonse, every quantity in canonical units
+    declared_amount, declared_unit = parse_quantity(epd.get("declared_unit"))
+    gwp, _ = parse_quantity(epd.get("gwp"))
+    thickness, thickness_unit = parse_quantity(epd.get("thickness"))
+    mass_per_declared_unit, mass_unit = parse_quantity(epd.get("mass_per_declared_unit"))
+    density, density_unit = parse_quantity(epd.get("density"))
+    reported_gwp_per_kg, _ = parse_quantity(epd.get("gwp_per_kg"))
 
-    elif "m3" in declared_unit and thickness and "mm" in thickness:
-        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_m2 = gwp_per_m3 * (extract_numeric_value(thickness)/1000)
-    
-    parsed_data["epd_name"] = epd_name
-    parsed_data["declared_unit"] = declared_unit
-    parsed_data["gwp_per_declared_unit"] = gwp_per_declared_unit
-    parsed_data["mass_per_declared_unit"] = mass_per_declared_unit
-    parsed_data["thickness"] = thickness
-    parsed_data["density"] = density
-    parsed_data["gwp_per_m3 (kg CO2 eq/m3)"] = gwp_per_m3
-    parsed_data["gwp_per_m2 (kg CO2 eq/m2)"] = gwp_per_m2
-    parsed_data["gwp_per_kg (kg CO2 eq/kg)"] = gwp_per_kg 
-    parsed_data["original_ec3_link"] = original_ec3_link
-    parsed_data["description"] = description
+    gwp_per_declared_unit = gwp / declared_amount if gwp is not None and declared_amount else None
+    has_thickness = thickness_unit == "m" and bool(thickness)
 
-    return parsed_data
+    # Per mass
+    if reported_gwp_per_kg is not None:
+        gwp_per_kg = reported_gwp_per_kg
+    elif declared_unit == "kg":
+        gwp_per_kg = gwp_per_declared_unit
+    elif gwp_per_declared_unit is not None and mass_unit == "kg" and mass_per_declared_unit:
+        gwp_per_kg = gwp_per_declared_unit / mass_per_declared_unit
+
+    # Per area and volume
+    if declared_unit == "m3":
+        gwp_per_m3 = gwp_per_declared_unit
+        if has_thickness and gwp_per_m3 is not None:
+            gwp_per_m2 = gwp_per_m3 * thickness
+    elif declared_unit == "m2":
+        gwp_per_m2 = gwp_per_declared_unit
+        if has_thickness and gwp_per_m2 is not None:
+            gwp_per_m3 = gwp_per_m2 / thickness
+
+    if gwp_per_m3 is None and density_unit == "kg/m3" and density and gwp_per_kg:
+        gwp_per_m3 = gwp_per_kg * density
+
+    return gwp_per_kg, gwp_per_m2, gwp_per_m3
 
-def parse_industrial_epd(epd: Dict[str, Any]) -> Dict[str, Any]:
+def parse_product_epd(epd: Dict[str, Any]) -> Dict[str, Any]:
     """
     Parse GWP data for a given EPD.
     :param epd: EPD dictionary
     :return: Parsed GWP data
     """
+    gwp_per_kg, gwp_per_m2, gwp_per_m3 = product_gwp_values(epd)
 
     parsed_data = {}
-    gwp_per_m3 = 0.0
-    gwp_per_m2 = 0.0
-    gwp_per_kg = 0.0
-
-    declared_unit = epd.get("declared_unit")
-    gwp_per_kg = epd.get("gwp_per_kg")
-    gwp_per_declared_unit = epd.get("gwp")
-    epd_name = epd.get('name')
-    original_ec3_link = epd.get('original_ec3_link')
-    description = epd.get('description')
-    density_min = epd.get('density_min')
-    density_max = epd.get('density_max')
-    area = epd.get('area')
-
-    if density_min is not None and density_max is not None:
-        density_avg = (extract_numeric_value(density_max) + extract_numeric_value(density_min))/2
-    elif density_min is not None:
-        density_avg = extract_numeric_value(density_min)
-    elif density_max is not None:
-        density_avg = extract_numeric_value(density_max)
-    else:
-        density_avg = None
+    parsed_data["epd_name"] = epd.get('name')
+    parsed_data["declared_unit"] = epd.get("declared_unit")
+    parsed_data["gwp_per_declared_unit"] = epd.get("gwp")
+    parsed_data["mass_per_declared_unit"] = epd.get("mass_per_declared_unit")
+    parsed_data["thickness"] = epd.get("thickness")
+    parsed_data["density"] = epd.get("density")
+    parsed_data["gwp_per_m3 (kg CO2 eq/m3)"] = gwp_per_m3 if gwp_per_m3 is not None else 0.0
+    parsed_data["gwp_per_m2 (kg CO2 eq/m2)"] = gwp_per_m2 if gwp_per_m2 is not None else 0.0
+    parsed_data["gwp_per_kg (kg CO2 eq/kg)"] = gwp_per_kg
+    parsed_data["original_ec3_link"] = epd['manufacturer']['original_ec3_link']
+    parsed_data["description"] = epd.get('description')
+
+    return parsed_data
 
+def industrial_gwp_values(epd: Dict[str, Any]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """
+    Derive the GWP per functional unit of an industry-wide EPD.
+    :param epd: EPD dictionary
+    :return: (gwp_per_kg, gwp_per_m2, gwp_per_m3), None when a value can not be derived
+    """
+    gwp_per_m3 = None
     # Per area (stop using this becasue the area value is not sensible)
     # if "m^2" in area:
     #     gwp_per_m2 = extract_numeric_value(gwp_per_declared_unit)/extract_numeric_value(area)
+    gwp_per_m2 = None
+
+    declared_amount, declared_unit = parse_quantity(epd.get("declared_unit"))
+    gwp, _ = parse_quantity(epd.get("gwp"))
+    gwp_per_kg, _ = parse_quantity(epd.get("gwp_per_kg"))
+    densities = [density for density, unit in (parse_quantity(epd.get('density_min')), parse_quantity(epd.get('density_max')))
+                 if density is not None and unit in ("kg/m3", "")]
+    density_avg = sum(densities) / len(densities) if densities else None
 
     # Per mass
-    if "t" in declared_unit:
-        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit)
-        gwp_per_kg = gwp_per_kg / 1000 # convert to kg
-    elif "kg" in declared_unit:
-        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit)
+    if declared_unit == "kg" and gwp is not None and declared_amount:
+        gwp_per_kg = gwp / declared_amount
 
     # Per volume
     if gwp_per_kg != None and density_avg != None:
         gwp_per_m3 = gwp_per_kg * density_avg
-        
-    parsed_data["epd_name"] = epd_name
-    parsed_data["declared_unit"] = declared_unit
-    parsed_data["gwp_per_declared_unit"] = gwp_per_declared_unit
-    parsed_data["density_min"] = density_min
-    parsed_data["density_max"] = density_max
-    parsed_data["area"] = area
-    parsed_data["gwp_per_m3 (kg CO2 eq/m3)"] = gwp_per_m3
-    parsed_data["gwp_per_m2 (kg CO2 eq/m2)"] = gwp_per_m2
-    parsed_data["gwp_per_kg (kg CO2 eq/kg)"] = gwp_per_kg 
-    parsed_data["original_ec3_link"] = original_ec3_link
-    parsed_data["description"] = description
+
+    return gwp_per_kg, gwp_per_m2, gwp_per_m3
+
+def parse_industrial_epd(epd: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse GWP data for a given EPD.
+    :param epd: EPD dictionary
+    :return: Parsed GWP data
+    """
+    gwp_per_kg, gwp_per_m2, gwp_per_m3 = industrial_gwp_values(epd)
+
+    parsed_data = {}
+    parsed_data["epd_name"] = epd.get('name')
+    parsed_data["declared_unit"] = epd.get("declared_unit")
+    parsed_data["gwp_per_declared_unit"] = epd.get("gwp")
+    parsed_data["density_min"] = epd.get('density_min')
+    parsed_data["density_max"] = epd.get('density_max')
+    parsed_data["area"] = epd.get('area')
+    parsed_data["gwp_per_m3 (kg CO2 eq/m3)"] = gwp_per_m3 if gwp_per_m3 is not None else 0.0
+    parsed_data["gwp_per_m2 (kg CO2 eq/m2)"] = gwp_per_m2 if gwp_per_m2 is not None else 0.0
+    parsed_data["gwp_per_kg (kg CO2 eq/kg)"] = gwp_per_kg
+    parsed_data["original_ec3_link"] = epd.get('original_ec3_link')
+    parsed_data["description"] = epd.get('description')
 
     return parsed_data
 
+# GWP values derived from an EPD, in the order product_gwp_values() and industrial_gwp_values() return them
+FUNCTIONAL_UNITS = ("gwp_per_kg", "gwp_per_m2", "gwp_per_m3")
+
+def summarize_epds(epds, epd_type="Product"):
+    """
+    Stream EPDs, which may come from iter_epd_data(), into one GWPStatistics per functional unit
+    in a single pass, no per-EPD record is built.
+    :return: dictionary of GWPStatistics keyed by functional unit
+    """
+    gwp_values = industrial_gwp_values if epd_type == "Industry" else product_gwp_values
+    statistics = {functional_unit: GWPStatistics() for functional_unit in FUNCTIONAL_UNITS}
+    for epd in epds:
+        for functional_unit, value in zip(FUNCTIONAL_UNITS, gwp_values(epd)):
+            statistics[functional_unit].add(value)
+    return statistics
+
+# number at the start of a quantity string followed by its unit, e.g. "2400 kg / m3", "1,000 kg" or "1.5e3 kgCO2e",
+# commas are only read as thousands separators
+_QUANTITY_PATTERN = re.compile(r"^\s*(?P<magnitude>[-+]?(?:\d{1,3}(?:,\d{3})+(?:\.\d*)?|\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?P<unit>.*?)\s*$")
+_NUMBER_PATTERN = re.compile(r"[-+]?(?:\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d*\.?\d+)")
+_UNIT_SEPARATORS = re.compile(r"\s*([/^])\s*|\s+")
+
+# unit spelling -> (canonical unit, factor converting a magnitude into the canonical unit)
+UNIT_CONVERSIONS = {
+    "": ("", 1.0),
+    # mass
+    "kg": ("kg", 1.0), "kgs": ("kg", 1.0), "kilogram": ("kg", 1.0), "kilograms": ("kg", 1.0),
+    "t": ("kg", 1000.0), "tonne": ("kg", 1000.0), "tonnes": ("kg", 1000.0), "metric_ton": ("kg", 1000.0), "metric_tons": ("kg", 1000.0),
+    # a bare ton is read as the US short ton, most EPDs declaring one come from US programs
+    "ton": ("kg", 907.18474), "tons": ("kg", 907.18474), "short_ton": ("kg", 907.18474), "short_tons": ("kg", 907.18474),
+    "lb": ("kg", 0.45359237), "lbs": ("kg", 0.45359237),
+    # volume
+    "m3": ("m3", 1.0), "m^3": ("m3", 1.0), "m³": ("m3", 1.0), "cubic_meter": ("m3", 1.0), "cubic_meters": ("m3", 1.0),
+    "cf": ("m3", 0.028316846592), "ft3": ("m3", 0.028316846592), "ft^3": ("m3", 0.028316846592), "cu_ft": ("m3", 0.028316846592),
+    "cubic_foot": ("m3", 0.028316846592), "cubic_feet": ("m3", 0.028316846592),
+    "cy": ("m3", 0.764554857984), "yd3": ("m3", 0.764554857984), "yd^3": ("m3", 0.764554857984),
+    # area
+    "m2": ("m2", 1.0), "m^2": ("m2", 1.0), "m²": ("m2", 1.0), "sqm": ("m2", 1.0),
+    "sf": ("m2", 0.09290304), "sqft": ("m2", 0.09290304), "sq_ft": ("m2", 0.09290304), "ft2": ("m2", 0.09290304),
+    "ft^2": ("m2", 0.09290304), "square_foot": ("m2", 0.09290304), "square_feet": ("m2", 0.09290304),
+    # length
+    "m": ("m", 1.0), "mm": ("m", 0.001), "cm": ("m", 0.01), "in": ("m", 0.0254), "ft": ("m", 0.3048),
+    # global warming potential
+    "kgco2e": ("kgCO2e", 1.0), "kgco2eq": ("kgCO2e", 1.0), "kg_co2e": ("kgCO2e", 1.0), "kg_co2_eq": ("kgCO2e", 1.0),
+    "tco2e": ("kgCO2e", 1000.0), "t_co2e": ("kgCO2e", 1000.0),
+}
+# spellings whose conversion is a guess, reported once per process
+AMBIGUOUS_UNITS = {"ton", "tons"}
+
+@functools.lru_cache(maxsize=None)
+def canonical_unit(unit: str) -> Tuple[str, float]:
+    """
+    Canonical form of a unit string and the factor converting a magnitude into it.
+    Compound units such as "kg / m3" are converted part by part, unknown units are kept
+    as their normalized spelling with a factor of 1 so they never match a known unit.
+    :param unit: unit part of a quantity string
+    :return: (canonical unit, conversion factor)
+    """
+    normalized = _UNIT_SEPARATORS.sub(lambda match: match.group(1) or "_", unit.strip().lower())
+    if normalized in AMBIGUOUS_UNITS:
+        logger.warning("Unit %r is ambiguous, it is read as the US short ton of 907.18474 kg, not the metric tonne.", unit)
+    if normalized in UNIT_CONVERSIONS:
+        return UNIT_CONVERSIONS[normalized]
+    if "/" in normalized:
+        numerator, _, denominator = normalized.partition("/")
+        numerator_unit, numerator_factor = canonical_unit(numerator)
+        denominator_unit, denominator_factor = canonical_unit(denominator)
+        return f"{numerator_unit}/{denominator_unit}", numerator_factor / denominator_factor
+    return normalized, 1.0
+
+@functools.lru_cache(maxsize=8192)
+def _parse_quantity_string(value: str) -> Tuple[Optional[float], str]:
+    match = _QUANTITY_PATTERN.match(value)
+    if not match:
+        return None, canonical_unit(value)[0]
+    unit, factor = canonical_unit(match.group("unit"))
+    return float(match.group("magnitude").replace(",", "")) * factor, unit
+
+def parse_quantity(value: Any) -> Tuple[Optional[float], str]:
+    """
+    Parse an EC3 value+unit field once into its magnitude in canonical units,
+    e.g. "1 t" -> (1000.0, "kg"), "10 sf" -> (0.929, "m2"), "6 mm" -> (0.006, "m").
+    Each distinct string is only parsed once per process.
+    :param value: quantity string or number
+    :return: (magnitude or None when there is no leading number, canonical unit)
+    """
+    if value is None or isinstance(value, bool):
+        return None, ""
+    if isinstance(value, (int, float)):
+        return float(value), ""
+    return _parse_quantity_string(str(value))
+
 def extract_numeric_value(value: Any) -> float:
     """
     Extract numeric value from a string or number.
     :param value: Value to process
     :return: Extracted numeric value
     """
-    match = re.search(r"[-+]?\d*\.?\d+", str(value))
-    return float(match.group()) if match else 0.0
+    match = _NUMBER_PATTERN.search(str(value))
+    return float(match.group().replace(",", "")) if match else 0.0
 
 # extract numeric values then divide
 def divide(member: Any, denominator: Any) -> float:
@@ -254,68 +616,105 @@ def multiply(multiplicand: Any, multiplier: Any) -> float:
     multiplier_value = extract_numeric_value(multiplier)
     return round(multiplicand_value * multiplier_value, 2)
 
-def calculate_geometry(self, sub_surface):
-    """
-    Calculate the length, width, perimeter, and area of the window from its vertices.
-    Assumes the window is a quadrilateral (typically a rectangle).
-    """
-    vertices = sub_surface.vertices()
-    if len(vertices) != 4:
-        return {
-            "length": 0.0,
-            "width": 0.0,
-            "perimeter": 0.0,
-            "area": 0.0
-        }
-
-    # Calculate all edge lengths
-    edge_lengths = []
-    perimeter = 0.0
-    for i in range(4):
-        v1 = vertices[i]
-        v2 = vertices[(i + 1) % 4]
-        edge = v2 - v1
-        length = edge.length()
-        edge_lengths.append(length)
-        perimeter += length
-
-    # Assume opposite edges are equal, so we can group into two unique lengths
-    length = max(edge_lengths)
-    width = min(edge_lengths)
-
-    # Area = length × width
-    area = length * width
-
-    return {
-        "length": length,
-        "width": width,
-        "perimeter": perimeter,
-        "area": area
-    }
-
-def main():
-    """
-    Main function to execute the script.
+def cache_query(cache, url, epd_data):
     """
-    print("Fetching EC3 EPD data...")
+    Store every EPD of a query in the entry iter_epd_data() reads, so its walk is answered without any request.
+    Nothing is stored for an empty result, which may come from a failed request.
+    return: True when the EPDs were stored
+    """
+    if not epd_data:
+        return False
+    cache.set(query_url(url), epd_data)
+    return True
 
-    for category, list in material_category.items():
-        print(material_category[category])
-        for name in list:
-            print(name)
-            product_url = generate_url(name, endpoint="materials", epd_type="Product")
-            industry_url = generate_url(name, endpoint="industry_epds", epd_type="Industry")
-
-            product_epd_data = fetch_epd_data(product_url,API_TOKEN) 
-            industrial_epd_data = fetch_epd_data(industry_url,API_TOKEN)
-            print(f"Number of  product EPDs for {name}: {len(product_epd_data)}")
-            print(f"Number of  industrial EPDs for {name}: {len(industrial_epd_data)}")
-            for idx, epd in enumerate(product_epd_data, start=1):
-                parsed_data = parse_product_epd(epd)
-                print(f"Product EPD #{idx}: {json.dumps(parsed_data, indent=4)}")
-            for idx, epd in enumerate(industrial_epd_data, start=1):
-                parsed_data = parse_industrial_epd(epd)
-                print(f"Industrial EPD #{idx}: {json.dumps(parsed_data, indent=4)}")
+def category_queries(categories, epd_types=("Product", "Industry"), page_size=250):
+    """
+    Query of every material name of every category and EPD type, a name shared by two categories is listed for both.
+    return: list of (category, material name, EPD type, url)
+    """
+    from resources.EC3_snapshot import EPD_ENDPOINTS
+
+    return [(category, name, epd_type, generate_url(name, endpoint=EPD_ENDPOINTS[epd_type], epd_type=epd_type, page_size=page_size))
+            for category, names in category_material_names(categories).items() for name in names for epd_type in epd_types]
+
+def prefetch(client, categories, epd_types=("Product", "Industry"), window_queries=True, page_size=250, queries=None):
+    """
+    Fetch every page of every category query and, optionally, of every query of the window enhancement measure.
+    Queries are sent concurrently by the client, pages of one query one after another. Category pages land in
+    the client cache as they are fetched. The option and pane variants of the window materials are fetched with
+    one covering request per material when EC3_MERGE_QUERIES is set, and stored in the cache under their own urls,
+    as the measure requests them.
+    :param queries: category queries from category_queries(), built from categories when not given
+    return: dictionary of EPD list keyed by url
+    raise: IncompleteQueryError when a page after the first fails, no query is returned cut short
+    """
+    from resources.EC3_planner import QueryPlanner, merging_enabled
+    from resources.EC3_snapshot import window_queries as measure_queries, window_query_urls
+
+    if queries is None:
+        queries = category_queries(categories, epd_types, page_size)
+    epd_data = client.fetch_many(dict.fromkeys(query[3] for query in queries))
+    if window_queries and merging_enabled():
+        window_query_list = measure_queries(epd_types=epd_types)
+        planner = QueryPlanner(client, window_query_list)
+        window_data = planner.fetch_many([planner.url(query) for query in window_query_list])
+        if client.cache is not None:
+            for url, epds in window_data.items():
+                cache_query(client.cache, url, epds)
+        epd_data.update(window_data)
+    elif window_queries:
+        epd_data.update(client.fetch_many(window_query_urls(epd_types=epd_types)))
+    return epd_data
+
+def main(argv=None):
+    """
+    Warm the local EPD cache (and optionally write a snapshot) with every EC3 category, e.g. from a nightly job
+    python resources/EC3_lookup.py --categories openings steel --snapshot ec3_snapshot.sqlite
+    """
+    import argparse
+    from resources.EC3_snapshot import write_snapshot
+
+    categories = dict(EC3_CATEGORIES, **material_category)
+    parser = argparse.ArgumentParser(description="Prefetch EC3 EPDs into the local cache.")
+    parser.add_argument("--categories", nargs="+", choices=sorted(categories), default=sorted(EC3_CATEGORIES),
+                        help="categories to crawl, all of them by default")
+    parser.add_argument("--epd-types", nargs="+", choices=["Product", "Industry"], default=["Product", "Industry"])
+    parser.add_argument("--no-window-queries", action="store_true", help="skip the option and pane variants queried by the window enhancement measure")
+    parser.add_argument("--snapshot", help="also write every fetched query to this snapshot file")
+    parser.add_argument("--api-token", help="EC3 API token, read from config.ini by default")
+    parser.add_argument("--cache-dir", help="cache folder, EC3_CACHE_DIR or the per-user default otherwise")
+    parser.add_argument("--ttl-days", type=float, help="days a cached response stays valid")
+    parser.add_argument("--max-cache-mb", type=float, help="size the cache is trimmed to, a full crawl needs more than the default")
+    parser.add_argument("--max-workers", type=int, default=8, help="number of queries fetched concurrently")
+    parser.add_argument("--requests-per-second", type=float, help="limit of request starts across all workers")
+    parser.add_argument("--print-epds", action="store_true", help="print the parsed EPDs of every category query")
+    args = parser.parse_args(argv)
+
+    max_bytes = int(args.max_cache_mb * 1024 * 1024) if args.max_cache_mb else None
+    cache = EPDCache(args.cache_dir, ttl_days=args.ttl_days, max_bytes=max_bytes)
+    selected = {category: categories[category] for category in args.categories}
+    start = time.perf_counter()
+    print("Fetching EC3 EPD data...")
+    # the urls carry the date of the crawl, they are built once and looked up as fetched
+    queries = category_queries(selected, args.epd_types)
+    with EC3Client(args.api_token or load_api_token(), cache=cache, max_workers=args.max_workers,
+                   requests_per_second=args.requests_per_second) as client:
+        epd_data = prefetch(client, selected, args.epd_types, not args.no_window_queries, queries=queries)
+        counters = dict(client.profiler.counters)
+    if args.snapshot:
+        write_snapshot(args.snapshot, epd_data)
+        print(f"Wrote {len(epd_data)} queries to snapshot {args.snapshot}")
+
+    for category, name, epd_type, url in queries:
+        epds = epd_data[url]
+        print(f"{category}: {len(epds)} {epd_type.lower()} EPDs for {name}")
+        if args.print_epds:
+            parse = parse_product_epd if epd_type == "Product" else parse_industrial_epd
+            for idx, epd in enumerate(epds, start=1):
+                print(f"{epd_type} EPD #{idx}: {json.dumps(parse(epd), indent=4)}")
+    print(f"Prefetched {sum(len(epds) for epds in epd_data.values())} EPDs of {len(epd_data)} queries in {time.perf_counter() - start:.1f} s: "
+          f"{counters.get('requests', 0)} requests, {counters.get('cache_hits', 0)} cache hits, "
+          f"{counters.get('bytes_downloaded', 0) / 2**20:.1f} MB downloaded, cache in {cache.cache_dir}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
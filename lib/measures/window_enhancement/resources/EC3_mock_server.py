@@ -0,0 +1,309 @@
+# Local stand-in for the EC3 API, for offline tests and load tests of the EC3 client
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+if __package__ in (None, ""):
+    # allow running this file directly, sibling modules are imported through the resources package
+    sys.path.insert(0, os.path.dirname(script_dir))
+
+# endpoint -> EPD type it serves, as in WindowEnhancement.epd_endpoints()
+ENDPOINT_EPD_TYPES = {"materials": "Product", "industry_epds": "Industry"}
+
+# pieces of the mf filter emitted by generate_url(), e.g.
+# !EC3 search("InsulatingGlazingUnits") WHERE jurisdiction: IN("021") AND glass_panes: >~ 2 !pragma eMF("2.0/1")
+_SEARCH_PATTERN = re.compile(r'^\s*!EC3\s+search\("(?P<material_name>[^"]+)"\)\s*(?:WHERE(?P<where>.*?))?\s*(?:!pragma.*)?$', re.DOTALL)
+_CONDITION_PATTERN = re.compile(r'^(?P<field>\w+)\s*:\s*(?P<operator>IN|>~|<~|>|<)?\s*(?P<operand>.+?)$', re.DOTALL)
+_QUOTED_PATTERN = re.compile(r'"([^"]*)"')
+
+
+class FilterError(ValueError):
+    """mf filter the stand-in does not understand, answered with HTTP 400 like the real API."""
+
+
+def parse_filter(mf: str) -> Dict[str, Any]:
+    """
+    Parse the filter of an EC3 query into its material name and conditions.
+    :param mf: decoded mf parameter of a url generated by generate_url()
+    :return: {"material_name": str, "conditions": [(field, operator, operand), ...]}
+             operand is a list of strings for IN, a number for >~ and <~, a bool for yes/no and a string otherwise
+    """
+    match = _SEARCH_PATTERN.match(mf)
+    if not match:
+        raise FilterError(f"Unsupported filter: {mf}")
+    conditions = []
+    where = (match.group("where") or "").strip()
+    for clause in re.split(r"\s+AND\s+", where) if where else []:
+        condition = _CONDITION_PATTERN.match(clause.strip())
+        if not condition:
+            raise FilterError(f"Unsupported condition: {clause.strip()}")
+        field, operator, operand = condition.group("field"), condition.group("operator") or "=", condition.group("operand").strip()
+        if operator == "IN":
+            operand = _QUOTED_PATTERN.findall(operand)
+        elif operator in (">~", "<~"):
+            try:
+                operand = float(operand)
+            except ValueError:
+                raise FilterError(f"Expected a number in condition: {clause.strip()}")
+        elif operand in ("yes", "no"):
+            operand = operand == "yes"
+        else:
+            operand = operand.strip('"')
+        conditions.append((field, operator, operand))
+    return {"material_name": match.group("material_name"), "conditions": conditions}
+
+
+def epd_field(epd: Dict[str, Any], field: str) -> Any:
+    """
+    Value of a filter field in an EPD, epd__ prefixed fields may be nested under "epd".
+    """
+    if field in epd:
+        return epd[field]
+    if field.startswith("epd__"):
+        name = field[len("epd__"):]
+        if name in epd:
+            return epd[name]
+        if isinstance(epd.get("epd"), dict):
+            return epd["epd"].get(name)
+    if field == "epd_types":
+        return epd.get("epd_type")
+    return None
+
+
+def matches(epd: Dict[str, Any], conditions: List[tuple]) -> bool:
+    """
+    Whether an EPD passes every condition, EPDs lacking a field are not filtered on it.
+    """
+    for field, operator, operand in conditions:
+        value = epd_field(epd, field)
+        if value is None:
+            continue
+        if operator == "IN":
+            # epd_types are listed as "Product EPDs" while EPDs record "Product"
+            if str(value) not in operand and f"{value} EPDs" not in operand:
+                return False
+        elif operator == ">~":
+            if float(value) < operand:
+                return False
+        elif operator == "<~":
+            if float(value) > operand:
+                return False
+        elif operator == ">":
+            if str(value) <= operand:
+                return False
+        elif operator == "<":
+            if str(value) >= operand:
+                return False
+        elif isinstance(operand, bool):
+            if bool(value) != operand:
+                return False
+        elif str(value) != operand:
+            return False
+    return True
+
+
+def synthetic_window_epds(count: int = 500, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Product and industry EPDs of the materials queried by the window enhancement measure,
+    IGUs carry every option flag and a number of glass panes so the measure filters select subsets.
+    :return: EPD list keyed by EC3 material name
+    """
+    from resources.EC3_snapshot import WINDOW_MATERIALS
+
+    generator = random.Random(seed)
+    igu_options = WINDOW_MATERIALS["InsulatingGlazingUnits"]["options"]
+    epds = {"InsulatingGlazingUnits": [], "AluminiumExtrusions": []}
+    for i in range(count):
+        epd_type = "Industry" if i % 10 == 0 else "Product"
+        igu = {"id": f"igu-{i}", "name": f"IGU {i}", "epd_type": epd_type, "jurisdiction": "021",
+               "date_validity_ends": f"{generator.randint(2027, 2031)}-01-01", "glass_panes": generator.choice([1, 2, 3]),
+               "declared_unit": "1 m2", "thickness": f"{generator.choice([6, 12, 24, 36])} mm",
+               "gwp": f"{generator.uniform(20, 120):.1f} kgCO2e", "gwp_per_kg": f"{generator.uniform(1, 3):.2f} kgCO2e",
+               "density_min": "2400 kg / m3", "density_max": "2600 kg / m3",
+               "original_ec3_link": f"https://buildingtransparency.org/ec3/epds/igu-{i}",
+               "manufacturer": {"original_ec3_link": f"https://buildingtransparency.org/ec3/epds/igu-{i}"}}
+        igu.update({option: generator.random() < 0.5 for option in igu_options})
+        epds["InsulatingGlazingUnits"].append(igu)
+        epds["AluminiumExtrusions"].append({
+            "id": f"extrusion-{i}", "name": f"Extrusion {i}", "epd_type": epd_type, "jurisdiction": "021",
+            "date_validity_ends": f"{generator.randint(2027, 2031)}-01-01", "declared_unit": "1 t" if epd_type == "Product" else "1 kg",
+            "gwp": f"{generator.uniform(4000, 16000):.1f} kgCO2e" if epd_type == "Product" else f"{generator.uniform(4, 16):.2f} kgCO2e",
+            "density": "2700 kg / m3", "density_min": "2650 kg / m3", "density_max": "2750 kg / m3",
+            "original_ec3_link": f"https://buildingtransparency.org/ec3/epds/extrusion-{i}",
+            "manufacturer": {"original_ec3_link": f"https://buildingtransparency.org/ec3/epds/extrusion-{i}"}})
+    return epds
+
+
+class MockEC3Server:
+    """
+    Threaded HTTP server answering the materials and industry_epds endpoints of the EC3 API.
+
+    Responses come from a snapshot file recorded with EC3_snapshot.py (by url) or from EPD lists
+    keyed by material name, filtered with the conditions of the query. Every request can be delayed
+    by latency seconds, and more than rate_limit requests within one second are answered with
+    429 and a Retry-After header, like the real API. Requests without a bearer token get 401.
+    Counters record the traffic so load tests can check what the client actually sent.
+    """
+
+    def __init__(self, epds_by_material: Optional[Dict[str, List[Dict[str, Any]]]] = None, snapshot_path: Optional[str] = None,
+                 latency: float = 0.0, rate_limit: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        self.epds_by_material = epds_by_material if epds_by_material is not None else {}
+        self.snapshot = None
+        if snapshot_path:
+            from resources.EC3_snapshot import EPDSnapshot
+            self.snapshot = EPDSnapshot(snapshot_path)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.request_count = 0
+        self.throttled_count = 0
+        self.requested_paths: List[str] = []
+        self._lock = threading.Lock()
+        self._request_times = deque()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Base url to use as EC3_API_URL.
+        """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "MockEC3Server":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def retry_after(self) -> Optional[int]:
+        """
+        Record a request and return the seconds to wait when it exceeds the rate limit, None when it is allowed.
+        """
+        with self._lock:
+            self.request_count += 1
+            if not self.rate_limit:
+                return None
+            now = time.monotonic()
+            while self._request_times and now - self._request_times[0] >= 1.0:
+                self._request_times.popleft()
+            if len(self._request_times) >= self.rate_limit:
+                self.throttled_count += 1
+                return max(1, math.ceil(1.0 - (now - self._request_times[0])))
+            self._request_times.append(now)
+            return None
+
+    def query_epds(self, endpoint: str, query: str, mf: str) -> List[Dict[str, Any]]:
+        """
+        Every EPD matching a query, before paging.
+        """
+        if self.snapshot is not None:
+            # snapshots are keyed by the url sent to the real API
+            from resources.EC3_lookup import EC3_API_URL
+            with self._lock:
+                return self.snapshot.fetch_epd_data(f"{EC3_API_URL}/{endpoint}?{query}")
+        search = parse_filter(mf)
+        epd_type = ENDPOINT_EPD_TYPES[endpoint]
+        return [epd for epd in self.epds_by_material.get(search["material_name"], [])
+                if epd.get("epd_type", epd_type) == epd_type and matches(epd, search["conditions"])]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                content = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with server._lock:
+                    server.requested_paths.append(self.path)
+                retry_after = server.retry_after()
+                if server.latency:
+                    time.sleep(server.latency)
+                if retry_after is not None:
+                    self.send_json(429, {"detail": "Request was throttled."}, {"Retry-After": str(retry_after)})
+                    return
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self.send_json(401, {"detail": "Authentication credentials were not provided."})
+                    return
+                endpoint = parts.path.rstrip("/").rsplit("/", 1)[-1]
+                if not parts.path.startswith("/api/") or endpoint not in ENDPOINT_EPD_TYPES:
+                    self.send_json(404, {"detail": "Not found."})
+                    return
+                params = dict(parse_qsl(parts.query, keep_blank_values=True))
+                try:
+                    page_number = int(params.get("page_number", 1))
+                    page_size = int(params.get("page_size", 100))
+                    epds = server.query_epds(endpoint, parts.query, params.get("mf", ""))
+                except (ValueError, FilterError) as error:
+                    self.send_json(400, {"detail": str(error)})
+                    return
+                start = (max(page_number, 1) - 1) * page_size
+                self.send_json(200, epds[start:start + page_size], {"X-Total-Count": str(len(epds))})
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Serve recorded or synthetic EC3 responses until interrupted, e.g.
+    python resources/EC3_mock_server.py --port 8765 --latency 0.2 --rate-limit 10
+    then run the measure or tests with EC3_API_URL=http://127.0.0.1:8765/api
+    """
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the EC3 API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot", help="snapshot file written by EC3_snapshot.py, synthetic EPDs are served otherwise")
+    parser.add_argument("--epds", type=int, default=500, help="number of synthetic EPDs per material")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic EPDs")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before answering 429")
+    args = parser.parse_args(argv)
+
+    epds_by_material = None if args.snapshot else synthetic_window_epds(args.epds, args.seed)
+    server = MockEC3Server(epds_by_material, args.snapshot, args.latency, args.rate_limit, args.host, args.port)
+    print(f"Serving EC3 stand-in at {server.url}, set EC3_API_URL to use it")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
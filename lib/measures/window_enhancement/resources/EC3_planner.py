@@ -0,0 +1,212 @@
+# Merge EC3 queries differing only by option flag and number of panes into one covering request
+#
+# The split of a covering query relies on every EPD carrying a top-level "glass_panes" number and a boolean per
+# option flag (e.g. "low_emissivity"). That layout comes from the mock EC3 server and has not been verified against
+# real EC3 responses: when the fields are missing the group is fetched query by query instead, and is never planned again.
+# Until it is checked against recorded real responses, merging is opt-in through EC3_MERGE_QUERIES=1.
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from resources.EC3_snapshot import EPD_ENDPOINTS
+
+# (EC3 material name, option flag or None, glass panes or None, EPD type), the parameters of generate_url() that vary
+Query = Tuple[str, Optional[str], Optional[int], str]
+
+
+def merging_enabled() -> bool:
+    """
+    Whether lookups go through a QueryPlanner, set EC3_MERGE_QUERIES to 1, true or yes to enable it.
+    """
+    return os.environ.get("EC3_MERGE_QUERIES", "").strip().lower() in ("1", "true", "yes")
+
+
+def option_flag(value: Any) -> Optional[bool]:
+    """
+    Strict reading of an option flag of an EPD: True or "yes" is set, False or "no" is not, None for any other value.
+    """
+    if value is True or value == "yes":
+        return True
+    if value is False or value == "no":
+        return False
+    return None
+
+
+def covering_query(queries: List[Query]) -> Query:
+    """
+    Widest query answering every query of a group: the option flag is dropped unless all queries share it,
+    glass_panes >~ N keeps the smallest N, or is dropped when a query has no pane filter.
+    """
+    material_name, _, _, epd_type = queries[0]
+    options = {query[1] for query in queries}
+    panes = [query[2] for query in queries]
+    option = options.pop() if len(options) == 1 else None
+    glass_panes = None if None in panes else min(panes)
+    return material_name, option, glass_panes, epd_type
+
+
+def plan_queries(queries: Iterable[Query], skip: Iterable[Tuple[str, str]] = ()) -> Dict[Query, List[Query]]:
+    """
+    Group the queries sharing material and EPD type under their covering query, groups of one query are left out.
+    :param skip: (material name, EPD type) pairs never grouped
+    return: list of queries keyed by their covering query
+    """
+    skip = set(skip)
+    groups: Dict[Tuple[str, str], List[Query]] = {}
+    for query in dict.fromkeys(queries):
+        if (query[0], query[3]) not in skip:
+            groups.setdefault((query[0], query[3]), []).append(query)
+    return {covering_query(group): group for group in groups.values() if len(group) > 1}
+
+
+def belongs_to(epd: Dict[str, Any], query: Query, covering: Query) -> Optional[bool]:
+    """
+    Whether an EPD returned by the covering query passes the filters of query: the option flag ("yes")
+    and glass_panes >~ N, read from the top-level fields of the EPD. None when the EPD lacks a field needed to tell,
+    or holds a value read neither as set nor as unset.
+    """
+    _, option, glass_panes, _ = query
+    if option and option != covering[1]:
+        flag = option_flag(epd.get(option))
+        if flag is None:
+            return None
+        if not flag:
+            return False
+    if glass_panes and glass_panes != covering[2]:
+        panes = epd.get("glass_panes")
+        if isinstance(panes, bool) or not isinstance(panes, (int, float)):
+            return None
+        if panes < glass_panes:
+            return False
+    return True
+
+
+def partition_epds(epds: Iterable[Dict[str, Any]], queries: List[Query], covering: Query) -> Optional[Dict[Query, List[Dict[str, Any]]]]:
+    """
+    Split the EPDs of a covering query into the results of each query of its group, in a single pass.
+    Stops at the first EPD lacking a field the split depends on, so the remaining pages of a stream are not fetched.
+    return: EPD list keyed by query, None when an EPD lacks a field the split depends on
+    """
+    partitions = {query: [] for query in queries}
+    for epd in epds:
+        for query in queries:
+            belongs = belongs_to(epd, query, covering)
+            if belongs is None:
+                return None
+            if belongs:
+                partitions[query].append(epd)
+    return partitions
+
+
+class QueryPlanner:
+    """
+    EC3 client wrapper sending one covering request for every group of queries differing only by option flag
+    and number of panes, and partitioning its EPDs locally. Requests drop from one per variant to one per
+    material and EPD type. A group is fetched the first time one of its queries is requested, the EPDs of
+    each query are held until they are handed out once, a query requested again goes to the client.
+    Queries outside a group, and groups whose EPDs lack the fields to partition them, go to the client as they are.
+    A material and EPD type whose EPDs could not be partitioned is remembered for the life of the process,
+    later planners send its queries one by one without trying the covering request again.
+    Exposes the lookup methods of EC3Client so it can be used in its place.
+    """
+
+    # (material name, EPD type) of the groups whose EPDs lack the partition fields
+    unpartitionable: Set[Tuple[str, str]] = set()
+
+    def __init__(self, client, queries: Iterable[Query], **url_arguments):
+        self.client = client
+        self.profiler = client.profiler
+        self.url_arguments = url_arguments
+        self.groups = plan_queries(queries, skip=self.unpartitionable)
+        # url of every grouped query -> (query, covering query)
+        self.urls = {self.url(query): (query, covering) for covering, group in self.groups.items() for query in group}
+        self.partitions: Dict[Query, Optional[Dict[Query, List[Dict[str, Any]]]]] = {}
+        self._locks = {covering: threading.Lock() for covering in self.groups}
+
+    def url(self, query: Query) -> str:
+        from resources.EC3_lookup import generate_url
+
+        material_name, option, glass_panes, epd_type = query
+        return generate_url(material_name=material_name, option=option, glass_panes=glass_panes, epd_type=epd_type,
+                            endpoint=EPD_ENDPOINTS[epd_type], **self.url_arguments)
+
+    @classmethod
+    def clear_unpartitionable(cls) -> None:
+        """
+        Try the covering request again for every group, e.g. after the EC3 response format changed.
+        """
+        cls.unpartitionable.clear()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def partition(self, covering: Query) -> Optional[Dict[Query, List[Dict[str, Any]]]]:
+        """
+        EPDs of every query of a group, fetched with one covering query the first time the group is needed.
+        """
+        from resources.EC3_lookup import IncompleteQueryError
+
+        # concurrent lookups of the same group wait for the first one
+        with self._locks[covering]:
+            if covering not in self.partitions:
+                epds = self.client.iter_epd_data(self.url(covering))
+                try:
+                    partitions = partition_epds(epds, self.groups[covering], covering)
+                except IncompleteQueryError:
+                    # the queries of the group are sent one by one instead, the planner tries the group again next time
+                    self.partitions[covering] = None
+                    return None
+                finally:
+                    epds.close()
+                if partitions is None:
+                    self.unpartitionable.add((covering[0], covering[3]))
+                    self.profiler.count("unpartitioned_queries")
+                else:
+                    self.profiler.count("merged_queries", len(self.groups[covering]))
+                self.partitions[covering] = partitions
+            return self.partitions[covering]
+
+    def take(self, url: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        EPDs of a grouped query, released by the planner as they are handed out.
+        return: None when the url is not grouped, its group could not be partitioned or its EPDs were already taken
+        """
+        if url not in self.urls:
+            return None
+        query, covering = self.urls[url]
+        partitions = self.partition(covering)
+        if partitions is None:
+            return None
+        with self._locks[covering]:
+            return partitions.pop(query, None)
+
+    def fetch_epd_data(self, url: str, cache=None) -> List[Any]:
+        epds = self.take(url)
+        if epds is not None:
+            return epds
+        return self.client.fetch_epd_data(url, cache)
+
+    def iter_epd_data(self, url: str, cache=None, page_size: int = 250):
+        epds = self.take(url)
+        if epds is not None:
+            yield from epds
+            return
+        yield from self.client.iter_epd_data(url, cache, page_size)
+
+    def map_concurrent(self, function, items) -> list:
+        return self.client.map_concurrent(function, items)
+
+    def fetch_many(self, urls: Iterable[str], cache=None) -> Dict[str, List[Any]]:
+        """
+        Fetch every page of several queries, covering queries of different groups are sent concurrently.
+        return: dictionary of EPD list keyed by url
+        """
+        urls = list(dict.fromkeys(urls))
+        results = self.map_concurrent(lambda url: list(self.iter_epd_data(url, cache)), urls)
+        return dict(zip(urls, results))
@@ -0,0 +1,183 @@
+# Offline EC3 snapshot export and lookup
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+if __package__ in (None, ""):
+    # allow running this file directly, sibling modules are imported through the resources package
+    sys.path.insert(0, os.path.dirname(script_dir))
+from resources.EC3_cache import normalize_url
+from resources.profiling import Profiler
+
+SNAPSHOT_FORMAT_VERSION = "1"
+
+EPD_ENDPOINTS = {"Product": "materials", "Industry": "industry_epds"}
+
+# queries the window enhancement measure can send, IGU options match WindowEnhancement.igu_options()
+WINDOW_MATERIALS = {
+    "InsulatingGlazingUnits": {"options": ["electrochromic", "fire_resistant", "laminated", "low_emissivity", "tempered"],
+                               "glass_panes": [1, 2, 3]},
+    "AluminiumExtrusions": {"options": [None], "glass_panes": [None]},
+}
+
+
+def snapshot_key(url: str) -> str:
+    """
+    Key of a query in a snapshot: sha256 of its normalized url without paging parameters,
+    a snapshot entry holds every result page of the query.
+    """
+    parts = urlsplit(normalize_url(url))
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name not in ("page_number", "page_size")]
+    return hashlib.sha256(f"{parts.netloc}{parts.path}?{urlencode(query)}".encode("utf-8")).hexdigest()
+
+
+def window_queries(materials: Dict[str, Dict[str, list]] = WINDOW_MATERIALS, epd_types: Iterable[str] = EPD_ENDPOINTS) -> List[tuple]:
+    """
+    Every (material, option, glass panes, EPD type) query of the given materials.
+    """
+    return [(material_name, option, glass_panes, epd_type)
+            for material_name, variants in materials.items()
+            for epd_type in epd_types
+            for option in variants["options"]
+            for glass_panes in variants["glass_panes"]]
+
+
+def window_query_urls(materials: Dict[str, Dict[str, list]] = WINDOW_MATERIALS, epd_types: Iterable[str] = EPD_ENDPOINTS) -> List[str]:
+    """
+    Url of every (material, option, glass panes, EPD type) query of the given materials.
+    """
+    from resources.EC3_lookup import generate_url
+
+    return [generate_url(material_name=material_name, option=option, glass_panes=glass_panes, epd_type=epd_type, endpoint=EPD_ENDPOINTS[epd_type])
+            for material_name, option, glass_panes, epd_type in window_queries(materials, epd_types)]
+
+
+def write_snapshot(path: str, epd_data_by_url: Dict[str, List[Any]]) -> None:
+    """
+    Write a snapshot file holding the EPDs of every query.
+    Each query is stored as one zlib compressed JSON row indexed by its snapshot_key().
+    The file is built next to the target and renamed into place, readers never see a partial snapshot.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".sqlite.tmp")
+    os.close(file_descriptor)
+    try:
+        connection = sqlite3.connect(temp_path)
+        with connection:
+            connection.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE queries (key TEXT PRIMARY KEY, url TEXT, epd_count INTEGER, data BLOB)")
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("format_version", SNAPSHOT_FORMAT_VERSION),
+                ("exported_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+                ("query_count", str(len(epd_data_by_url))),
+            ])
+            connection.executemany("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)", [
+                (snapshot_key(url), normalize_url(url), len(epd_data), zlib.compress(json.dumps(epd_data).encode("utf-8")))
+                for url, epd_data in epd_data_by_url.items()
+            ])
+        connection.close()
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def export_snapshot(client, path: str, urls: Iterable[str]) -> Dict[str, int]:
+    """
+    Fetch every page of the queries with an EC3Client and write them to a snapshot.
+    :return: number of EPDs keyed by url
+    """
+    epd_data_by_url = client.fetch_many(urls)
+    write_snapshot(path, epd_data_by_url)
+    return {url: len(epd_data) for url, epd_data in epd_data_by_url.items()}
+
+
+class EPDSnapshot:
+    """
+    Read-only EC3 stand-in answering queries from a snapshot file, no network or token needed.
+    Exposes the lookup methods of EC3Client so it can be used in its place.
+    """
+
+    def __init__(self, path: str, profiler: Optional[Profiler] = None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"EPD snapshot not found: {path}")
+        self.path = path
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+        self.meta = dict(self.connection.execute("SELECT name, value FROM meta"))
+        self._decoded = {}
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fetch_epd_data(self, url: str, cache=None) -> List[Any]:
+        """
+        EPDs of every page of a query, empty list when the query is not in the snapshot.
+        """
+        key = snapshot_key(url)
+        if key not in self._decoded:
+            self.profiler.count("snapshot_reads")
+            with self.profiler.phase("snapshot_read"):
+                row = self.connection.execute("SELECT data FROM queries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.profiler.count("bytes_read", len(row[0]))
+            with self.profiler.phase("json_decode"):
+                self._decoded[key] = json.loads(zlib.decompress(row[0])) if row else []
+        return self._decoded[key]
+
+    def iter_epd_data(self, url: str, cache=None, page_size: int = 250):
+        yield from self.fetch_epd_data(url)
+
+    def fetch_many(self, urls: Iterable[str], cache=None) -> Dict[str, List[Any]]:
+        return {url: self.fetch_epd_data(url) for url in urls}
+
+    def map_concurrent(self, function, items) -> list:
+        # local lookups gain nothing from threads
+        return [function(item) for item in items]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Export the EC3 queries used by the window enhancement measure to a snapshot file, e.g.
+    python resources/EC3_snapshot.py --output ec3_snapshot.sqlite
+    """
+    from resources.EC3_lookup import EC3Client, load_api_token
+    from resources.EC3_cache import EPDCache
+    from resources.EC3_planner import QueryPlanner, merging_enabled
+
+    parser = argparse.ArgumentParser(description="Export EC3 EPDs to an offline snapshot file.")
+    parser.add_argument("--output", required=True, help="path of the snapshot file to write")
+    parser.add_argument("--api-token", help="EC3 API token, read from config.ini by default")
+    parser.add_argument("--materials", nargs="+", default=list(WINDOW_MATERIALS), help="EC3 material names to export")
+    parser.add_argument("--max-workers", type=int, default=4, help="number of queries fetched concurrently")
+    args = parser.parse_args(argv)
+
+    materials = {name: WINDOW_MATERIALS.get(name, {"options": [None], "glass_panes": [None]}) for name in args.materials}
+    # with EC3_MERGE_QUERIES set, the option and pane variants of a material are fetched with one request and split locally
+    client = EC3Client(args.api_token or load_api_token(), cache=EPDCache(), max_workers=args.max_workers)
+    if merging_enabled():
+        client = QueryPlanner(client, window_queries(materials))
+    with client:
+        counts = export_snapshot(client, args.output, window_query_urls(materials))
+    print(f"Wrote {sum(counts.values())} EPDs from {len(counts)} queries to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,9 @@ config = configparser.ConfigParser()
 config.read(config_path)
 API_TOKEN= config["EC3_API_TOKEN"]["API_TOKEN"]
 
-test_url = ("https://api.buildingtransparency.org/api/materials?page_number=1&page_size=25&mf=!EC3%20search(%22InsulatingGlazingUnits%22)%20WHERE%20%0A%20%20jurisdiction%3A%20IN(%22021%22)%20AND%0A%20%20epd__date_validity_ends%3A%20%3E%20%222025-04-18%22%20AND%0A%20%20epd_types%3A%20IN(%22Product%20EPDs%22)%20%0A!pragma%20eMF(%222.0%2F1%22)%2C%20lcia(%22TRACI%202.1%22)")
+# EC3_API_URL points this check to another server, e.g. the local stand-in of EC3_mock_server.py
+api_url = os.environ.get("EC3_API_URL", "https://api.buildingtransparency.org/api").rstrip("/")
+test_url = (f"{api_url}/materials?page_number=1&page_size=25&mf=!EC3%20search(%22InsulatingGlazingUnits%22)%20WHERE%20%0A%20%20jurisdiction%3A%20IN(%22021%22)%20AND%0A%20%20epd__date_validity_ends%3A%20%3E%20%222025-04-18%22%20AND%0A%20%20epd_types%3A%20IN(%22Product%20EPDs%22)%20%0A!pragma%20eMF(%222.0%2F1%22)%2C%20lcia(%22TRACI%202.1%22)")
 # Headers for the request
 headers = {
     "Accept": "application/json",
@@ -23,7 +25,7 @@ headers = {
 }
 
 # Execute the GET request
-test_response = requests.get(test_url, headers=headers, verify=False)
+test_response = requests.get(test_url, headers=headers, timeout=(5, 60))
 
 # Parse the JSON response
 test_response = test_response.json()
@@ -1,39 +1,82 @@
 # save this function for wall construction
-def calculate_geometry(self, sub_surface):
+import numpy as np
+
+def vertices_array(sub_surfaces):
     """
-    Calculate the length, width, perimeter, and area of the window from its vertices.
-    Assumes the window is a quadrilateral (typically a rectangle).
-    """
-    vertices = sub_surface.vertices()
-    if len(vertices) != 4:
-        return {
-            "length": 0.0,
-            "width": 0.0,
-            "perimeter": 0.0,
-            "area": 0.0
-        }
-
-    # Calculate all edge lengths
-    edge_lengths = []
-    perimeter = 0.0
-    for i in range(4):
-        v1 = vertices[i]
-        v2 = vertices[(i + 1) % 4]
-        edge = v2 - v1
-        length = edge.length()
-        edge_lengths.append(length)
-        perimeter += length
-
-    # Assume opposite edges are equal, so we can group into two unique lengths
-    length = max(edge_lengths)
-    width = min(edge_lengths)
-
-    # Area = length × width
-    area = length * width
+    Pull the vertices of all surfaces into one (N, k, 3) array, k being the largest vertex count.
+    Surfaces with fewer vertices are padded by repeating their last vertex, which adds zero length edges
+    and leaves perimeter and area unchanged.
+    return: (vertices array, number of vertices of each surface)
+    """
+    coordinates = [[(vertex.x(), vertex.y(), vertex.z()) for vertex in sub_surface.vertices()] for sub_surface in sub_surfaces]
+    counts = np.array([len(surface_coordinates) for surface_coordinates in coordinates], dtype=int)
+    max_count = int(counts.max()) if len(counts) else 0
+    vertices = np.zeros((len(coordinates), max_count, 3))
+    for i, surface_coordinates in enumerate(coordinates):
+        if surface_coordinates:
+            vertices[i, :len(surface_coordinates)] = surface_coordinates
+            vertices[i, len(surface_coordinates):] = surface_coordinates[-1]
+    return vertices, counts
+
+def polygon_geometry(vertices):
+    """
+    Vectorized geometry of N planar polygons given as an (N, k, 3) vertex array.
+    Area uses Newell's method so triangles and any n-gon work, length and width are the
+    bounding dimensions within the polygon plane, aligned with its first edge.
+    return: dictionary of (N,) arrays "length", "width", "perimeter" and "area"
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    if vertices.ndim != 3 or vertices.shape[1] < 3:
+        zeros = np.zeros(len(vertices))
+        return {"length": zeros, "width": zeros.copy(), "perimeter": zeros.copy(), "area": zeros.copy()}
+
+    next_vertices = np.roll(vertices, -1, axis=1)
+    edges = next_vertices - vertices
+    perimeter = np.linalg.norm(edges, axis=2).sum(axis=1)
+
+    # Newell's method: half the norm of the summed cross products of consecutive vertices
+    newell_normal = np.cross(vertices, next_vertices).sum(axis=1)
+    double_area = np.linalg.norm(newell_normal, axis=1)
+    area = 0.5 * double_area
+
+    # in-plane axes: first edge direction and its perpendicular within the plane
+    first_edge = edges[:, 0, :]
+    first_edge_length = np.linalg.norm(first_edge, axis=1, keepdims=True)
+    u_axis = np.divide(first_edge, first_edge_length, out=np.zeros_like(first_edge), where=first_edge_length > 0)
+    unit_normal = np.divide(newell_normal, double_area[:, None], out=np.zeros_like(newell_normal), where=double_area[:, None] > 0)
+    v_axis = np.cross(unit_normal, u_axis)
+
+    relative = vertices - vertices[:, :1, :]
+    u_coordinates = np.einsum("nkd,nd->nk", relative, u_axis)
+    v_coordinates = np.einsum("nkd,nd->nk", relative, v_axis)
+    u_extent = u_coordinates.max(axis=1) - u_coordinates.min(axis=1)
+    v_extent = v_coordinates.max(axis=1) - v_coordinates.min(axis=1)
 
     return {
-        "length": length,
-        "width": width,
+        "length": np.maximum(u_extent, v_extent),
+        "width": np.minimum(u_extent, v_extent),
         "perimeter": perimeter,
-        "area": area
-    }
\ No newline at end of file
+        "area": area,
+    }
+
+def calculate_geometry_batch(sub_surfaces):
+    """
+    Calculate the length, width, perimeter, and area of many windows from their vertices at once.
+    return: dictionary of (N,) arrays "length", "width", "perimeter" and "area", in the order of sub_surfaces
+    """
+    vertices, counts = vertices_array(sub_surfaces)
+    geometry = polygon_geometry(vertices)
+    # fewer than three vertices do not enclose an area
+    degenerate = counts < 3
+    if degenerate.any():
+        for values in geometry.values():
+            values[degenerate] = 0.0
+    return geometry
+
+def calculate_geometry(self, sub_surface):
+    """
+    Calculate the length, width, perimeter, and area of the window from its vertices.
+    Works for any planar polygon, length and width are its bounding dimensions.
+    """
+    geometry = calculate_geometry_batch([sub_surface])
+    return {name: float(values[0]) for name, values in geometry.items()}
@@ -0,0 +1,94 @@
+# Building level aggregation of window embodied carbon
+import csv
+import json
+import os
+from typing import Any, Dict, Optional
+
+# outward normal azimuth (degrees clockwise from north) bounds of each facade
+FACADE_ORIENTATIONS = [("North", 315.0, 45.0), ("East", 45.0, 135.0), ("South", 135.0, 225.0), ("West", 225.0, 315.0)]
+# surfaces tilted less than this from horizontal count as roof glazing
+ROOF_TILT_DEGREES = 45.0
+
+GROUPS = ["building", "orientation", "construction", "space"]
+TOTAL_FIELDS = ["windows", "area_m2", "glazing_kg_co2e", "frame_kg_co2e", "embodied_carbon_kg_co2e"]
+
+
+def facade_orientation(azimuth_degrees: float, tilt_degrees: float) -> str:
+    """
+    Facade a window belongs to from the azimuth and tilt of its outward normal.
+    """
+    if tilt_degrees < ROOF_TILT_DEGREES:
+        return "Roof"
+    azimuth_degrees = azimuth_degrees % 360.0
+    for orientation, start, end in FACADE_ORIENTATIONS:
+        if start > end:
+            if azimuth_degrees >= start or azimuth_degrees < end:
+                return orientation
+        elif start <= azimuth_degrees < end:
+            return orientation
+    return "North"
+
+
+class CarbonReport:
+    """
+    Running totals of window embodied carbon by building, facade orientation, construction and space,
+    filled in the same pass that computes the embodied carbon of each window.
+    """
+
+    def __init__(self, total_embodied_carbon: float = 0.0):
+        # embodied carbon of the whole building (assembly) given by the user, 0 when unknown
+        self.total_embodied_carbon = total_embodied_carbon
+        self.totals: Dict[str, Dict[str, Dict[str, float]]] = {group: {} for group in GROUPS}
+        # P10/P50/P90 building totals of the uncertainty mode, None when it is not run
+        self.uncertainty: Optional[Dict[str, float]] = None
+
+    def add(self, orientation: str, construction: str, space: str, area: float, glazing_carbon: float, frame_carbon: float) -> None:
+        """
+        Add one window to every group it belongs to.
+        """
+        for group, key in (("building", "Building"), ("orientation", orientation), ("construction", construction), ("space", space)):
+            totals = self.totals[group].setdefault(key, dict.fromkeys(TOTAL_FIELDS, 0.0))
+            totals["windows"] += 1
+            totals["area_m2"] += area
+            totals["glazing_kg_co2e"] += glazing_carbon
+            totals["frame_kg_co2e"] += frame_carbon
+            totals["embodied_carbon_kg_co2e"] += glazing_carbon + frame_carbon
+
+    @property
+    def building(self) -> Dict[str, float]:
+        return self.totals["building"].get("Building", dict.fromkeys(TOTAL_FIELDS, 0.0))
+
+    def window_share(self) -> Optional[float]:
+        """
+        Percentage of the user supplied building embodied carbon taken by the windows, None when it was not given.
+        """
+        if self.total_embodied_carbon <= 0:
+            return None
+        return 100.0 * self.building["embodied_carbon_kg_co2e"] / self.total_embodied_carbon
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {"total_embodied_carbon_kg_co2e": self.total_embodied_carbon, "window_share_percent": self.window_share()}
+        if self.uncertainty is not None:
+            result["uncertainty"] = self.uncertainty
+        for group in GROUPS:
+            result[group] = {key: dict(totals, windows=int(totals["windows"])) for key, totals in sorted(self.totals[group].items())}
+        return result
+
+    def write_json(self, path: str) -> str:
+        path = os.path.abspath(path)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=1)
+        return path
+
+    def write_csv(self, path: str) -> str:
+        """
+        One row per (group, key), e.g. orientation,South,...
+        """
+        path = os.path.abspath(path)
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["group", "key"] + TOTAL_FIELDS)
+            for group in GROUPS:
+                for key, totals in sorted(self.totals[group].items()):
+                    writer.writerow([group, key, int(totals["windows"])] + [round(totals[field], 6) for field in TOTAL_FIELDS[1:]])
+        return path
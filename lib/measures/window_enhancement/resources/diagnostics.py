@@ -0,0 +1,59 @@
+# Leveled, buffered diagnostics for the window enhancement measure
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+VERBOSITY_LEVELS = {"quiet": 0, "summary": 1, "debug": 2}
+
+
+class Diagnostics:
+    """
+    Route measure messages by verbosity.
+
+    quiet: only warnings and errors reach the runner.
+    summary: aggregated info lines (per construction, per query) reach the runner.
+    debug: additionally buffers per-window and per-layer records in memory,
+    written once at the end of the run as JSON lines instead of bloating out.osw.
+    """
+
+    def __init__(self, runner, verbosity: str = "summary"):
+        self.runner = runner
+        self.verbosity = verbosity
+        self.level = VERBOSITY_LEVELS[verbosity]
+        self.records: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    def info(self, message: str) -> None:
+        """
+        Summary level message registered with the runner.
+        """
+        if self.level >= VERBOSITY_LEVELS["summary"]:
+            self.runner.registerInfo(message)
+
+    def warning(self, message: str) -> None:
+        self.runner.registerWarning(message)
+
+    def error(self, message: str) -> None:
+        self.runner.registerError(message)
+
+    def debug(self, event: str, **fields: Any) -> None:
+        """
+        Buffer a structured debug record, only kept at debug verbosity.
+        """
+        if self.level >= VERBOSITY_LEVELS["debug"]:
+            record = {"t": round(time.perf_counter() - self._start, 6), "event": event}
+            record.update(fields)
+            self.records.append(record)
+
+    def write(self, path: str) -> str:
+        """
+        Write the buffered records as JSON lines in a single write.
+        :return: absolute path of the written file, empty when nothing was buffered
+        """
+        if not self.records:
+            return ""
+        path = os.path.abspath(path)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record, default=str) + "\n" for record in self.records))
+        return path
@@ -0,0 +1,95 @@
+# Streaming statistics of the GWP values of a set of EPDs
+import math
+from array import array
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+# percentiles reported with every summary, as "p10", "p25", ...
+PERCENTILES = (10, 25, 75, 90)
+
+
+class GWPStatistics:
+    """
+    Accumulate GWP values in one streaming pass.
+
+    Count, minimum, maximum, mean and standard deviation (Welford's update) use constant memory.
+    Values are also kept in a compact float array, the only way to get an exact median and percentiles,
+    which are then found by selection (np.partition) instead of sorting.
+    Missing values (None or NaN) are skipped.
+    """
+
+    def __init__(self, values: Iterable[Optional[float]] = ()):
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.mean = 0.0
+        self._sum_squared_deviations = 0.0
+        self._values = array("d")
+        self.extend(values)
+
+    def add(self, value: Optional[float]) -> None:
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._sum_squared_deviations += delta * (value - self.mean)
+        self._values.append(value)
+
+    def extend(self, values: Iterable[Optional[float]]) -> None:
+        for value in values:
+            self.add(value)
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        Copy of the accumulated values, in the order they were added.
+        """
+        return np.array(self._values, dtype=float)
+
+    @property
+    def std(self) -> float:
+        """
+        Population standard deviation, as np.std.
+        """
+        return math.sqrt(self._sum_squared_deviations / self.count) if self.count else math.nan
+
+    def percentiles(self, percentiles: Iterable[float]) -> Dict[float, float]:
+        """
+        Exact percentiles with linear interpolation between order statistics, as np.percentile,
+        all found by a single partial partition of the values.
+        """
+        percentiles = list(percentiles)
+        if not self.count:
+            return {percentile: math.nan for percentile in percentiles}
+        ranks = [percentile / 100.0 * (self.count - 1) for percentile in percentiles]
+        kth = sorted({math.floor(rank) for rank in ranks} | {math.ceil(rank) for rank in ranks})
+        selected = np.partition(np.frombuffer(self._values, dtype=float), kth)
+        result = {}
+        for percentile, rank in zip(percentiles, ranks):
+            lower, upper = selected[math.floor(rank)], selected[math.ceil(rank)]
+            result[percentile] = float(lower + (rank - math.floor(rank)) * (upper - lower))
+        return result
+
+    @property
+    def median(self) -> float:
+        return self.percentiles([50])[50]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """
+        Every statistic at once, None throughout when no value was added.
+        Keys are the gwp_statistic choices of the measure ("minimum", "maximum", "mean", "median")
+        plus "std", "count" and "p10", "p25", "p75", "p90".
+        """
+        if not self.count:
+            summary = dict.fromkeys(["minimum", "maximum", "mean", "median", "std"] + [f"p{percentile}" for percentile in PERCENTILES])
+            summary["count"] = 0
+            return summary
+        percentiles = self.percentiles((50,) + PERCENTILES)
+        summary = {"minimum": self.minimum, "maximum": self.maximum, "mean": self.mean, "median": percentiles[50], "std": self.std}
+        summary.update({f"p{percentile}": percentiles[percentile] for percentile in PERCENTILES})
+        summary["count"] = self.count
+        return summary
@@ -0,0 +1,129 @@
+# Per-phase timing, counters and optional profiling of a measure run
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict
+
+PROFILING_MODES = ["off", "cprofile", "tracemalloc"]
+# functions or allocation sites listed in the profile
+TOP_ENTRIES = 20
+
+
+class Profiler:
+    """
+    Wall time and call count of named phases plus named counters, safe to use from worker threads.
+
+    Phase times are exclusive: time spent in a nested phase only counts for the nested phase,
+    so the phases of one thread add up to the time it spent in them. Phases of worker threads are summed over threads.
+    mode "cprofile" also records every function call of the thread calling start(),
+    "tracemalloc" the peak Python memory and the lines allocating most of it.
+    """
+
+    def __init__(self, mode: str = "off"):
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, choose one of {PROFILING_MODES}")
+        self.mode = mode
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.profile = None
+        self.extra: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = time.perf_counter()
+        self._wall_seconds = None
+        # whether start() turned tracemalloc on, tracing started by the caller is left running
+        self._started_tracing = False
+
+    def start(self) -> "Profiler":
+        self._start = time.perf_counter()
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def stop(self) -> None:
+        self._wall_seconds = time.perf_counter() - self._start
+        if self.profile is not None:
+            self.profile.disable()
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+            self.extra["top_functions"] = stream.getvalue()
+        elif self.mode == "tracemalloc" and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ENTRIES]
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+            self.extra["peak_memory_mb"] = peak / 2**20
+            self.extra["top_allocations"] = [{"line": str(statistic.traceback), "size_mb": statistic.size / 2**20, "count": statistic.count}
+                                             for statistic in statistics]
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time the enclosed block as phase name.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # time spent in phases nested in this one
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                totals = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+                totals["seconds"] += elapsed - nested
+                totals["calls"] += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self) -> Dict[str, Any]:
+        wall_seconds = self._wall_seconds if self._wall_seconds is not None else time.perf_counter() - self._start
+        with self._lock:
+            summary = {"mode": self.mode, "wall_seconds": wall_seconds,
+                       "phases": {name: dict(totals) for name, totals in self.phases.items()},
+                       "counters": dict(self.counters)}
+        summary.update(self.extra)
+        return summary
+
+    def register(self, runner, prefix: str = "") -> None:
+        """
+        Register phase times (s) and counters as runner values, named e.g. "time_http" and "requests".
+        """
+        summary = self.summary()
+        runner.registerValue(f"{prefix}time_total", "Total Time", summary["wall_seconds"], "s")
+        for name, totals in sorted(summary["phases"].items()):
+            runner.registerValue(f"{prefix}time_{name}", f"{name.replace('_', ' ').title()} Time", totals["seconds"], "s")
+        for name, value in sorted(summary["counters"].items()):
+            runner.registerValue(f"{prefix}{name}", name.replace("_", " ").title(), float(value), "")
+        if "peak_memory_mb" in summary:
+            runner.registerValue(f"{prefix}peak_memory", "Peak Python Memory", summary["peak_memory_mb"], "MB")
+
+    def write(self, path: str) -> str:
+        """
+        Write the summary as JSON, with a pstats file next to it in cprofile mode.
+        :return: absolute path of the written file
+        """
+        path = os.path.abspath(path)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.splitext(path)[0] + ".prof")
+        return path
@@ -0,0 +1,145 @@
+# Thermal performance upgrade of window constructions for an IGU option
+from typing import Dict, Optional, Tuple
+
+import openstudio
+
+# StandardGlazing properties set on the outermost glazing layer (surface 2 faces the gap) for each IGU option,
+# typical values of the coated products. Laminated, tempered and fire resistant glass change the strength
+# of the glazing but not its thermal performance, windows with these options keep their source construction.
+GLAZING_UPGRADES = {
+    "low_emissivity": {"setBackSideInfraredHemisphericalEmissivity": 0.04},
+    # static approximation at the clear state, the electrochromic stack includes a low-e coating. Transmittances come
+    # with their matching reflectances (transmittance + reflectance <= 1 on both sides) as spectral averages,
+    # spectral data of the source glass would no longer match them
+    "electrochromic": {"setOpticalDataType": "SpectralAverage",
+                       "setBackSideInfraredHemisphericalEmissivity": 0.04,
+                       "setSolarTransmittanceatNormalIncidence": 0.40,
+                       "setFrontSideSolarReflectanceatNormalIncidence": 0.20,
+                       "setBackSideSolarReflectanceatNormalIncidence": 0.20,
+                       "setVisibleTransmittanceatNormalIncidence": 0.60,
+                       "setFrontSideVisibleReflectanceatNormalIncidence": 0.10,
+                       "setBackSideVisibleReflectanceatNormalIncidence": 0.10},
+}
+
+# additional properties marking an upgraded construction or glazing material, with the handle of its source
+SOURCE_FEATURE = "Upgrade source construction"
+OPTION_FEATURE = "Upgrade IGU option"
+
+
+class ConstructionUpgrader:
+    """
+    One upgraded construction per source construction and IGU option, shared by every window using the source.
+
+    The upgraded construction is a copy of the source with its outermost glazing layer replaced by an upgraded
+    copy of that material, so layer count and thicknesses, and with them the embodied carbon, stay the same.
+    Upgrades made by earlier runs, constructions and glazing materials, are found through their additional properties
+    and reused, a window already carrying an upgraded construction is upgraded from its source again so options never stack.
+    """
+
+    def __init__(self, model: openstudio.model.Model, igu_option: str):
+        self.model = model
+        self.igu_option = igu_option
+        # (source construction handle, IGU option) -> upgraded construction, None when the source is kept
+        self.upgrades: Dict[Tuple[str, str], Optional[openstudio.model.Construction]] = {}
+        # upgraded construction handle -> source construction handle
+        self.sources: Dict[str, str] = {}
+        # (source material handle, IGU option) -> upgraded glazing material
+        self.materials: Dict[Tuple[str, str], openstudio.model.StandardGlazing] = {}
+        self.created = 0
+        # names of the source constructions without a StandardGlazing layer to upgrade
+        self.unsupported = []
+        for construction in model.getConstructions():
+            upgrade = self.upgrade_source(construction)
+            if upgrade is not None:
+                self.sources[str(construction.handle())] = upgrade[0]
+                self.upgrades[upgrade] = construction
+        for glazing in model.getStandardGlazings():
+            upgrade = self.upgrade_source(glazing)
+            if upgrade is not None:
+                self.materials[upgrade] = glazing
+
+    @staticmethod
+    def upgrade_source(model_object) -> Optional[Tuple[str, str]]:
+        """
+        (source handle, IGU option) of an object made by an upgrade, None for any other object.
+        """
+        # additionalProperties() would create an object for every construction and material
+        if not model_object.hasAdditionalProperties():
+            return None
+        additional_properties = model_object.additionalProperties()
+        source_handle = additional_properties.getFeatureAsString(SOURCE_FEATURE)
+        option = additional_properties.getFeatureAsString(OPTION_FEATURE)
+        if source_handle.is_initialized() and option.is_initialized():
+            return source_handle.get(), option.get()
+        return None
+
+    def mark(self, model_object, source) -> None:
+        additional_properties = model_object.additionalProperties()
+        additional_properties.setFeature(SOURCE_FEATURE, str(source.handle()))
+        additional_properties.setFeature(OPTION_FEATURE, self.igu_option)
+
+    def source(self, construction: openstudio.model.Construction) -> openstudio.model.Construction:
+        """
+        Construction an upgraded construction was made from, the construction itself otherwise.
+        """
+        source_handle = self.sources.get(str(construction.handle()))
+        if source_handle is not None:
+            source = self.model.getConstruction(openstudio.toUUID(source_handle))
+            if source.is_initialized():
+                return source.get()
+        return construction
+
+    def upgraded(self, construction: openstudio.model.Construction) -> Optional[openstudio.model.Construction]:
+        """
+        Upgraded construction for the IGU option, None when the construction is kept.
+        """
+        handle = str(construction.handle())
+        key = (self.sources.get(handle, handle), self.igu_option)
+        if key not in self.upgrades:
+            self.upgrades[key] = self.create(self.source(construction))
+        return self.upgrades[key]
+
+    def create(self, source: openstudio.model.Construction) -> Optional[openstudio.model.Construction]:
+        upgrades = GLAZING_UPGRADES.get(self.igu_option)
+        if upgrades is None:
+            return None
+        layers = list(source.layers())
+        index = next((i for i, layer in enumerate(layers) if layer.to_StandardGlazing().is_initialized()), None)
+        if index is None:
+            # e.g. SimpleGlazing constructions, their U-factor and SHGC are not derived from glass properties
+            self.unsupported.append(source.nameString())
+            return None
+
+        material_key = (str(layers[index].handle()), self.igu_option)
+        if material_key not in self.materials:
+            glazing = layers[index].clone(self.model).to_StandardGlazing().get()
+            glazing.setName(f"{layers[index].nameString()} {self.igu_option}")
+            for setter, value in upgrades.items():
+                getattr(glazing, setter)(value)
+            if "setOpticalDataType" in upgrades:
+                glazing.resetWindowGlassSpectralDataSetName()
+            self.mark(glazing, layers[index])
+            self.materials[material_key] = glazing
+
+        upgraded = source.clone(self.model).to_Construction().get()
+        upgraded.setName(f"{source.nameString()} {self.igu_option}")
+        upgraded.setLayer(index, self.materials[material_key])
+        self.mark(upgraded, source)
+        self.sources[str(upgraded.handle())] = str(source.handle())
+        self.created += 1
+        return upgraded
+
+    def upgrade(self, subsurface: openstudio.model.SubSurface) -> bool:
+        """
+        Assign the upgraded construction to a window, or its source construction when the option has no thermal effect.
+        return: True when the construction of the window changed
+        """
+        if not subsurface.construction().is_initialized() or not subsurface.construction().get().to_Construction().is_initialized():
+            return False
+        construction = subsurface.construction().get().to_Construction().get()
+        target = self.upgraded(construction)
+        if target is None:
+            target = self.source(construction)
+        if target.handle() == construction.handle():
+            return False
+        return subsurface.setConstruction(target)
@@ -0,0 +1,51 @@
+# Compact per-window records of the window enhancement measure
+from typing import Optional
+
+
+class WindowRecord:
+    """
+    Numbers, names and handles the embodied carbon calculation needs for one window.
+
+    No model object is kept: the subsurface is looked up again by handle when its results are written,
+    so the SWIG proxies of a window are released as soon as its data is extracted.
+    __slots__ keeps a record to a fixed set of attributes without a per-instance dictionary,
+    a fraction of the nested dictionaries it replaces on models with tens of thousands of windows.
+    """
+
+    __slots__ = ("name", "handle", "construction_name", "space", "orientation", "fingerprint", "number_of_panes",
+                 "glazing_area", "glazing_thickness", "glazing_volume", "frame_cross_section_area", "divider_cross_section_area",
+                 "frame_volume", "glazing_embodied_carbon", "frame_embodied_carbon", "epd_key", "reused")
+
+    def __init__(self, name: str, handle: str, construction_name: str, space: str, orientation: str, number_of_panes: int,
+                 glazing_area: float, glazing_volume: float, frame_volume: float, glazing_thickness: float = 0.0,
+                 frame_cross_section_area: float = 0.0, divider_cross_section_area: float = 0.0, fingerprint: Optional[str] = None,
+                 glazing_embodied_carbon: float = 0.0, frame_embodied_carbon: float = 0.0, epd_key: Optional[str] = None,
+                 reused: bool = False):
+        self.name = name
+        # str of the subsurface handle, openstudio.toUUID() turns it back into a handle
+        self.handle = handle
+        self.construction_name = construction_name
+        self.space = space
+        self.orientation = orientation
+        self.number_of_panes = number_of_panes
+        self.glazing_area = glazing_area
+        self.glazing_thickness = glazing_thickness
+        self.glazing_volume = glazing_volume
+        self.frame_cross_section_area = frame_cross_section_area
+        self.divider_cross_section_area = divider_cross_section_area
+        self.frame_volume = frame_volume
+        # hash of the inputs of the window, None when it is not stored
+        self.fingerprint = fingerprint
+        self.glazing_embodied_carbon = glazing_embodied_carbon
+        self.frame_embodied_carbon = frame_embodied_carbon
+        # hash of the EPD values the embodied carbon was computed with
+        self.epd_key = epd_key
+        # results stored by a previous run, not analyzed again
+        self.reused = reused
+
+    @property
+    def embodied_carbon(self) -> float:
+        return self.glazing_embodied_carbon + self.frame_embodied_carbon
+
+    def __repr__(self):
+        return f"WindowRecord({self.name!r}, {self.number_of_panes} panes, {self.glazing_area:.3f} m2, {self.embodied_carbon:.3f} kg CO2 eq)"
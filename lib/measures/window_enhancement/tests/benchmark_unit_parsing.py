@@ -0,0 +1,85 @@
+# Benchmark of the declared-unit parser against the former regex/substring parsing
+# run with `python tests/benchmark_unit_parsing.py` from the measure folder
+
+import random
+import sys
+import timeit
+from pathlib import Path
+
+CURRENT_DIR_PATH = Path(__file__).parent.absolute()
+sys.path.insert(0, str(CURRENT_DIR_PATH.parent))
+from resources.EC3_lookup import divide, extract_numeric_value, multiply, parse_quantity, product_gwp_values
+sys.path.pop(0)
+
+DECLARED_UNITS = ["1 m2", "1 m3", "1 t", "1000 kg", "1 sf", "1 cf", "1 unit", "10 sqft"]
+
+
+def legacy_product_gwp_values(epd):
+    """Substring based unit detection used before parse_quantity(), kept for comparison."""
+    gwp_per_m3 = None
+    gwp_per_m2 = None
+    declared_unit = epd.get("declared_unit") or ""
+    thickness = epd.get("thickness")
+    gwp_per_declared_unit = epd.get("gwp")
+    mass_per_declared_unit = epd.get("mass_per_declared_unit")
+    density = epd.get("density")
+    gwp_per_kg = epd.get("gwp_per_kg")
+
+    if gwp_per_kg != None:
+        gwp_per_kg = extract_numeric_value(gwp_per_kg)
+    elif "t" in declared_unit:
+        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit) / 1000
+    elif "kg" in declared_unit:
+        gwp_per_kg = divide(gwp_per_declared_unit, declared_unit)
+    elif mass_per_declared_unit != None:
+        gwp_per_kg = divide(gwp_per_declared_unit, mass_per_declared_unit)
+
+    if "m3" in declared_unit:
+        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit)
+    elif "cf" in declared_unit:
+        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit) * 35.3147
+    elif "m2" in declared_unit and thickness and "mm" in thickness:
+        gwp_per_m3 = divide(gwp_per_declared_unit, declared_unit) / (extract_numeric_value(thickness) / 1000)
+    elif density and "kg / m3" in density and gwp_per_kg:
+        gwp_per_m3 = multiply(gwp_per_kg, density)
+
+    if "m2" in declared_unit:
+        gwp_per_m2 = divide(gwp_per_declared_unit, declared_unit)
+    elif "sf" in declared_unit:
+        gwp_per_m2 = divide(gwp_per_declared_unit, declared_unit) * 10.7639
+    return gwp_per_kg, gwp_per_m2, gwp_per_m3
+
+
+def synthetic_epds(count, seed=0):
+    """EPD fields as returned by EC3, drawn from a realistic set of distinct strings."""
+    generator = random.Random(seed)
+    return [{
+        "declared_unit": generator.choice(DECLARED_UNITS),
+        "gwp": f"{generator.randint(1, 400)}.{generator.randint(0, 9)} kgCO2e",
+        "thickness": f"{generator.choice([4, 6, 8, 10, 24])} mm",
+        "mass_per_declared_unit": f"{generator.randint(5, 40)} kg",
+        "density": "2500 kg / m3",
+    } for _ in range(count)]
+
+
+def main(count=50000, repeat=5):
+    epds = synthetic_epds(count)
+    fields = [epd["declared_unit"] for epd in epds] + [epd["gwp"] for epd in epds]
+
+    results = {
+        "extract_numeric_value": min(timeit.repeat(lambda: [extract_numeric_value(field) for field in fields], number=1, repeat=repeat)),
+        "parse_quantity": min(timeit.repeat(lambda: [parse_quantity(field) for field in fields], number=1, repeat=repeat)),
+        "legacy_product_gwp_values": min(timeit.repeat(lambda: [legacy_product_gwp_values(epd) for epd in epds], number=1, repeat=repeat)),
+        "product_gwp_values": min(timeit.repeat(lambda: [product_gwp_values(epd) for epd in epds], number=1, repeat=repeat)),
+    }
+    print(f"{len(epds)} EPDs, {len(fields)} quantity fields, best of {repeat}")
+    for name, seconds in results.items():
+        print(f"{name:28s} {seconds * 1000:9.1f} ms")
+
+    # the substring tests read "1 unit" as tonnes, the parser does not
+    mismatches = sum(1 for epd in epds if legacy_product_gwp_values(epd)[0] != product_gwp_values(epd)[0])
+    print(f"EPDs whose gwp_per_kg differs from the legacy parsing: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Benchmarks of the window enhancement measure on generated models, no EC3 token or network needed
+# run with `python -m pytest tests/benchmark_window_enhancement.py` from the measure folder, needs pytest-benchmark
+# sizes default to 10, 1000 and 50000 windows, override with e.g. WINDOW_BENCHMARK_SIZES=10,1000
+# to catch regressions save a baseline and compare against it:
+#   python -m pytest tests/benchmark_window_enhancement.py --benchmark-autosave
+#   python -m pytest tests/benchmark_window_enhancement.py --benchmark-compare --benchmark-compare-fail=mean:20%
+
+import os
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+openstudio = pytest.importorskip("openstudio")
+pytest.importorskip("pytest_benchmark")
+
+CURRENT_DIR_PATH = Path(__file__).parent.absolute()
+sys.path.insert(0, str(CURRENT_DIR_PATH.parent))
+sys.path.insert(0, str(CURRENT_DIR_PATH))
+from measure import WindowEnhancement
+from resources import EC3_lookup
+from resources.EC3_snapshot import window_query_urls, write_snapshot
+from resources.calculate_perimeter import calculate_geometry, calculate_geometry_batch
+from benchmark_unit_parsing import synthetic_epds
+from synthetic_models import synthetic_window_model
+sys.path.pop(0)
+sys.path.pop(0)
+del sys.modules['measure']
+
+WINDOW_COUNTS = [int(count) for count in os.environ.get("WINDOW_BENCHMARK_SIZES", "10,1000,50000").split(",")]
+EPDS_PER_QUERY = 500
+
+
+def window_epds(material_name, count, seed=0):
+    """
+    EPDs as EC3 returns them for a query: IGUs declared per m2 with a thickness, extrusions per tonne with a density.
+    """
+    generator = random.Random(f"{material_name}-{seed}")
+    if material_name == "AluminiumExtrusions":
+        return [{"name": f"Extrusion {i}", "declared_unit": "1 t", "gwp": f"{generator.uniform(4000, 16000):.1f} kgCO2e",
+                 "density": "2700 kg / m3", "manufacturer": {"original_ec3_link": f"https://buildingtransparency.org/ec3/epds/{i}"}}
+                for i in range(count)]
+    return [{"name": f"IGU {i}", "declared_unit": "1 m2", "thickness": f"{generator.choice([6, 12, 24, 36])} mm",
+             "gwp": f"{generator.uniform(20, 120):.1f} kgCO2e", "gwp_per_kg": f"{generator.uniform(1, 3):.2f} kgCO2e",
+             "manufacturer": {"original_ec3_link": f"https://buildingtransparency.org/ec3/epds/{i}"}}
+            for i in range(count)]
+
+
+@pytest.fixture(scope="module")
+def snapshot_path(tmp_path_factory):
+    """
+    Recorded stand-in for the EC3 API: a snapshot answering every query of the measure.
+    """
+    path = tmp_path_factory.mktemp("ec3") / "ec3_snapshot.sqlite"
+    write_snapshot(str(path), {url: window_epds("AluminiumExtrusions" if "AluminiumExtrusions" in url else "InsulatingGlazingUnits", EPDS_PER_QUERY)
+                               for url in window_query_urls(epd_types=["Product"])})
+    return path
+
+
+@pytest.fixture(scope="module", params=WINDOW_COUNTS, ids=lambda count: f"{count}_windows")
+def window_count(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def window_model(window_count):
+    return synthetic_window_model(window_count)
+
+
+@pytest.fixture(scope="module")
+def windows(window_model):
+    return list(window_model.getSubSurfaces())
+
+
+def argument_map(measure, model, snapshot_path):
+    arguments = measure.arguments(model)
+    argument_map = openstudio.measure.convertOSArgumentVectorToMap(arguments)
+    args_dict = {"igu_option": "low_emissivity", "wf_option": "anodized", "gwp_statistic": "median",
+                 "epd_type": "Product", "snapshot_path": str(snapshot_path)}
+    for arg in arguments:
+        if arg.name() in args_dict:
+            temp_arg_var = arg.clone()
+            assert temp_arg_var.setValue(args_dict[arg.name()])
+            argument_map[arg.name()] = temp_arg_var
+    return argument_map
+
+
+class TestGeometryBenchmarks:
+    """Window geometry of every subsurface of a model."""
+
+    def test_calculate_geometry(self, benchmark, windows):
+        geometry = benchmark(lambda: [calculate_geometry(None, window) for window in windows])
+        assert len(geometry) == len(windows)
+
+    def test_calculate_geometry_batch(self, benchmark, windows):
+        geometry = benchmark(calculate_geometry_batch, windows)
+        assert len(geometry["area"]) == len(windows)
+
+
+class TestParsingBenchmarks:
+    """EPD parsing and GWP statistics, independent of the model size."""
+
+    @pytest.fixture(scope="class")
+    def epds(self):
+        return synthetic_epds(50000)
+
+    def test_parse_quantity(self, benchmark, epds):
+        fields = [epd["declared_unit"] for epd in epds] + [epd["gwp"] for epd in epds]
+        benchmark(lambda: [EC3_lookup.parse_quantity(field) for field in fields])
+
+    def test_product_gwp_values(self, benchmark, epds):
+        benchmark(lambda: [EC3_lookup.product_gwp_values(epd) for epd in epds])
+
+    def test_summarize_epds(self, benchmark, epds):
+        statistics = benchmark(EC3_lookup.summarize_epds, epds, "Product")
+        assert statistics["gwp_per_kg"].count > 0
+
+    def test_gwp_statistics_summary(self, benchmark, epds):
+        statistics = EC3_lookup.summarize_epds(epds, "Product")["gwp_per_m3"]
+        summary = benchmark(statistics.summary)
+        assert summary["median"] is not None
+
+
+class TestRunBenchmarks:
+    """End-to-end run of the measure answered from the recorded snapshot."""
+
+    def test_run(self, benchmark, window_count, snapshot_path, tmp_path, monkeypatch):
+        # the measure writes its result files to the working directory
+        monkeypatch.chdir(tmp_path)
+        measure = WindowEnhancement()
+        arguments = argument_map(measure, openstudio.model.Model(), snapshot_path)
+
+        def run(model):
+            runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+            measure.run(model, runner, arguments)
+            return runner.result()
+
+        def setup():
+            # a run stores its results on the windows and keeps the EPD summaries in memory, the next run on the same
+            # model would reuse all of them: every round gets a model of its own so the full analysis is timed
+            WindowEnhancement.clear_gwp_summaries()
+            return (synthetic_window_model(window_count),), {}
+
+        result = benchmark.pedantic(run, setup=setup, rounds=3, iterations=1, warmup_rounds=0)
+        assert result.value().valueName() == "Success"
+        assert not any("unchanged since the last run" in info.logMessage() for info in result.info())
+
+        # peak Python memory of the full analysis of one more fresh model, reported next to the timings
+        # (model objects held by OpenStudio are not counted)
+        (model,), _ = setup()
+        tracemalloc.start()
+        try:
+            run(model)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_python_memory_mb"] = peak / 2**20
+        benchmark.extra_info["peak_python_memory_bytes_per_window"] = peak / window_count
@@ -0,0 +1,102 @@
+# Generated OpenStudio models with many windows, used by the benchmarks
+
+import math
+
+import openstudio
+
+# outward normal azimuth of the generated facades, degrees clockwise from north
+FACADE_AZIMUTHS = [180.0, 90.0, 0.0, 270.0]
+WINDOWS_PER_SPACE = 100
+
+
+def glazing_constructions(model):
+    """
+    Single, double and triple pane window constructions, i.e. 1, 3 and 5 layers.
+    """
+    glass = openstudio.model.StandardGlazing(model)
+    glass.setName("Clear 6mm")
+    glass.setThickness(0.006)
+    low_e_glass = openstudio.model.StandardGlazing(model)
+    low_e_glass.setName("Low-e 6mm")
+    low_e_glass.setThickness(0.006)
+    gas = openstudio.model.Gas(model)
+    gas.setName("Argon 12mm")
+    gas.setThickness(0.012)
+
+    constructions = []
+    for name, layers in [("Single Pane", [glass]),
+                         ("Double Pane", [low_e_glass, gas, glass]),
+                         ("Triple Pane", [low_e_glass, gas, glass, gas, glass])]:
+        construction = openstudio.model.Construction(model)
+        construction.setName(name)
+        construction.setLayers(openstudio.model.MaterialVector(layers))
+        constructions.append(construction)
+    return constructions
+
+
+def frames(model):
+    """
+    Frames without and with dividers, None stands for windows relying on the frame_cross_section_area argument.
+    """
+    plain = openstudio.model.WindowPropertyFrameAndDivider(model)
+    plain.setName("Frame 50mm")
+    plain.setFrameWidth(0.05)
+    plain.setFrameOutsideProjection(0.02)
+    plain.setFrameInsideProjection(0.02)
+
+    divided = openstudio.model.WindowPropertyFrameAndDivider(model)
+    divided.setName("Frame 70mm with dividers")
+    divided.setFrameWidth(0.07)
+    divided.setFrameOutsideProjection(0.03)
+    divided.setFrameInsideProjection(0.01)
+    divided.setDividerWidth(0.02)
+    divided.setNumberOfHorizontalDividers(1)
+    divided.setNumberOfVerticalDividers(2)
+    divided.setDividerOutsideProjection(0.01)
+    divided.setDividerInsideProjection(0.01)
+    return [plain, divided, None]
+
+
+def facade_points(azimuth, x_offset, points):
+    """
+    Rotate (x, z) points of a south facing plane at y=0 so that its outward normal faces azimuth.
+    """
+    angle = math.radians(azimuth - 180.0)
+    cos_angle, sin_angle = math.cos(angle), math.sin(angle)
+    vertices = openstudio.Point3dVector()
+    for x, z in points:
+        x += x_offset
+        vertices.append(openstudio.Point3d(x * cos_angle, x * sin_angle, z))
+    return vertices
+
+
+def synthetic_window_model(num_windows):
+    """
+    Model holding num_windows windows, each in its own wall, spread over four facades,
+    every combination of three constructions and three frame options, window sizes and spaces of WINDOWS_PER_SPACE windows.
+    """
+    model = openstudio.model.Model()
+    constructions = glazing_constructions(model)
+    frame_options = frames(model)
+    space = None
+    for index in range(num_windows):
+        if index % WINDOWS_PER_SPACE == 0:
+            space = openstudio.model.Space(model)
+            space.setName(f"Space {index // WINDOWS_PER_SPACE + 1}")
+        azimuth = FACADE_AZIMUTHS[index % len(FACADE_AZIMUTHS)]
+        x_offset = 4.0 * (index // len(FACADE_AZIMUTHS))
+        width = 1.0 + 0.25 * (index % 5)
+        height = 1.2 + 0.2 * ((index // 5) % 3)
+
+        wall = openstudio.model.Surface(facade_points(azimuth, x_offset, [(0.0, 3.0), (0.0, 0.0), (3.5, 0.0), (3.5, 3.0)]), model)
+        wall.setSpace(space)
+        window = openstudio.model.SubSurface(facade_points(azimuth, x_offset, [(0.5, 0.8 + height), (0.5, 0.8),
+                                                                               (0.5 + width, 0.8), (0.5 + width, 0.8 + height)]), model)
+        window.setSurface(wall)
+        window.setSubSurfaceType("FixedWindow")
+        # every construction is paired with every frame option, each run of len(constructions) windows steps to the next frame
+        window.setConstruction(constructions[index % len(constructions)])
+        frame = frame_options[(index // len(constructions)) % len(frame_options)]
+        if frame is not None:
+            window.setWindowPropertyFrameAndDivider(frame)
+    return model
@@ -8,7 +8,10 @@ import openstudio
 import pytest
 import gc
 import os
+import json
+import time
 import configparser
+from urllib.parse import parse_qsl
 
 CURRENT_DIR_PATH = Path(__file__).parent.absolute()
 MEASURE_PATH = CURRENT_DIR_PATH.parent / "measure.py"
@@ -17,9 +20,48 @@ if not MEASURE_PATH.exists():
 
 sys.path.insert(0, str(CURRENT_DIR_PATH.parent))
 from measure import WindowEnhancement
+# only the modules of the standard library and openstudio are imported here, the tests needing numpy
+# or requests import them themselves so the argument tests run without the lookup dependencies
+from resources.EC3_cache import EPDCache, normalize_url
+from resources.EC3_snapshot import EPDSnapshot, window_queries, window_query_urls, write_snapshot
+from resources.EC3_planner import QueryPlanner, belongs_to, merging_enabled
+from resources.EC3_mock_server import MockEC3Server, matches, parse_filter, synthetic_window_epds
+from resources.diagnostics import Diagnostics
+from resources.carbon_report import CarbonReport, facade_orientation
+from resources.thermal_upgrade import ConstructionUpgrader
+from resources.profiling import Profiler
+import portfolio
+sys.path.pop(0)
+sys.path.insert(0, str(CURRENT_DIR_PATH))
+from synthetic_models import synthetic_window_model
 sys.path.pop(0)
 del sys.modules['measure']
 
+# EPDs answering every glazing and frame query of a snapshot
+GLAZING_EPD = {"name": "IGU", "declared_unit": "1 m2", "thickness": "24 mm", "gwp": "30 kgCO2e",
+               "gwp_per_kg": "2 kgCO2e", "manufacturer": {"original_ec3_link": "https://buildingtransparency.org"}}
+FRAME_EPD = {"name": "Extrusion", "declared_unit": "1 t", "gwp": "8000 kgCO2e", "density": "2700 kg / m3",
+             "manufacturer": {"original_ec3_link": "https://buildingtransparency.org"}}
+
+def make_argument_map(measure, model, **values):
+    """Argument map of the measure with the given argument values, the other arguments keep their defaults."""
+    arguments = measure.arguments(model)
+    argument_map = openstudio.measure.convertOSArgumentVectorToMap(arguments)
+    for arg in arguments:
+        if arg.name() in values:
+            temp_arg_var = arg.clone()
+            assert temp_arg_var.setValue(values[arg.name()])
+            argument_map[arg.name()] = temp_arg_var
+    return argument_map
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Snapshot answering every Product query with GLAZING_EPD or FRAME_EPD."""
+    path = tmp_path / "ec3_snapshot.sqlite"
+    write_snapshot(str(path), {url: [FRAME_EPD] if "AluminiumExtrusions" in url else [GLAZING_EPD]
+                               for url in window_query_urls(epd_types=["Product"])})
+    return path
+
 @pytest.fixture
 def model():
     translator = openstudio.osversion.VersionTranslator()
@@ -32,6 +74,13 @@ def model():
 def measure():
     return WindowEnhancement()
 
+@pytest.fixture
+def EC3_lookup():
+    """EC3 lookup module, the tests using it are skipped when requests is not installed."""
+    pytest.importorskip("requests")
+    from resources import EC3_lookup
+    return EC3_lookup
+
 @pytest.fixture
 def argument_map(model, measure):
     arguments = measure.arguments(model)
@@ -78,7 +127,7 @@ class TestWindowEnhancement:
         model = openstudio.model.Model()
         arguments = measure.arguments(model)
 
-        assert arguments.size() == 10  # Adjust the expected size if necessary
+        assert arguments.size() == 16  # Adjust the expected size if necessary
         assert arguments[0].name() == "analysis_period"
         assert arguments[1].name() == "igu_option"
         assert arguments[2].name() == "igu_lifetime"
@@ -89,13 +138,31 @@ class TestWindowEnhancement:
         assert arguments[7].name() == "gwp_statistic"
         assert arguments[8].name() == "total_embodied_carbon"
         assert arguments[9].name() == "api_key"
+        assert arguments[10].name() == "max_concurrent_requests"
+        assert arguments[11].name() == "snapshot_path"
+        assert arguments[12].name() == "verbosity"
+        assert arguments[13].name() == "uncertainty_samples"
+        assert arguments[14].name() == "upgrade_constructions"
+        assert arguments[15].name() == "profiling"
 
         del model
         gc.collect()
 
-    def test_good_argument_values(self):
+    def test_arguments_do_not_load_lookup_dependencies(self):
+        """Listing the arguments needs neither numpy, requests nor the EC3 modules."""
+        import subprocess
+        script = ("import sys; from measure import WindowEnhancement; WindowEnhancement().arguments(); "
+                  "print(sorted(name for name in ('numpy', 'requests', 'resources.EC3_lookup') if name in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", script], cwd=str(CURRENT_DIR_PATH.parent),
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    def test_good_argument_values(self, tmp_path, monkeypatch):
         """Test running the measure with appropriate arguments."""
         print("Running test_good_argument_values()...")
+        # result files and EC3 responses stay out of the source tree and the user cache
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("EC3_CACHE_DIR", str(tmp_path / "cache"))
 
         model_path = Path(CURRENT_DIR_PATH / "example_model_2.osm").absolute()
         translator = openstudio.osversion.VersionTranslator()
@@ -161,6 +228,250 @@ class TestWindowEnhancement:
         del model
         gc.collect()
 
+    def test_run_from_snapshot(self, snapshot_path, tmp_path, monkeypatch):
+        """Test running the measure offline, answering every EPD lookup from a snapshot."""
+        from resources import EC3_lookup
+        monkeypatch.chdir(tmp_path)
+        with EPDSnapshot(str(snapshot_path)) as snapshot:
+            assert snapshot.fetch_epd_data(EC3_lookup.generate_url("AluminiumExtrusions", date="2000-01-01")) == [FRAME_EPD]
+
+        model_path = Path(CURRENT_DIR_PATH / "example_model.osm").absolute()
+        translator = openstudio.osversion.VersionTranslator()
+        model = translator.loadModel(openstudio.toPath(str(model_path))).get()
+
+        osw = openstudio.WorkflowJSON()
+        runner = openstudio.measure.OSRunner(osw)
+        measure = WindowEnhancement()
+        argument_map = make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                         gwp_statistic="median", epd_type="Product", snapshot_path=str(snapshot_path),
+                                         uncertainty_samples=1000)
+
+        measure.run(model, runner, argument_map)
+        result = runner.result()
+        assert result.value().valueName() == "Success"
+
+        embodied_carbon = [sub_surface.additionalProperties().getFeatureAsDouble("Embodied carbon")
+                           for sub_surface in model.getSubSurfaces()]
+        assert any(value.is_initialized() and value.get() > 0 for value in embodied_carbon)
+
+        # building totals are registered and written without reloading the model
+        step_values = {value.name(): value for value in result.stepValues()}
+        total = sum(value.get() for value in embodied_carbon if value.is_initialized())
+        assert step_values["window_embodied_carbon"].valueAsDouble() == pytest.approx(total)
+        # one EPD per query leaves no spread
+        assert step_values["window_embodied_carbon_p_50"].valueAsDouble() == pytest.approx(total)
+        with open(tmp_path / "window_enhancement_results.json") as file:
+            results = json.load(file)
+        assert results["building"]["Building"]["embodied_carbon_kg_co2e"] == pytest.approx(total)
+        assert sum(totals["embodied_carbon_kg_co2e"] for totals in results["orientation"].values()) == pytest.approx(total)
+        assert (tmp_path / "window_enhancement_results.csv").exists()
+
+        # phase timings and lookup counters
+        assert step_values["time_epd_lookup"].valueAsDouble() > 0
+        # one frame query and at least one glazing query
+        assert step_values["snapshot_reads"].valueAsDouble() >= 2
+        with open(tmp_path / "window_enhancement_profile.json") as file:
+            profile = json.load(file)
+        assert {"model_traversal", "epd_lookup", "parse", "embodied_carbon"} <= set(profile["phases"])
+
+        del model
+        gc.collect()
+
+    def test_rerun_reuses_unchanged_windows(self, snapshot_path, tmp_path, monkeypatch):
+        """Test that a second run only analyzes the windows changed since the first run."""
+        monkeypatch.chdir(tmp_path)
+        model_path = Path(CURRENT_DIR_PATH / "example_model.osm").absolute()
+        translator = openstudio.osversion.VersionTranslator()
+        model = translator.loadModel(openstudio.toPath(str(model_path))).get()
+        measure = WindowEnhancement()
+        argument_map = make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                         gwp_statistic="median", epd_type="Product", snapshot_path=str(snapshot_path))
+
+        def run():
+            runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+            measure.run(model, runner, argument_map)
+            result = runner.result()
+            assert result.value().valueName() == "Success"
+            infos = [info.logMessage() for info in result.info()]
+            step_values = {value.name(): value for value in result.stepValues()}
+            return infos, step_values["window_embodied_carbon"].valueAsDouble()
+
+        infos, first_total = run()
+        assert not any("unchanged since the last run" in info for info in infos)
+
+        infos, second_total = run()
+        assert second_total == pytest.approx(first_total)
+        assert any("unchanged since the last run" in info and ", 0 windows are analyzed" in info for info in infos)
+
+        # moving one window only analyzes that window again
+        sub_surface = next(sub_surface for sub_surface in model.getSubSurfaces()
+                           if sub_surface.additionalProperties().getFeatureAsString("Embodied carbon fingerprint").is_initialized())
+        vertices = sub_surface.vertices()
+        assert sub_surface.setVertices([openstudio.Point3d(vertex.x(), vertex.y(), vertex.z() + 0.01) for vertex in vertices])
+        infos, _ = run()
+        assert any(", 1 windows are analyzed" in info for info in infos)
+
+        del model
+        gc.collect()
+
+    def test_each_query_is_fetched_once(self, snapshot_path, tmp_path, monkeypatch):
+        """Windows sharing a number of panes share one EPD query, every distinct query is fetched once per run."""
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(WindowEnhancement, "gwp_summaries", None)
+        fetched_urls = []
+        fetch_epd_data = EPDSnapshot.fetch_epd_data
+        monkeypatch.setattr(EPDSnapshot, "fetch_epd_data", lambda self, url, cache=None: fetched_urls.append(url) or fetch_epd_data(self, url))
+
+        # single, double and triple pane windows
+        model = synthetic_window_model(18)
+        measure = WindowEnhancement()
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        measure.run(model, runner, make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                                     gwp_statistic="median", epd_type="Product", snapshot_path=str(snapshot_path)))
+        assert runner.result().value().valueName() == "Success"
+        # one frame query and one glazing query per number of panes
+        assert len(fetched_urls) == len(set(fetched_urls)) == 4
+
+    def test_invalid_argument_stops_the_run(self, snapshot_path, tmp_path, monkeypatch):
+        """An invalid argument value fails the run before the model is changed."""
+        monkeypatch.chdir(tmp_path)
+        model = synthetic_window_model(6)
+        num_constructions = len(model.getConstructions())
+        measure = WindowEnhancement()
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        argument_map = make_argument_map(measure, model, igu_option="low_emissivity", epd_type="Product", max_concurrent_requests=0,
+                                         snapshot_path=str(snapshot_path), upgrade_constructions=True)
+        assert not measure.run(model, runner, argument_map)
+        assert runner.result().value().valueName() == "Fail"
+        assert len(model.getConstructions()) == num_constructions
+        assert not any(sub_surface.hasAdditionalProperties() for sub_surface in model.getSubSurfaces())
+        assert not (tmp_path / "window_enhancement_results.json").exists()
+
+    def test_constructions_and_frames_are_analyzed_once(self, snapshot_path, tmp_path, monkeypatch):
+        """Windows sharing a construction and frame reuse their analysis within a run."""
+        monkeypatch.chdir(tmp_path)
+        analyzed = []
+        analyze_construction, analyze_frame = WindowEnhancement.analyze_construction, WindowEnhancement.analyze_frame
+        monkeypatch.setattr(WindowEnhancement, "analyze_construction",
+                            lambda self, *args: analyzed.append("construction") or analyze_construction(self, *args))
+        monkeypatch.setattr(WindowEnhancement, "analyze_frame", lambda self, *args: analyzed.append("frame") or analyze_frame(self, *args))
+
+        # every pair of the 3 constructions and 3 frame options, one without a frame object, twice over
+        model = synthetic_window_model(18)
+        measure = WindowEnhancement()
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        measure.run(model, runner, make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                                     gwp_statistic="median", epd_type="Product", snapshot_path=str(snapshot_path)))
+        assert runner.result().value().valueName() == "Success"
+        assert analyzed.count("construction") == 3 and analyzed.count("frame") == 6
+        infos = [info.logMessage() for info in runner.result().info()]
+        assert "Analyzed 3 distinct constructions and 6 distinct frames for 18 windows" in infos
+
+    def test_chunked_traversal_matches_a_single_chunk(self, snapshot_path, tmp_path, monkeypatch):
+        """Windows taken from the model in small chunks give the results of a single pass."""
+        monkeypatch.chdir(tmp_path)
+        totals = []
+        for chunk_size in [WindowEnhancement.WINDOW_CHUNK_SIZE, 4]:
+            monkeypatch.setattr(WindowEnhancement, "WINDOW_CHUNK_SIZE", chunk_size)
+            model = synthetic_window_model(18)
+            measure = WindowEnhancement()
+            runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+            measure.run(model, runner, make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                                         gwp_statistic="median", epd_type="Product", snapshot_path=str(snapshot_path)))
+            assert runner.result().value().valueName() == "Success"
+            step_values = {value.name(): value for value in runner.result().stepValues()}
+            totals.append(step_values["window_embodied_carbon"].valueAsDouble())
+            with open(tmp_path / "window_enhancement_results.json") as file:
+                assert sum(group["windows"] for group in json.load(file)["orientation"].values()) == 18
+        assert totals[1] == pytest.approx(totals[0]) and totals[0] > 0
+
+        # chunks hold every subsurface once, including those of surfaces outside any space
+        model = synthetic_window_model(10)
+        wall = openstudio.model.Surface([openstudio.Point3d(0, 0, 3), openstudio.Point3d(0, 0, 0),
+                                         openstudio.Point3d(4, 0, 0), openstudio.Point3d(4, 0, 3)], model)
+        window = openstudio.model.SubSurface([openstudio.Point3d(1, 0, 2), openstudio.Point3d(1, 0, 1),
+                                              openstudio.Point3d(2, 0, 1), openstudio.Point3d(2, 0, 2)], model)
+        window.setSurface(wall)
+        chunks = list(WindowEnhancement.sub_surface_chunks(model))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 3]
+        handles = [str(subsurface.handle()) for chunk in chunks for subsurface in chunk]
+        assert sorted(handles) == sorted(str(subsurface.handle()) for subsurface in model.getSubSurfaces())
+
+        # records keep no per-instance dictionary
+        from resources.window_records import WindowRecord
+        record = WindowRecord("Window", "handle", "Construction", "Space", "North", 2, 1.0, 0.01, 0.001)
+        assert not hasattr(record, "__dict__")
+
+    def test_output_directory_is_the_run_folder(self, tmp_path, monkeypatch):
+        """Result files go to the run folder of an OSW workflow, to the working directory otherwise."""
+        monkeypatch.chdir(tmp_path)
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        assert Path(WindowEnhancement.output_directory(runner)).resolve() == tmp_path.resolve()
+        workflow = openstudio.WorkflowJSON()
+        workflow.setOswPath(openstudio.toPath(str(tmp_path / "workflow" / "workflow.osw")))
+        run_dir = Path(WindowEnhancement.output_directory(openstudio.measure.OSRunner(workflow)))
+        assert run_dir.resolve() == (tmp_path / "workflow" / "run").resolve() and run_dir.is_dir()
+
+    def test_upgrade_constructions(self):
+        """Test that each source construction gets one upgraded copy shared by all its windows."""
+        model = synthetic_window_model(60)
+        source_constructions = {str(window.construction().get().handle()) for window in model.getSubSurfaces()}
+        num_constructions = len(model.getConstructions())
+
+        upgrader = ConstructionUpgrader(model, "low_emissivity")
+        assert all(upgrader.upgrade(window) for window in model.getSubSurfaces())
+        assert upgrader.created == len(source_constructions)
+        assert len(model.getConstructions()) == num_constructions + len(source_constructions)
+        upgraded_constructions = {str(window.construction().get().handle()) for window in model.getSubSurfaces()}
+        assert len(upgraded_constructions) == len(source_constructions)
+        assert not upgraded_constructions & source_constructions
+        for handle in upgraded_constructions:
+            construction = model.getConstruction(openstudio.toUUID(handle)).get()
+            outer_glazing = construction.layers()[0].to_StandardGlazing().get()
+            assert outer_glazing.backSideInfraredHemisphericalEmissivity() == pytest.approx(0.04)
+
+        # a later run finds the upgrades instead of creating new ones
+        upgrader = ConstructionUpgrader(model, "low_emissivity")
+        assert not any(upgrader.upgrade(window) for window in model.getSubSurfaces())
+        assert upgrader.created == 0
+
+        # a new source construction of a later run reuses the upgraded glazing material of the same glass
+        num_glazings = len(model.getStandardGlazings())
+        window = model.getSubSurfaces()[0]
+        source = upgrader.source(window.construction().get().to_Construction().get())
+        copy = source.clone(model).to_Construction().get()
+        window.setConstruction(copy)
+        upgrader = ConstructionUpgrader(model, "low_emissivity")
+        assert upgrader.upgrade(window) and upgrader.created == 1
+        assert len(model.getStandardGlazings()) == num_glazings
+
+        # electrochromic glass gets reflectances matching its transmittances
+        upgrader = ConstructionUpgrader(model, "electrochromic")
+        assert upgrader.upgrade(window)
+        glazing = window.construction().get().to_Construction().get().layers()[0].to_StandardGlazing().get()
+        assert glazing.opticalDataType() == "SpectralAverage"
+        assert glazing.solarTransmittanceatNormalIncidence().get() + glazing.frontSideSolarReflectanceatNormalIncidence().get() <= 1.0
+        assert glazing.visibleTransmittanceatNormalIncidence().get() + glazing.backSideVisibleReflectanceatNormalIncidence().get() <= 1.0
+
+        # options without a thermal effect give the windows their source construction back, the copy is the source of its window
+        upgrader = ConstructionUpgrader(model, "tempered")
+        assert all(upgrader.upgrade(window) for window in model.getSubSurfaces())
+        assert {str(window.construction().get().handle()) for window in model.getSubSurfaces()} == source_constructions | {str(copy.handle())}
+        assert upgrader.created == 0
+
+        # constructions without a standard glazing layer are kept and reported
+        simple_glazing = openstudio.model.SimpleGlazing(model)
+        simple_construction = openstudio.model.Construction(model)
+        simple_construction.setName("Simple glazing window")
+        simple_construction.setLayers([simple_glazing])
+        window.setConstruction(simple_construction)
+        upgrader = ConstructionUpgrader(model, "low_emissivity")
+        assert not upgrader.upgrade(window)
+        assert upgrader.unsupported == ["Simple glazing window"]
+
+        del model
+        gc.collect()
+
     def no_test_measure_changes_building(self, model, measure, argument_map):
         """Test if the measure changes the building object."""
         print("Running test_measure_changes_building()...")
@@ -168,8 +479,9 @@ class TestWindowEnhancement:
         # there was not any functional content in this test currently to check for change in building object.
 
 
-    def test_apply_measure(self):
-   
+    def test_apply_measure(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("EC3_CACHE_DIR", str(tmp_path / "cache"))
         model_path = Path(CURRENT_DIR_PATH / "example_model.osm").absolute()
         translator = openstudio.osversion.VersionTranslator()
         model = translator.loadModel(openstudio.toPath(str(model_path))).get()
@@ -238,5 +550,567 @@ class TestWindowEnhancement:
         del model
         gc.collect()    
 
+class TestGeometry:
+    """Py.test module for the vectorized window geometry."""
+
+    def test_polygon_geometry_handles_any_polygon(self):
+        from resources.calculate_perimeter import polygon_geometry
+        rectangle = [[0, 0, 3], [0, 0, 0], [2, 0, 0], [2, 0, 3]]
+        triangle = [[0, 0, 0], [4, 0, 0], [0, 3, 0], [0, 3, 0]]  # padded with its last vertex
+        geometry = polygon_geometry([rectangle, triangle])
+        assert geometry["area"] == pytest.approx([6.0, 6.0])
+        assert geometry["perimeter"] == pytest.approx([10.0, 12.0])
+        assert geometry["length"] == pytest.approx([3.0, 4.0])
+        assert geometry["width"] == pytest.approx([2.0, 3.0])
+
+    def test_batch_matches_model_sub_surfaces(self):
+        from resources.calculate_perimeter import calculate_geometry_batch
+        model = openstudio.model.Model()
+        space = openstudio.model.Space(model)
+        points = openstudio.Point3dVector()
+        for x, y, z in [(0, 0, 3), (0, 0, 0), (10, 0, 0), (10, 0, 3)]:
+            points.append(openstudio.Point3d(x, y, z))
+        surface = openstudio.model.Surface(points, model)
+        surface.setSpace(space)
+        windows = []
+        for vertices in [[(1, 0, 2), (1, 0, 1), (3, 0, 1), (3, 0, 2)], [(5, 0, 2), (5, 0, 1), (6, 0, 1)]]:
+            points = openstudio.Point3dVector()
+            for x, y, z in vertices:
+                points.append(openstudio.Point3d(x, y, z))
+            window = openstudio.model.SubSurface(points, model)
+            window.setSurface(surface)
+            windows.append(window)
+
+        geometry = calculate_geometry_batch(windows)
+        assert geometry["area"] == pytest.approx([window.grossArea() for window in windows])
+        assert geometry["perimeter"] == pytest.approx([6.0, 2.0 + 2 ** 0.5])
+
+        del model
+        gc.collect()
+
+class TestDiagnostics:
+    """Py.test module for the leveled measure diagnostics."""
+
+    def test_levels_and_buffered_records(self, tmp_path):
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        quiet = Diagnostics(runner, "quiet")
+        quiet.info("hidden")
+        quiet.debug("window", subsurface="Sub Surface 1")
+        assert quiet.write(str(tmp_path / "quiet.jsonl")) == ""
+
+        debug = Diagnostics(runner, "debug")
+        debug.info("shown")
+        debug.debug("window", subsurface="Sub Surface 1")
+        debug.debug("window", subsurface="Sub Surface 2")
+        path = debug.write(str(tmp_path / "debug.jsonl"))
+        records = [json.loads(line) for line in open(path)]
+        assert [record["subsurface"] for record in records] == ["Sub Surface 1", "Sub Surface 2"]
+        assert list(runner.result().stepInfo()) == ["shown"]
+
+class TestPortfolio:
+    """Py.test module for running the measure over many models."""
+
+    def test_run_portfolio_with_shared_gwp_table(self, snapshot_path, tmp_path):
+        manifest = tmp_path / "models.txt"
+        manifest.write_text("\n".join(str(CURRENT_DIR_PATH / name) for name in ["example_model.osm", "example_model_2.osm"]))
+
+        argument_values = {"igu_option": "low_emissivity", "wf_option": "anodized", "epd_type": "Product",
+                           "gwp_statistic": "median", "snapshot_path": str(snapshot_path)}
+        json_path, csv_path = portfolio.run_portfolio(portfolio.model_paths(str(manifest)), argument_values,
+                                                      str(tmp_path / "results"), processes=2)
+        with open(json_path) as file:
+            results = json.load(file)["models"]
+        assert [result["status"] for result in results] == ["Success", "Success"]
+        assert all(result["building"]["Building"]["embodied_carbon_kg_co2e"] > 0 for result in results)
+        with open(csv_path) as file:
+            assert len(file.read().splitlines()) == 3
+        assert not any("saved_model" in result for result in results)
+
+        # saved models keep the stored window results, a portfolio over them reuses every window
+        json_path, _ = portfolio.run_portfolio(portfolio.model_paths(str(manifest)), argument_values,
+                                               str(tmp_path / "saved"), processes=2, save_models=True)
+        with open(json_path) as file:
+            results = json.load(file)["models"]
+        saved_model = openstudio.osversion.VersionTranslator().loadModel(openstudio.toPath(results[0]["saved_model"])).get()
+        assert any(sub_surface.additionalProperties().getFeatureAsString("Embodied carbon fingerprint").is_initialized()
+                   for sub_surface in saved_model.getSubSurfaces())
+
+class TestCarbonReport:
+    """Py.test module for the building level embodied carbon totals."""
+
+    def test_facade_orientation(self):
+        assert [facade_orientation(azimuth, 90.0) for azimuth in [0.0, 90.0, 180.0, 270.0, 350.0]] == ["North", "East", "South", "West", "North"]
+        assert facade_orientation(180.0, 0.0) == "Roof"
+
+    def test_totals_and_outputs(self, tmp_path):
+        report = CarbonReport(total_embodied_carbon=1000.0)
+        report.add("South", "Double Pane", "Office", 2.0, 30.0, 10.0)
+        report.add("North", "Double Pane", "Office", 1.0, 15.0, 5.0)
+        assert report.building["embodied_carbon_kg_co2e"] == 60.0
+        assert report.totals["construction"]["Double Pane"]["windows"] == 2
+        assert report.totals["orientation"]["South"]["area_m2"] == 2.0
+        assert report.window_share() == pytest.approx(6.0)
+        assert CarbonReport().window_share() is None
+
+        with open(report.write_json(str(tmp_path / "results.json"))) as file:
+            assert json.load(file)["space"]["Office"]["windows"] == 2
+        with open(report.write_csv(str(tmp_path / "results.csv"))) as file:
+            rows = file.read().splitlines()
+        assert rows[0] == "group,key,windows,area_m2,glazing_kg_co2e,frame_kg_co2e,embodied_carbon_kg_co2e"
+        assert "orientation,South,1,2.0,30.0,10.0,40.0" in rows
+
+class TestUncertainty:
+    """Py.test module for the Monte Carlo embodied carbon."""
+
+    def test_single_value_distributions_give_the_deterministic_total(self):
+        from resources.uncertainty import sample_embodied_carbon
+        totals = sample_embodied_carbon([[100.0], [200.0, float("nan")]], [0, 1, 0], [1.0, 2.0, 3.0], samples=50)
+        assert totals == pytest.approx([800.0] * 50)
+
+    def test_percentiles_of_sampled_totals(self):
+        import numpy as np
+        from resources.uncertainty import sample_embodied_carbon, summarize_samples
+        gwp_values = [np.linspace(1000.0, 5000.0, 200), np.linspace(8000.0, 12000.0, 50), []]
+        query_index = np.random.default_rng(0).integers(0, 3, 10000)
+        totals = sample_embodied_carbon(gwp_values, query_index, np.full(10000, 0.01), samples=10000, seed=1)
+        assert totals == pytest.approx(sample_embodied_carbon(gwp_values, query_index, np.full(10000, 0.01), samples=10000, seed=1))
+        summary = summarize_samples(totals)
+        assert summary["p10"] < summary["p50"] < summary["p90"]
+        assert summary["samples"] == 10000
+
+class TestEPDCache:
+    """Py.test module for the local EC3 response cache."""
+
+    URL = ("https://api.buildingtransparency.org/api/materials?page_number=1&page_size=250"
+           "&mf=!EC3%20search(%22InsulatingGlazingUnits%22)%20WHERE%20%0A%20%20"
+           "epd__date_validity_ends%3A%20%3E%20%22{date}%22%20AND%0A%20%20")
+
+    def test_normalized_url_ignores_query_date(self):
+        assert normalize_url(self.URL.format(date="2025-04-18")) == normalize_url(self.URL.format(date="2025-05-01"))
+
+    def test_round_trip_and_expiry(self, tmp_path):
+        cache = EPDCache(cache_dir=str(tmp_path), ttl_days=1)
+        url = self.URL.format(date="2025-04-18")
+        assert cache.get(url) is None
+        cache.set(url, [{"name": "IGU"}])
+        assert cache.get(self.URL.format(date="2025-04-19")) == [{"name": "IGU"}]
+
+        # an EPD whose validity already ended expires the entry, it is still available as a stale fallback
+        cache.set(url, [{"name": "IGU", "date_validity_ends": "2000-01-01"}])
+        assert cache.get(url) is None
+        assert cache.get(url, allow_stale=True) == [{"name": "IGU", "date_validity_ends": "2000-01-01"}]
+
+    def test_least_recently_used_eviction(self, tmp_path):
+        cache = EPDCache(cache_dir=str(tmp_path), ttl_days=1, max_bytes=10**9)
+        urls = [self.URL.format(date="2025-04-18") + f"&material={i}" for i in range(3)]
+        for i, url in enumerate(urls):
+            cache.set(url, [{"name": "x" * 100}])
+            os.utime(cache.path(url), (1000 + i, 1000 + i))
+        cache.get(urls[0])  # most recently used now
+
+        cache.max_bytes = os.path.getsize(cache.path(urls[0])) + os.path.getsize(cache.path(urls[2]))
+        assert cache.evict() == 1
+        assert cache.get(urls[1]) is None
+        assert cache.get(urls[0]) is not None and cache.get(urls[2]) is not None
+
+    def test_writes_do_not_scan_the_cache_folder(self, tmp_path, monkeypatch):
+        cache = EPDCache(cache_dir=str(tmp_path), ttl_days=1, max_bytes=10**9)
+        scans = []
+        entries = EPDCache.entries
+        monkeypatch.setattr(EPDCache, "entries", lambda self, suffix=".json": scans.append(suffix) or entries(self, suffix))
+        for i in range(50):
+            cache.set(self.URL.format(date="2025-04-18") + f"&material={i}", [{"name": "x" * 100}])
+        # one scan of the entries and lock files on the first write, the size is tracked from there
+        assert scans == [".lock", ".json"]
+        # going over the limit scans and evicts right away
+        cache.max_bytes = os.path.getsize(cache.path(self.URL.format(date="2025-04-18") + "&material=0")) * 10
+        cache.set(self.URL.format(date="2025-04-18") + "&material=50", [{"name": "x" * 100}])
+        assert len(entries(cache)) <= 10
+
+    def test_memory_cache_expiry_and_size(self, monkeypatch):
+        from resources.EC3_cache import MemoryCache
+        memo = MemoryCache(max_entries=2)
+        memo.set("a", 1)
+        memo.set("b", 2, expires_at=time.time() + 60)
+        memo.get("a")  # most recently used now
+        memo.set("c", 3)
+        assert (memo.get("a"), memo.get("b"), memo.get("c")) == (1, None, 3)
+        monkeypatch.setattr(time, "time", lambda: 10.0**10)
+        memo.set("d", 4, expires_at=10.0**10 - 1)
+        assert memo.get("d") is None and memo.get("c") == 3
+        memo.clear()
+        assert len(memo) == 0
+
+    def test_query_lock_times_out_while_held(self, tmp_path):
+        url = self.URL.format(date="2025-04-18")
+        with EPDCache(cache_dir=str(tmp_path)).query_lock(url) as acquired:
+            assert acquired
+            # another cache instance stands for another process sharing the folder
+            with EPDCache(cache_dir=str(tmp_path)).query_lock(url, timeout=0.2) as waited:
+                assert not waited
+        cache = EPDCache(cache_dir=str(tmp_path))
+        with cache.query_lock(url, timeout=0.2) as acquired:
+            assert acquired
+        # the holder removes its lock file and the in-memory lock of the query
+        assert cache.entries(".lock") == [] and cache._query_locks == {}
+
+class TestEC3Lookup:
+    """Py.test module for the EC3 lookup helpers that do not need the API."""
+
+    class FakeSession:
+        """Stands in for requests.Session, serving EPDs in pages."""
+
+        def __init__(self, epds):
+            self.epds = epds
+            self.headers = {}
+            self.requested_urls = []
+
+        def get(self, url, timeout=None, verify=True):
+            import requests
+
+            self.requested_urls.append(url)
+            page_number = int(url.split("page_number=")[1].split("&")[0])
+            page_size = int(url.split("page_size=")[1].split("&")[0])
+            response = requests.Response()
+            response.status_code = 200
+            response._content = json.dumps(self.epds[(page_number - 1) * page_size:page_number * page_size]).encode()
+            return response
+
+    def test_iter_epd_data_walks_every_page(self, EC3_lookup):
+        epds = [{"name": f"EPD {i}"} for i in range(5)]
+        session = self.FakeSession(epds)
+        client = EC3_lookup.EC3Client("token", session=session)
+        url = EC3_lookup.generate_url("InsulatingGlazingUnits")
+        assert list(client.iter_epd_data(url, page_size=2)) == epds
+        assert len(session.requested_urls) == 3
+        assert session.headers["Authorization"] == "Bearer token"
+
+    def test_pages_of_a_walk_are_cached_together(self, EC3_lookup, tmp_path):
+        epds = [{"name": f"EPD {i}", "date_validity_ends": f"{2030 + i}-01-01"} for i in range(5)]
+        session = self.FakeSession(epds)
+        cache = EPDCache(cache_dir=str(tmp_path))
+        client = EC3_lookup.EC3Client("token", cache=cache, session=session)
+        url = EC3_lookup.generate_url("InsulatingGlazingUnits")
+        assert list(client.iter_epd_data(url, page_size=2)) == epds
+        # one entry with one expiry for the three pages, answering walks of any page size
+        assert len(session.requested_urls) == 3 and len(cache.entries()) == 1
+        assert list(client.iter_epd_data(url, page_size=3)) == epds
+        assert len(session.requested_urls) == 3
+
+        # a walk stopped before its last page stores nothing
+        cache.clear()
+        walk = client.iter_epd_data(url, page_size=2)
+        next(walk)
+        walk.close()
+        assert cache.entries() == [] and not list(tmp_path.rglob("*.tmp"))
+
+    def test_failed_page_fails_the_whole_query(self, EC3_lookup, tmp_path, monkeypatch):
+        import requests
+
+        class FailingSession(self.FakeSession):
+            def get(self, url, timeout=None, verify=True):
+                if "page_number=2" in url:
+                    raise requests.ConnectionError("connection reset")
+                return super().get(url, timeout, verify)
+
+        # more EPDs than fit on the first page
+        epds = [{"name": f"EPD {i}", "declared_unit": "1 m2", "thickness": "10 mm", "gwp": "30 kgCO2e"} for i in range(300)]
+        cache = EPDCache(cache_dir=str(tmp_path))
+        client = EC3_lookup.EC3Client("token", cache=cache, session=FailingSession(epds))
+        url = EC3_lookup.generate_url("InsulatingGlazingUnits")
+        with pytest.raises(EC3_lookup.IncompleteQueryError):
+            list(client.iter_epd_data(url))
+        assert cache.entries() == []
+
+        # the measure counts the query as having no EPDs and does not keep its summary
+        monkeypatch.setattr(WindowEnhancement, "gwp_summaries", None)
+        gwp_by_unit, messages, _ = WindowEnhancement().lookup_gwp_values(client, "InsulatingGlazingUnits", None, None, "Product",
+                                                                          "median", source="api", max_age=3600)
+        assert gwp_by_unit["gwp_per_m3"] is None
+        assert any("failed" in message for message in messages)
+        assert len(WindowEnhancement.summary_memo()) == 0
+
+    def test_empty_results_are_cached(self, EC3_lookup, tmp_path):
+        session = self.FakeSession([])
+        client = EC3_lookup.EC3Client("token", cache=EPDCache(cache_dir=str(tmp_path)), session=session)
+        url = EC3_lookup.generate_url("InsulatingGlazingUnits")
+        assert client.fetch_epd_data(url) == [] and client.fetch_epd_data(url) == []
+        assert len(session.requested_urls) == 1
+
+    def test_fetch_many_runs_queries_concurrently(self, EC3_lookup):
+        class SlowSession(self.FakeSession):
+            def get(self, url, timeout=None, verify=True):
+                time.sleep(0.2)
+                return super().get(url, timeout, verify)
+
+        client = EC3_lookup.EC3Client("token", session=SlowSession([{"name": "EPD"}]), max_workers=4)
+        urls = [EC3_lookup.generate_url(name) for name in ["InsulatingGlazingUnits", "AluminiumExtrusions", "FlatGlassPanes", "Brick"]]
+        start = time.perf_counter()
+        results = client.fetch_many(urls)
+        assert time.perf_counter() - start < 0.6
+        assert all(results[url] == [{"name": "EPD"}] for url in urls)
+
+    def test_identical_concurrent_queries_share_one_request(self, EC3_lookup, tmp_path):
+        from concurrent.futures import ThreadPoolExecutor
+        requested_urls = []
+
+        class SlowSession(self.FakeSession):
+            def get(self, url, timeout=None, verify=True):
+                time.sleep(0.3)
+                return super().get(url, timeout, verify)
+
+        def run(_):
+            # one client and cache per job, as separate measure runs on one node would have
+            session = SlowSession([{"name": "EPD"}])
+            session.requested_urls = requested_urls
+            client = EC3_lookup.EC3Client("token", cache=EPDCache(cache_dir=str(tmp_path)), session=session)
+            return client.fetch_epd_data(EC3_lookup.generate_url("InsulatingGlazingUnits"))
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(run, range(6)))
+        assert results == [[{"name": "EPD"}]] * 6
+        assert len(requested_urls) == 1
+
+    def test_parse_quantity_canonical_units(self):
+        from resources import EC3_lookup
+        assert EC3_lookup.parse_quantity("1 t") == (1000.0, "kg")
+        assert EC3_lookup.parse_quantity("2400 kg / m3") == (2400.0, "kg/m3")
+        assert EC3_lookup.parse_quantity("6 mm") == pytest.approx((0.006, "m"))
+        assert EC3_lookup.parse_quantity("10 sf")[0] == pytest.approx(0.9290304)
+        assert EC3_lookup.parse_quantity("1,000 kg") == (1000.0, "kg")
+        assert EC3_lookup.parse_quantity("1,234.5 kgCO2e") == (1234.5, "kgCO2e")
+        assert EC3_lookup.extract_numeric_value("2,400 kg / m3") == 2400.0
+        # a bare ton is the US short ton, the metric one is spelled t, tonne or metric ton
+        assert EC3_lookup.parse_quantity("1 ton")[0] == pytest.approx(907.18474)
+        assert EC3_lookup.parse_quantity("1 metric ton") == (1000.0, "kg")
+        assert EC3_lookup.parse_quantity(None) == (None, "")
+        # substrings of other units are not mistaken for tonnes or square feet
+        assert EC3_lookup.parse_quantity("1 unit") == (1.0, "unit")
+        assert EC3_lookup.product_gwp_values({"declared_unit": "1 unit", "gwp": "30 kgCO2e", "mass_per_declared_unit": "10 kg"}) == (3.0, None, None)
+
+    def test_summaries_skip_missing_values(self):
+        from resources import EC3_lookup
+        epds = [
+            {"name": "A", "declared_unit": "1 m2", "thickness": "20 mm", "gwp": "30 kgCO2e", "gwp_per_kg": "2 kgCO2e",
+             "manufacturer": {"original_ec3_link": "link A"}},
+            {"name": "B", "declared_unit": "1 m2", "thickness": "10 mm", "gwp": "50 kgCO2e",
+             "manufacturer": {"original_ec3_link": "link B"}},
+            {"name": "C", "declared_unit": "1 kg", "gwp": "4 kgCO2e", "manufacturer": {"original_ec3_link": "link C"}},
+        ]
+        summaries = {functional_unit: statistics.summary() for functional_unit, statistics in EC3_lookup.summarize_epds(epds, "Product").items()}
+        assert summaries["gwp_per_m3"]["count"] == 2 and summaries["gwp_per_kg"]["count"] == 2
+        assert summaries["gwp_per_m3"]["minimum"] == pytest.approx(1500.0)
+        assert summaries["gwp_per_m3"]["median"] == pytest.approx(3250.0)
+        assert summaries["gwp_per_kg"]["mean"] == pytest.approx(3.0)
+        assert EC3_lookup.summarize_epds([], "Industry")["gwp_per_m3"].summary()["mean"] is None
+
+    def test_streaming_statistics_match_numpy(self):
+        import numpy as np
+        from resources.gwp_statistics import GWPStatistics
+        values = [float(value) for value in np.random.default_rng(0).normal(100.0, 20.0, 999)]
+        statistics = GWPStatistics(values + [None, float("nan")])
+        summary = statistics.summary()
+        assert summary["count"] == 999
+        assert summary["median"] == pytest.approx(np.median(values))
+        assert summary["mean"] == pytest.approx(np.mean(values))
+        assert summary["std"] == pytest.approx(np.std(values))
+        assert summary["p10"] == pytest.approx(np.percentile(values, 10))
+        assert (summary["minimum"], summary["maximum"]) == (min(values), max(values))
+        assert GWPStatistics().summary()["median"] is None
+
+    def test_summaries_are_reused_across_statistics(self, tmp_path, monkeypatch):
+        from resources import EC3_lookup
+        epds = [{"name": f"IGU {i}", "declared_unit": "1 m2", "thickness": "10 mm", "gwp": f"{10 * (i + 1)} kgCO2e"} for i in range(5)]
+        snapshot_path = tmp_path / "ec3_snapshot.sqlite"
+        write_snapshot(str(snapshot_path), {url: epds for url in window_query_urls(epd_types=["Product"])})
+        fetched_urls = []
+        fetch_epd_data = EPDSnapshot.fetch_epd_data
+        monkeypatch.setattr(EPDSnapshot, "fetch_epd_data", lambda self, url, cache=None: fetched_urls.append(url) or fetch_epd_data(self, url))
+        monkeypatch.setattr(WindowEnhancement, "gwp_summaries", None)
+
+        query = [("Glazing", "InsulatingGlazingUnits", "low_emissivity", 2)]
+        (median, _, _), = WindowEnhancement().lookup_epd_queries(query, "Product", "median", str(snapshot_path))
+        (maximum, _, _), = WindowEnhancement().lookup_epd_queries(query, "Product", "maximum", str(snapshot_path))
+        assert median["gwp_per_m2"] == pytest.approx(30.0) and maximum["gwp_per_m2"] == pytest.approx(50.0)
+        assert len(fetched_urls) == 1
+        assert EC3_lookup.summarize_epds(epds)["gwp_per_m3"].summary()["p90"] == pytest.approx(4600.0)
+
+    def test_client_retries_throttled_requests(self, EC3_lookup):
+        with EC3_lookup.EC3Client("token", max_retries=4) as client:
+            retry = client.session.get_adapter("https://api.buildingtransparency.org").max_retries
+            assert retry.total == 4
+            assert 429 in retry.status_forcelist and 503 in retry.status_forcelist
+            assert client.timeout == (5.0, 60.0)
+
+    def test_profiler_phases_are_exclusive(self):
+        profiler = Profiler()
+        with profiler.phase("outer"):
+            time.sleep(0.02)
+            with profiler.phase("inner"):
+                time.sleep(0.05)
+        profiler.count("requests")
+        profiler.count("bytes_downloaded", 100)
+        profiler.stop()
+        summary = profiler.summary()
+        assert 0.02 <= summary["phases"]["outer"]["seconds"] < 0.05
+        assert summary["phases"]["inner"]["seconds"] >= 0.05
+        assert summary["counters"] == {"requests": 1, "bytes_downloaded": 100}
+        assert summary["wall_seconds"] >= 0.07
+
+    def test_profiler_leaves_outer_tracing_running(self):
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            profiler = Profiler("tracemalloc").start()
+            profiler.stop()
+            assert tracemalloc.is_tracing() and "peak_memory_mb" in profiler.summary()
+        finally:
+            tracemalloc.stop()
+        profiler = Profiler("tracemalloc").start()
+        profiler.stop()
+        assert not tracemalloc.is_tracing()
+
+class TestMockEC3Server:
+    """Py.test module for the local EC3 stand-in, no token or network needed."""
+
+    @pytest.fixture
+    def epds(self):
+        return synthetic_window_epds(200)
+
+    def test_parse_filter_of_generated_url(self):
+        from resources import EC3_lookup
+        url = EC3_lookup.generate_url("InsulatingGlazingUnits", option="low_emissivity", glass_panes=2, date="2025-04-18")
+        search = parse_filter(dict(parse_qsl(url.split("?", 1)[1]))["mf"])
+        assert search["material_name"] == "InsulatingGlazingUnits"
+        assert search["conditions"] == [("jurisdiction", "IN", ["021"]), ("epd__date_validity_ends", ">", "2025-04-18"),
+                                        ("epd_types", "IN", ["Product EPDs"]), ("low_emissivity", "=", True), ("glass_panes", ">~", 2.0)]
+
+    def test_client_walks_filtered_pages(self, EC3_lookup, epds, monkeypatch):
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            url = EC3_lookup.generate_url("InsulatingGlazingUnits", option="tempered", glass_panes=3)
+            with EC3_lookup.EC3Client("token") as client:
+                fetched = list(client.iter_epd_data(url, page_size=10))
+            conditions = parse_filter(dict(parse_qsl(url.split("?", 1)[1]))["mf"])["conditions"]
+            expected = [epd for epd in epds["InsulatingGlazingUnits"] if epd["epd_type"] == "Product" and matches(epd, conditions)]
+            assert fetched == expected and len(expected) > 10
+            assert all(epd["tempered"] and epd["glass_panes"] == 3 for epd in fetched)
+            assert server.request_count == len(expected) // 10 + 1
+
+    def test_client_retries_throttled_requests(self, EC3_lookup, epds, monkeypatch):
+        with MockEC3Server(epds, latency=0.05, rate_limit=2) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            urls = [EC3_lookup.generate_url("InsulatingGlazingUnits", option=option) for option in WindowEnhancement.igu_options()[:4]]
+            with EC3_lookup.EC3Client("token", max_workers=4, max_retries=5) as client:
+                results = client.fetch_many(urls)
+            assert all(results[url] for url in urls)
+            assert server.throttled_count > 0
+
+    def test_requests_without_token_are_rejected(self, EC3_lookup, epds, monkeypatch):
+        import requests
+
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            response = requests.get(EC3_lookup.generate_url("AluminiumExtrusions"), timeout=5)
+            assert response.status_code == 401
+
+    def test_planner_merges_option_and_pane_variants(self, EC3_lookup, epds, monkeypatch):
+        monkeypatch.setattr(QueryPlanner, "unpartitionable", set())
+        queries = window_queries({"InsulatingGlazingUnits": {"options": ["low_emissivity", "tempered"], "glass_panes": [1, 2, 3]},
+                                  "AluminiumExtrusions": {"options": [None], "glass_panes": [None]}}, epd_types=["Product"])
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            with EC3_lookup.EC3Client("token") as client:
+                expected = {query: client.fetch_epd_data(QueryPlanner(client, []).url(query)) for query in queries}
+            assert server.request_count == len(queries)
+            with QueryPlanner(EC3_lookup.EC3Client("token"), queries) as planner:
+                fetched = planner.fetch_many([planner.url(query) for query in queries])
+            # one IGU query covering both options and every pane count, one frame query
+            assert server.request_count == len(queries) + 2
+        assert [fetched[planner.url(query)] for query in queries] == [expected[query] for query in queries]
+        assert planner.profiler.counters["merged_queries"] == len(queries) - 1
+        # the EPDs of each query are released once handed out
+        assert not any(planner.partitions.values())
+
+    def test_planner_is_opt_in_and_reads_flags_strictly(self, monkeypatch):
+        monkeypatch.delenv("EC3_MERGE_QUERIES", raising=False)
+        assert not merging_enabled()
+        monkeypatch.setenv("EC3_MERGE_QUERIES", "1")
+        assert merging_enabled()
+
+        covering = ("InsulatingGlazingUnits", None, 1, "Product")
+        query = ("InsulatingGlazingUnits", "low_emissivity", 2, "Product")
+        assert belongs_to({"low_emissivity": True, "glass_panes": 2}, query, covering)
+        assert belongs_to({"low_emissivity": "yes", "glass_panes": 3}, query, covering)
+        assert belongs_to({"low_emissivity": "no", "glass_panes": 2}, query, covering) is False
+        assert belongs_to({"low_emissivity": True, "glass_panes": 1}, query, covering) is False
+        # values read neither as set nor as unset leave the split to the client
+        assert belongs_to({"low_emissivity": "false", "glass_panes": 2}, query, covering) is None
+        assert belongs_to({"low_emissivity": True, "glass_panes": "2"}, query, covering) is None
+
+    def test_planner_falls_back_without_partition_fields(self, EC3_lookup, epds, monkeypatch):
+        monkeypatch.setattr(QueryPlanner, "unpartitionable", set())
+        for epd in epds["InsulatingGlazingUnits"]:
+            del epd["glass_panes"]
+        queries = [("InsulatingGlazingUnits", "low_emissivity", panes, "Product") for panes in [1, 2]]
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            with QueryPlanner(EC3_lookup.EC3Client("token"), queries) as planner:
+                assert all(planner.fetch_epd_data(planner.url(query)) for query in queries)
+            # the first page of the covering query, then each query on its own
+            assert server.request_count == 3
+            assert planner.profiler.counters["unpartitioned_queries"] == 1
+
+            # a later planner does not try the covering query again
+            with QueryPlanner(EC3_lookup.EC3Client("token"), queries) as planner:
+                assert not planner.groups
+                assert all(planner.fetch_epd_data(planner.url(query)) for query in queries)
+            assert server.request_count == 5
+        QueryPlanner.clear_unpartitionable()
+        assert QueryPlanner(EC3_lookup.EC3Client("token"), queries).groups
+
+    def test_prefetch_warms_the_measure_queries(self, EC3_lookup, epds, tmp_path, monkeypatch):
+        categories = {"openings": EC3_lookup.EC3_CATEGORIES["openings"]}
+        assert EC3_lookup.category_material_names(categories)["openings"] == [
+            "InsulatingGlazingUnits", "FlatGlassPanes", "ProcessedNonInsulatingGlassPanes", "AluminiumExtrusions"]
+        cache = EPDCache(str(tmp_path / "cache"))
+        monkeypatch.setenv("EC3_MERGE_QUERIES", "1")
+        monkeypatch.setattr(QueryPlanner, "unpartitionable", set())
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            with EC3_lookup.EC3Client("token", cache=cache) as client:
+                epd_data = EC3_lookup.prefetch(client, categories, ["Product"])
+            prefetch_requests = server.request_count
+            # one request per category query and one covering request for the glazing variants,
+            # the frame query is the aluminum category query already cached
+            assert prefetch_requests == 4 + 1
+            url = EC3_lookup.generate_url("InsulatingGlazingUnits", option="low_emissivity", glass_panes=2)
+            with EC3_lookup.EC3Client("token", cache=cache) as client:
+                assert list(client.iter_epd_data(url)) == epd_data[url] != []
+            assert server.request_count == prefetch_requests
+
+    def test_run_against_server(self, epds, tmp_path, monkeypatch):
+        """Test running the measure through the live EC3 client path against the stand-in."""
+        pytest.importorskip("requests")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("EC3_CACHE_DIR", str(tmp_path / "cache"))
+        model_path = Path(CURRENT_DIR_PATH / "example_model.osm").absolute()
+        model = openstudio.osversion.VersionTranslator().loadModel(openstudio.toPath(str(model_path))).get()
+        runner = openstudio.measure.OSRunner(openstudio.WorkflowJSON())
+        measure = WindowEnhancement()
+        argument_map = make_argument_map(measure, model, igu_option="low_emissivity", wf_option="anodized",
+                                         gwp_statistic="median", epd_type="Product", api_key="token")
+
+        with MockEC3Server(epds) as server:
+            monkeypatch.setenv("EC3_API_URL", server.url)
+            measure.run(model, runner, argument_map)
+            assert server.request_count > 0
+        assert runner.result().value().valueName() == "Success"
+        step_values = {value.name(): value for value in runner.result().stepValues()}
+        assert step_values["window_embodied_carbon"].valueAsDouble() > 0
+
+        del model
+        gc.collect()
+
 if __name__ == "__main__":
     pytest.main()